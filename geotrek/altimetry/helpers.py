@@ -1,8 +1,12 @@
+import json
 import logging
+import math
+import struct
+import sys
+from array import array
 
-from django.contrib.gis.geos import GEOSGeometry
+from django.contrib.gis.geos import Polygon
 from django.utils.translation import ugettext_lazy as _
-from django.contrib.gis.geos import LineString
 from django.conf import settings
 from django.db import connection
 
@@ -15,6 +19,40 @@ from geotrek.common.utils import sampling
 logger = logging.getLogger(__name__)
 
 
+DEM_BINARY_CONTENT_TYPE = 'application/x-geotrek-dem'
+DEM_BINARY_MAGIC = 'GTD1'
+
+# Struct formats of WKB raster pixel types
+RASTER_PIXEL_TYPES = {
+    0: 'B',  # 1BB
+    1: 'B',  # 2BUI
+    2: 'B',  # 4BUI
+    3: 'b',  # 8BSI
+    4: 'B',  # 8BUI
+    5: 'h',  # 16BSI
+    6: 'H',  # 16BUI
+    7: 'i',  # 32BSI
+    8: 'I',  # 32BUI
+    10: 'f',  # 32BF
+    11: 'd',  # 64BF
+}
+
+# Same computation as elevation_troncon_iu() trigger.
+# (OFFSET 0 prevents from calling ft_elevation_infos() once per column)
+REDRAPE_SQL = """
+    UPDATE {table} t SET geom_3d = (d.elevation).draped,
+                         longueur = ST_3DLength((d.elevation).draped),
+                         pente = (d.elevation).slope,
+                         altitude_minimum = (d.elevation).min_elevation,
+                         altitude_maximum = (d.elevation).max_elevation,
+                         denivelee_positive = (d.elevation).positive_gain,
+                         denivelee_negative = (d.elevation).negative_gain
+    FROM (SELECT id, ft_elevation_infos(geom) AS elevation
+          FROM {table} WHERE id = ANY(%s) OFFSET 0) AS d
+    WHERE t.id = d.id
+"""
+
+
 class AltimetryHelper(object):
     @classmethod
     def elevation_profile(cls, geometry3d, precision=None, offset=0):
@@ -24,32 +62,25 @@ class AltimetryHelper(object):
         """
         precision = precision or settings.ALTIMETRIC_PROFILE_PRECISION
 
-        if geometry3d.geom_type == 'MultiLineString':
-            profile = []
-            for subcoords in geometry3d.coords:
-                subline = LineString(subcoords, srid=geometry3d.srid)
-                offset += subline.length
-                subprofile = AltimetryHelper.elevation_profile(subline, precision, offset)
-                profile.extend(subprofile)
-            return profile
-
-
-        # Add measure to 2D version of geometry3d
-        # Get distance from origin for each vertex
-        sql = """
-        WITH line2d AS (SELECT ST_force_2D('%(ewkt)s'::geometry) AS geom),
-             line_measure AS (SELECT ST_Addmeasure(geom, 0, ST_length(geom)) AS geom FROM line2d),
-             points2dm AS (SELECT (ST_DumpPoints(geom)).geom AS point FROM line_measure)
-        SELECT (%(offset)s + ST_M(point)) FROM points2dm;
-        """ % {'offset': offset, 'ewkt': geometry3d.ewkt}
-        cursor = connection.cursor()
-        cursor.execute(sql)
-        pointsm = cursor.fetchall()
-        # Join (offset+distance, x, y, z) together
+        # Coordinates in API_SRID are obtained with a single transformation
         geom3dapi = geometry3d.transform(settings.API_SRID, clone=True)
-        assert len(pointsm) == len(geom3dapi.coords), 'Cannot map distance to xyz'
-        dxyz = [pointsm[i] + v for i, v in enumerate(geom3dapi.coords)]
-        return dxyz
+        multi = geometry3d.geom_type == 'MultiLineString'
+        if multi:
+            parts, parts_api = geometry3d.coords, geom3dapi.coords
+        else:
+            parts, parts_api = [geometry3d.coords], [geom3dapi.coords]
+
+        profile = []
+        for coords, coords_api in zip(parts, parts_api):
+            # Distance from origin for each vertex (2D, like ST_AddMeasure)
+            distances = [0.0]
+            for (x1, y1), (x2, y2) in zip([c[:2] for c in coords[:-1]], [c[:2] for c in coords[1:]]):
+                distances.append(distances[-1] + math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2))
+            if multi:
+                offset += distances[-1]
+            # Join (offset+distance, x, y, z) together
+            profile.extend([(offset + d,) + v for d, v in zip(distances, coords_api)])
+        return profile
 
     @classmethod
     def profile_svg(cls, profile):
@@ -126,6 +157,29 @@ class AltimetryHelper(object):
                                   int(ycenter + height / 2.0))
         return (xmin, ymin, xmax, ymax)
 
+    @classmethod
+    def _decode_raster(cls, wkb):
+        """Decode the first band of a raster in WKB format (see ``ST_AsBinary()``).
+
+        Returns ``(upperleft x, upperleft y, scale x, scale y, width, values)``,
+        where values are listed row by row from the top, and ``None`` if no data.
+        """
+        endian = '<' if struct.unpack_from('B', wkb)[0] == 1 else '>'
+        header = endian + 'BHH6diHH'
+        (_, _, nbands, scalex, scaley, ulx, uly, _, _, _,
+         width, height) = struct.unpack_from(header, wkb)
+        offset = struct.calcsize(header)
+        if nbands == 0:
+            return ulx, uly, scalex, scaley, width, [None] * (width * height)
+        flags = struct.unpack_from('B', wkb, offset)[0]
+        pixtype = RASTER_PIXEL_TYPES[flags & 0x0F]
+        nodata = struct.unpack_from(endian + pixtype, wkb, offset + 1)[0]
+        offset += 1 + struct.calcsize(pixtype)
+        values = list(struct.unpack_from('%s%s%s' % (endian, width * height, pixtype), wkb, offset))
+        if flags & 0x40:  # Has nodata value
+            values = [None if v == nodata else v for v in values]
+        return ulx, uly, scalex, scaley, width, values
+
     @classmethod
     def elevation_area(cls, geom):
         xmin, ymin, xmax, ymax = cls._nice_extent(geom)
@@ -144,69 +198,59 @@ class AltimetryHelper(object):
             logger.warn("No DEM present")
             return {}
 
+        # Altitudes are sampled on a grid, from south-west to north-east
+        columns = range(xmin, xmax + 1, precision)
+        lines = range(ymin, ymax + 1, precision)
+        resolution_w, resolution_h = len(columns), len(lines)
+
+        # Clip DEM tiles on area, and resample them once on a raster whose
+        # pixels are centered on grid points (nearest neighbour, like ST_Value)
         sql = """
-            -- Author: Celian Garcia
-            WITH columns AS (
-                    SELECT generate_series({xmin}::int, {xmax}::int, {precision}) AS x
-                ),
-                lines AS (
-                    SELECT generate_series({ymin}::int, {ymax}::int, {precision}) AS y
-                ),
-                resolution AS (
-                    SELECT x, y
-                    FROM (SELECT COUNT(x) AS x FROM columns) AS col,
-                         (SELECT COUNT(y) AS y FROM lines)   AS lin
-                ),
-                points2d AS (
-                    SELECT row_number() OVER () AS id,
-                           ST_SetSRID(ST_MakePoint(x, y), {srid}) AS geom,
-                           ST_Transform(ST_SetSRID(ST_MakePoint(x, y), {srid}), 4326) AS geomll
-                    FROM lines, columns
-                ),
-                draped AS (
-                    SELECT id, ST_Value(mnt.rast, p.geom)::int AS altitude
-                    FROM mnt, points2d AS p
-                    WHERE ST_Intersects(mnt.rast, p.geom)
-                ),
-                all_draped AS (
-                    SELECT geomll, geom, altitude
-                    FROM points2d LEFT JOIN draped ON (points2d.id = draped.id)
-                    ORDER BY points2d.id
-                ),
-                extent_latlng AS (
-                    SELECT ST_Envelope(ST_Union(geom)) AS extent,
-                           MIN(altitude) AS min_z,
-                           MAX(altitude) AS max_z,
-                           AVG(altitude) AS center_z
-                    FROM all_draped
-                )
-            SELECT extent,
-                   ST_transform(extent, 4326),
-                   center_z,
-                   min_z,
-                   max_z,
-                   resolution.x AS resolution_w,
-                   resolution.y AS resolution_h,
-                   altitude
-            FROM extent_latlng, resolution, all_draped;
-        """.format(xmin=xmin, ymin=ymin, xmax=xmax, ymax=ymax,
-                   srid=settings.SRID, precision=precision)
-        cursor.execute(sql)
-        result = cursor.fetchall()
-        first = result[0]
-        envelop_native, envelop, center_z, min_z, max_z, resolution_w, resolution_h, a = first
-        envelop = GEOSGeometry(envelop, srid=4326)
-        envelop_native = GEOSGeometry(envelop_native, srid=settings.SRID)
-
-        altitudes = []
-        row = []
-        for i, record in enumerate(result):
-            if i > 0 and i % resolution_w == 0:
-                altitudes.append(row)
-                row = []
-            elevation = (record[7] or 0.0) - min_z
-            row.append(elevation)
-        altitudes.append(row)
+            WITH grid AS (
+                SELECT ST_MakeEmptyRaster(%(width)s, %(height)s, %(ulx)s, %(uly)s,
+                                          %(step)s, -%(step)s, 0, 0, %(srid)s) AS rast
+            ),
+            clipped AS (
+                SELECT ST_Union(ST_Clip(mnt.rast,
+                                        ST_Expand(ST_Envelope(grid.rast),
+                                                  GREATEST(ABS(ST_ScaleX(mnt.rast)),
+                                                           ABS(ST_ScaleY(mnt.rast)))))) AS rast
+                FROM mnt, grid
+                WHERE ST_Intersects(mnt.rast, ST_Envelope(grid.rast))
+            )
+            SELECT ST_AsBinary(ST_Resample(clipped.rast, grid.rast))
+            FROM clipped, grid
+            WHERE clipped.rast IS NOT NULL;
+        """
+        cursor.execute(sql, {'width': resolution_w, 'height': resolution_h,
+                             'ulx': xmin - precision / 2.0,
+                             'uly': lines[-1] + precision / 2.0,
+                             'step': precision, 'srid': settings.SRID})
+        result = cursor.fetchone()
+
+        grid = [[None] * resolution_w for y in lines]
+        if result is not None:
+            ulx, uly, scalex, scaley, rwidth, values = cls._decode_raster(str(result[0]))
+            for i, value in enumerate(values):
+                if value is None:
+                    continue
+                # Position of pixel center on grid
+                col = int(round((ulx + (i % rwidth + 0.5) * scalex - xmin) / precision))
+                row = int(round((uly + (i // rwidth + 0.5) * scaley - ymin) / precision))
+                if 0 <= col < resolution_w and 0 <= row < resolution_h:
+                    grid[row][col] = int(round(value))
+
+        sampled = [value for row in grid for value in row if value is not None]
+        if sampled:
+            min_z, max_z = min(sampled), max(sampled)
+            center_z = float(sum(sampled)) / len(sampled)
+        else:
+            min_z = max_z = center_z = 0
+        altitudes = [[(value or 0.0) - min_z for value in row] for row in grid]
+
+        envelop_native = Polygon.from_bbox((xmin, ymin, columns[-1], lines[-1]))
+        envelop_native.srid = settings.SRID
+        envelop = envelop_native.transform(4326, clone=True)
 
         area = {
             'center': {
@@ -252,3 +296,20 @@ class AltimetryHelper(object):
             'altitudes': altitudes
         }
         return area
+
+    @classmethod
+    def pack_area(cls, area):
+        """
+        Compact binary encoding of elevation area (see ``elevation_area()``).
+
+        Little-endian, altitudes listed row by row as in JSON::
+
+            'GTD1' | uint32 L | JSON of area without altitudes (L bytes) | int16 altitudes[resolution y * resolution x]
+        """
+        metadata = dict(area)
+        altitudes = array('h', [int(v) for row in metadata.pop('altitudes', []) for v in row])
+        if sys.byteorder == 'big':
+            altitudes.byteswap()
+        metadata = json.dumps(metadata)
+        header = struct.pack('<4sI', DEM_BINARY_MAGIC, len(metadata))
+        return header + metadata + altitudes.tostring()
@@ -3,8 +3,35 @@ from django.db import connection, transaction
 from django.conf import settings
 from optparse import make_option
 import os.path
-from subprocess import call
+from subprocess import call, Popen, PIPE
 import tempfile
+import time
+
+
+class CopyStream(object):
+    """
+    File-like object, giving COPY data of raster2pgsql output lines
+    until the end-of-data marker. Read by ``cursor.copy_expert()``.
+    """
+    def __init__(self, lines):
+        self.lines = lines
+        self.rows = 0
+        self.size = 0
+        self.done = False
+
+    def read(self, size=-1):
+        # One row per read is enough (rows are whole tiles)
+        if not self.done:
+            for line in self.lines:
+                if line.rstrip('\r\n') == '\\.':
+                    break
+                self.rows += 1
+                self.size += len(line)
+                return line
+            self.done = True
+        return ''
+
+    readline = read
 
 
 class Command(BaseCommand):
@@ -19,6 +46,12 @@ class Command(BaseCommand):
                     action='store_true',
                     default=False,
                     help='Replace existing DEM if any.'),
+        make_option('--tile-size',
+                    default='100x100',
+                    help='Size of DEM tiles in pixels, as WIDTHxHEIGHT (default: 100x100).'),
+        make_option('--overviews',
+                    default=None,
+                    help='Also create overviews of DEM, for these comma-separated factors (e.g. 2,4).'),
     )
 
     def handle(self, *args, **options):
@@ -107,14 +140,9 @@ class Command(BaseCommand):
         # Obtain replace mode
         replace = options['replace']
 
-        # What to do with existing DEM (if any)
-        if dem_exists and replace:
-            # Drop table
-            cur = connection.cursor()
-            sql = 'DROP TABLE mnt'
-            cur.execute(sql)
-            cur.close()
-        elif dem_exists and not replace:
+        # What to do with existing DEM (if any): it is dropped in the
+        # transaction loading the new one
+        if dem_exists and not replace:
             raise CommandError('DEM file exists, use --replace to overwrite')
 
         self.stdout.write('Everything looks fine, we can start loading DEM\n')
@@ -144,30 +172,85 @@ class Command(BaseCommand):
             raise CommandError(msg)
         self.stdout.write('DEM successfully clipped/projected.\n')
 
-        # Step 2: Convert to PostGISRaster format
-        output = tempfile.NamedTemporaryFile()  # SQL code for raster creation
-        cmd = 'raster2pgsql -c -C -I -M -t 100x100 %s mnt' % new_dem.name
+        # Step 2: Convert to PostGISRaster format, and stream it into database
+        # (tiles are sent with COPY statements)
+        cmd = 'raster2pgsql -c -C -I -M -Y -t %s' % options['tile_size']
+        if options.get('overviews'):
+            cmd += ' -l %s' % options['overviews']
+        cmd += ' %s mnt' % new_dem.name
         try:
             self.stdout.write('\n-- Relaying to raster2pgsql ------------\n')
             self.stdout.write(cmd)
-            ret = call(cmd, stdout=output.file, shell=True)
-            if ret != 0:
-                raise Exception('raster2pgsql failed with exit code %d' % ret)
+            self.stdout.write('\n-- Loading DEM into database -----------\n')
+            process = Popen(cmd, stdout=PIPE, shell=True)
+            maintenance = self.load(process, drop=dem_exists)
+            # VACUUM can not run inside a transaction
+            cur = connection.cursor()
+            for statement in maintenance:
+                cur.execute(statement)
+            cur.close()
         except Exception as e:
-            output.close()
             msg = 'Caught %s: %s' % (e.__class__.__name__, e,)
             raise CommandError(msg)
         finally:
             new_dem.close()
-        self.stdout.write('DEM successfully converted to SQL.\n')
+        self.stdout.write('DEM successfully loaded.\n')
+        return
+
+    def load(self, process, drop=False):
+        """
+        Load raster2pgsql output in a single transaction, dropping the existing
+        DEM first if asked. If raster2pgsql fails, its output may be truncated:
+        the transaction is rolled back.
+        Returns the maintenance statements, to be run once committed.
+        """
+        with transaction.atomic():
+            if drop:
+                self.drop_dem()
+            try:
+                maintenance = self.load_sql(iter(process.stdout.readline, ''))
+            finally:
+                process.stdout.close()
+                ret = process.wait()
+            if ret != 0:
+                raise Exception('raster2pgsql failed with exit code %d' % ret)
+        return maintenance
 
-        # Step 3: Dump SQL code into database
-        self.stdout.write('\n-- Loading DEM into database -----------\n')
+    def drop_dem(self):
+        """
+        Drop DEM table, and its overviews.
+        """
         cur = connection.cursor()
-        output.file.seek(0)
-        for sql_line in output.file:
-            cur.execute(sql_line)
+        cur.execute('SELECT o_table_name FROM raster_overviews WHERE r_table_name = \'mnt\'')
+        for overview, in cur.fetchall():
+            cur.execute('DROP TABLE %s' % connection.ops.quote_name(overview))
+        cur.execute('DROP TABLE mnt')
         cur.close()
-        output.close()
-        self.stdout.write('DEM successfully loaded.\n')
-        return
+
+    def load_sql(self, lines):
+        """
+        Execute raster2pgsql output, and copy tiles data.
+        Returns the maintenance statements, to be run once committed.
+        """
+        cur = connection.cursor()
+        maintenance = []
+        for line in lines:
+            statement = line.strip()
+            # Transaction is managed here
+            if not statement or statement in ('BEGIN;', 'END;', 'COMMIT;'):
+                continue
+            if statement.startswith('VACUUM'):
+                maintenance.append(statement)
+                continue
+            if statement.startswith('COPY '):
+                start = time.time()
+                data = CopyStream(lines)
+                cur.copy_expert(statement, data)
+                elapsed = max(time.time() - start, 0.001)
+                self.stdout.write('%s tiles loaded in %.1f s (%.1f tiles/s, %.1f MB/s)\n'
+                                  % (data.rows, elapsed, data.rows / elapsed,
+                                     data.size / elapsed / 1024 / 1024))
+            else:
+                cur.execute(statement)
+        cur.close()
+        return maintenance
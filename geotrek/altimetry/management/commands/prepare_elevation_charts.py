@@ -1,18 +1,52 @@
 import logging
+import multiprocessing
+import time
+from optparse import make_option
 
 from django.core.urlresolvers import NoReverseMatch
+from django.db import connection, models
 
+from mapentity.helpers import is_file_newer
 from mapentity.management.commands.prepare_map_images import Command as PrepareImageCommand
 
 from geotrek.altimetry.models import AltimetryMixin
+from geotrek.common.models import NoDeleteMixin
 
 
 logger = logging.getLogger(__name__)
 
 
+def render_charts(args):
+    """
+    Render the elevation charts of a list of objects in-process.
+    Run in worker processes, which use their own database connection.
+    """
+    app_label, model_name, pks = args
+    model = models.get_model(app_label, model_name)
+    rendered = 0
+    for instance in model.objects.filter(pk__in=pks):
+        try:
+            if instance.render_elevation_chart():
+                rendered += 1
+        except Exception as e:
+            logger.error('Could not render %s profile: %s' % (instance.get_elevation_chart_path(), e))
+    return rendered
+
+
 class Command(PrepareImageCommand):
     help = "Generates all altimetric profiles"
 
+    # Server charts are downloaded from when CairoSVG is not available
+    DEFAULT_URL = 'http://localhost:8000'
+
+    option_list = PrepareImageCommand.option_list + (
+        make_option('--processes', type='int', dest='processes',
+                    default=multiprocessing.cpu_count(),
+                    help='Number of processes rendering charts (default: number of CPUs)'),
+        make_option('--batch-size', type='int', dest='batch_size', default=50,
+                    help='Number of charts rendered per task (default: 50)'),
+    )
+
     start_model_msg = "Generate all elevation charts model %s"
 
     def get_models(self):
@@ -31,7 +65,43 @@ class Command(PrepareImageCommand):
         return with_profiles
 
     def handle_instance(self, instance):
-        rooturl = self.options.get('url', self.DEFAULT_URL)
+        rooturl = self.options.get('url') or self.DEFAULT_URL
         refreshed = instance.prepare_elevation_chart(rooturl)
         if not refreshed:
             logger.info('%s profile up-to-date.' % instance.get_elevation_chart_path())
+
+    def handle(self, *args, **options):
+        try:
+            import cairosvg  # NOQA
+        except ImportError:
+            logger.warning('CairoSVG is not available, charts will be downloaded from %s.'
+                           % (options.get('url') or self.DEFAULT_URL))
+            return super(Command, self).handle(*args, **options)
+
+        self.options = options
+        processes = options.get('processes') or 1
+        batch_size = options.get('batch_size') or 50
+        for model in self.get_models():
+            logger.info(self.start_model_msg % model)
+            start = time.time()
+            # Only render charts older than their object, without loading objects
+            queryset = model.objects.existing() if issubclass(model, NoDeleteMixin) else model.objects.all()
+            dates = queryset.values_list('pk', 'date_update')
+            outdated = [pk for pk, date_update in dates
+                        if not is_file_newer(model.elevation_chart_path(pk), date_update)]
+            tasks = [(model._meta.app_label, model._meta.object_name, outdated[i:i + batch_size])
+                     for i in range(0, len(outdated), batch_size)]
+            if processes > 1 and len(tasks) > 1:
+                # Workers must not share the connection of this process
+                connection.close()
+                pool = multiprocessing.Pool(processes)
+                try:
+                    rendered = sum(pool.map(render_charts, tasks))
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                rendered = sum(map(render_charts, tasks))
+            self.stdout.write('%s: %s charts rendered, %s up-to-date (%.1f s)\n'
+                              % (model._meta.verbose_name_plural, rendered,
+                                 len(dates) - len(outdated), time.time() - start))
@@ -0,0 +1,99 @@
+import multiprocessing
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.contrib.gis.geos import Polygon
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from geotrek.altimetry.helpers import REDRAPE_SQL
+from geotrek.core.models import Path, Topology
+
+
+# Topologies 3D geometries are built from their paths ones
+REDRAPE_TOPOLOGIES_SQL = """
+    SELECT update_geometry_of_evenement(id) FROM e_t_evenement WHERE id = ANY(%s)
+"""
+
+
+def redrape(args):
+    """
+    Recompute altimetry of a chunk of objects, in its own transaction.
+    Run in worker processes, which use their own database connection.
+    """
+    sql, pks = args
+    with transaction.atomic():
+        cursor = connection.cursor()
+        cursor.execute(sql, [pks])
+    return len(pks)
+
+
+class Command(BaseCommand):
+    help = 'Recompute altimetry (3D geometry, length, slope, elevations) of paths\n'
+    help += 'and topologies, e.g. after loading a new DEM.\n'
+    can_import_settings = True
+
+    option_list = BaseCommand.option_list + (
+        make_option('--bbox', dest='bbox', default=None,
+                    help='Only objects within xmin,ymin,xmax,ymax (in SRID %s)' % settings.SRID),
+        make_option('--processes', type='int', dest='processes',
+                    default=multiprocessing.cpu_count(),
+                    help='Number of processes (and database connections) (default: number of CPUs)'),
+        make_option('--batch-size', type='int', dest='batch_size', default=100,
+                    help='Number of objects per transaction (default: 100)'),
+    )
+
+    def handle(self, *args, **options):
+        cursor = connection.cursor()
+        cursor.execute("SELECT * FROM raster_columns WHERE r_table_name = 'mnt'")
+        if cursor.rowcount == 0:
+            raise CommandError('No DEM present, use loaddem command first.')
+
+        paths = Path.objects.all()
+        topologies = Topology.objects.all()
+        if options.get('bbox'):
+            try:
+                bbox = Polygon.from_bbox([float(v) for v in options['bbox'].split(',')])
+            except ValueError:
+                raise CommandError('Invalid --bbox option, expected xmin,ymin,xmax,ymax')
+            bbox.srid = settings.SRID
+            paths = paths.filter(geom__bboverlaps=bbox)
+            topologies = topologies.filter(geom__bboverlaps=bbox)
+
+        if settings.TREKKING_TOPOLOGY_ENABLED:
+            topologies_sql = REDRAPE_TOPOLOGIES_SQL
+        else:
+            topologies_sql = REDRAPE_SQL.format(table=Topology._meta.db_table)
+
+        self.processes = options.get('processes') or 1
+        self.batch_size = options.get('batch_size') or 100
+        # Topologies are computed from paths: paths are redraped first
+        self.redrape(Path._meta.verbose_name_plural, REDRAPE_SQL.format(table=Path._meta.db_table),
+                     list(paths.order_by('pk').values_list('pk', flat=True)))
+        self.redrape(Topology._meta.verbose_name_plural, topologies_sql,
+                     list(topologies.order_by('pk').values_list('pk', flat=True)))
+
+    def redrape(self, name, sql, pks):
+        start = time.time()
+        count = len(pks)
+        tasks = [(sql, pks[i:i + self.batch_size]) for i in range(0, count, self.batch_size)]
+        if self.processes > 1 and len(tasks) > 1:
+            # Workers must not share the connection of this process
+            connection.close()
+            pool = multiprocessing.Pool(self.processes)
+            results = pool.imap_unordered(redrape, tasks)
+        else:
+            pool = None
+            results = (redrape(task) for task in tasks)
+        try:
+            done = 0
+            for redraped in results:
+                done += redraped
+                elapsed = time.time() - start
+                self.stdout.write('%s/%s %s redraped (%.1f objects/s)'
+                                  % (done, count, name, done / max(elapsed, 0.001)))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
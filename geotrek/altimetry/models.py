@@ -1,13 +1,24 @@
+import hashlib
+import json
+import logging
 import os
 
 from django.conf import settings
 from django.contrib.gis.db import models
+from django.core.cache import get_cache
+from django.core.urlresolvers import NoReverseMatch
+from django.db.models.signals import class_prepared, post_save
+from django.dispatch import receiver
+from django.utils import translation
 from django.utils.translation import ugettext_lazy as _
 
 from mapentity.helpers import is_file_newer, convertit_download, smart_urljoin
 from .helpers import AltimetryHelper
 
 
+logger = logging.getLogger(__name__)
+
+
 class AltimetryMixin(models.Model):
     # Computed values (managed at DB-level with triggers)
     geom_3d = models.GeometryField(dim=3, srid=settings.SRID, spatial_index=False,
@@ -45,7 +56,60 @@ class AltimetryMixin(models.Model):
         return AltimetryHelper.elevation_area(self.geom)
 
     def get_elevation_profile_svg(self):
-        return AltimetryHelper.profile_svg(self.get_elevation_profile())
+        return self.get_cached_elevation('svg')[1]
+
+    def render_elevation(self, name):
+        """Render elevation profile as JSON (``profile``) or SVG chart (``svg``),
+        or elevation area as JSON (``area``) or binary (``area_binary``).
+        """
+        if name == 'profile':
+            # Formatted as distance, elevation, [lng, lat]
+            profile = [(step[0], step[3], step[1:3]) for step in self.get_elevation_profile()]
+            return json.dumps({'profile': profile})
+        if name == 'area':
+            return json.dumps(self.get_elevation_area())
+        if name == 'area_binary':
+            return AltimetryHelper.pack_area(self.get_elevation_area())
+        profile = self.get_elevation_profile()
+        return AltimetryHelper.profile_svg(profile)
+
+    @classmethod
+    def get_elevation_cache_key(cls, pk, date_update, name):
+        """Cache key of rendered elevation, which changes when the object is updated.
+        SVG charts have translated titles, and are cached per language.
+        """
+        key = 'altimetry_%s_%s_%s_%s' % (name, cls._meta.module_name, pk,
+                                         date_update.strftime('%Y%m%d%H%M%S%f'))
+        if name == 'svg':
+            key += '_%s' % translation.get_language()
+        return key
+
+    @classmethod
+    def get_elevation_etag(cls, pk, date_update, name):
+        """ETag of rendered elevation, known without rendering it.
+        """
+        return hashlib.md5(cls.get_elevation_cache_key(pk, date_update, name)).hexdigest()
+
+    def get_cached_elevation(self, name):
+        """Returns the ETag and content of rendered elevation (see ``render_elevation()``),
+        cached in the fat cache until the object is updated.
+        """
+        def render():
+            content = self.render_elevation(name)
+            if isinstance(content, unicode):
+                content = content.encode('utf-8')
+            return content
+
+        if not self.pk or self.date_update is None:
+            content = render()
+            return hashlib.md5(content).hexdigest(), content
+        key = self.get_elevation_cache_key(self.pk, self.date_update, name)
+        cache = get_cache('fat')
+        content = cache.get(key)
+        if content is None:
+            content = render()
+            cache.set(key, content)
+        return self.get_elevation_etag(self.pk, self.date_update, name), content
 
     @models.permalink
     def get_elevation_chart_url(self):
@@ -56,13 +120,19 @@ class AltimetryMixin(models.Model):
         model_name = self._meta.module_name
         return ('%s:%s_profile_svg' % (app_label, model_name), [str(self.pk)])
 
-    def get_elevation_chart_path(self):
-        """Path to the PNG version of elevation chart.
+    @classmethod
+    def elevation_chart_path(cls, pk):
+        """Path to the PNG version of elevation chart of object ``pk``.
         """
         basefolder = os.path.join(settings.MEDIA_ROOT, 'profiles')
         if not os.path.exists(basefolder):
             os.mkdir(basefolder)
-        return os.path.join(basefolder, '%s-%s.png' % (self._meta.module_name, self.pk))
+        return os.path.join(basefolder, '%s-%s.png' % (cls._meta.module_name, pk))
+
+    def get_elevation_chart_path(self):
+        """Path to the PNG version of elevation chart.
+        """
+        return self.elevation_chart_path(self.pk)
 
     def prepare_elevation_chart(self, rooturl):
         """Converts SVG elevation URI to PNG on disk.
@@ -79,3 +149,50 @@ class AltimetryMixin(models.Model):
                            from_type=HttpSVGResponse.content_type,
                            to_type='image/png')
         return True
+
+    def render_elevation_chart(self):
+        """Renders SVG elevation chart to PNG on disk, in-process
+        (requires CairoSVG, whereas ``prepare_elevation_chart()`` uses convertit).
+        """
+        import cairosvg
+        path = self.get_elevation_chart_path()
+        # Do nothing if image is up-to-date
+        if is_file_newer(path, self.date_update):
+            return False
+        svg = self.get_elevation_profile_svg()
+        cairosvg.svg2png(bytestring=svg, write_to=path)
+        return True
+
+
+def warm_elevation_cache(sender, instance, **kwargs):
+    """ Render elevation of objects with profiles once saved, since their 3D
+    geometry (and date of update) may have been changed by triggers.
+    Charts are rendered in the default language, whatever the one of the request.
+    """
+    if not settings.ALTIMETRIC_PROFILE_CACHE_WARM or kwargs.get('raw'):
+        return
+    try:
+        instance.get_elevation_chart_url()
+    except NoReverseMatch:
+        return
+    # Triggers have run: obtain computed values
+    instance = sender.objects.filter(pk=instance.pk).first()
+    if instance is None or instance.geom_3d is None:
+        return
+    if instance.geom_3d.geom_type not in ('LineString', 'MultiLineString'):
+        return
+    try:
+        instance.get_cached_elevation('profile')
+        with translation.override(settings.LANGUAGE_CODE):
+            instance.get_cached_elevation('svg')
+    except Exception as e:
+        logger.warning('Could not render %s profile: %s' % (instance, e))
+
+
+@receiver(class_prepared, dispatch_uid="connect_warm_elevation_cache")
+def connect_warm_elevation_cache(sender, **kwargs):
+    """ Only saves of models with elevation go through ``warm_elevation_cache()``.
+    """
+    if issubclass(sender, AltimetryMixin) and not sender._meta.abstract:
+        post_save.connect(warm_elevation_cache, sender=sender,
+                          dispatch_uid="warm_elevation_cache_%s" % sender._meta.db_table)
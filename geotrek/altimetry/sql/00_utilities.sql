@@ -18,6 +18,7 @@ CREATE OR REPLACE FUNCTION ft_drape_line(linegeom geometry, step integer)
     RETURNS SETOF geometry AS $$
 DECLARE
     length float;
+    points2d geometry[];
 BEGIN
     -- Use sampling steps for draping geometry on DEM
     -- http://blog.mathieu-leplatre.info/drape-lines-on-a-dem-with-postgis.html
@@ -28,12 +29,13 @@ BEGIN
         -- Already 3D, do not need to drape.
         -- (Use-case is when assembling paths geometries to build topologies)
         RETURN QUERY SELECT (ST_DumpPoints(ST_Force_3D(linegeom))).geom AS geom;
+        RETURN;
 
     ELSIF length < step THEN
-        RETURN QUERY SELECT add_point_elevation((ST_DumpPoints(linegeom)).geom);
+        points2d := ARRAY(SELECT (ST_DumpPoints(linegeom)).geom);
 
     ELSE
-        RETURN QUERY
+        points2d := ARRAY(
             WITH linemesure AS
                  -- Add a mesure dimension to extract steps
                    (SELECT ST_AddMeasure(linegeom, 0, length) as linem,
@@ -44,15 +46,51 @@ BEGIN
                     SELECT i as distance, ST_GeometryN(ST_LocateAlong(linem, i), 1) AS geom FROM linemesure
                     UNION
                     SELECT length as distance, ST_EndPoint(linegeom) as geom)
-            SELECT add_point_elevation(p.geom)
+            SELECT p.geom
             FROM points2d p
-            ORDER BY p.distance;
+            ORDER BY p.distance);
+    END IF;
+
+    -- Ensure we have a DEM
+    PERFORM * FROM raster_columns WHERE r_table_name = 'mnt';
+    IF FOUND THEN
+        RETURN QUERY SELECT * FROM add_points_elevation(points2d);
+    ELSE
+        RETURN QUERY SELECT add_point_elevation(p) FROM unnest(points2d) AS p;
     END IF;
 END;
 $$ LANGUAGE plpgsql;
 
 
 
+DROP FUNCTION IF EXISTS add_points_elevation(geometry[]);
+CREATE OR REPLACE FUNCTION add_points_elevation(points geometry[])
+    RETURNS SETOF geometry AS $$
+BEGIN
+    -- Same as add_point_elevation() for a list of points, in one query:
+    -- DEM tiles covering the points are fetched once, and points are
+    -- looked up among them. DEM table is expected to exist.
+    RETURN QUERY
+        WITH tiles AS
+               (SELECT rast FROM mnt
+                WHERE ST_Intersects(rast, ST_Envelope(ST_Collect(points)))),
+             elevations AS
+               (SELECT i, points[i] AS geom,
+                       coalesce(ST_Z(points[i])::integer, 0) AS z,
+                       (SELECT ST_Value(rast, 1, points[i])::integer
+                        FROM tiles
+                        WHERE ST_Intersects(rast, points[i])
+                        LIMIT 1) AS ele
+                FROM generate_series(1, array_length(points, 1)) AS i)
+        SELECT CASE WHEN e.z > 0 THEN e.geom
+                    ELSE ST_SetSRID(ST_MakePoint(ST_X(e.geom), ST_Y(e.geom), e.ele), ST_SRID(e.geom))
+               END
+        FROM elevations e
+        ORDER BY e.i;
+END;
+$$ LANGUAGE plpgsql;
+
+
 CREATE OR REPLACE FUNCTION add_point_elevation(geom geometry) RETURNS geometry AS $$
 DECLARE
     ele integer;
@@ -1,3 +1,4 @@
 # pylint: disable=W0401
 
 from .test_elevation import *
+from .test_loaddem import *
@@ -1,9 +1,18 @@
+import json
+import os
+import struct
+from StringIO import StringIO
+
+import mock
 from django.conf import settings
+from django.core.management import call_command
 from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import translation
 from django.db import connections, DEFAULT_DB_ALIAS
-from django.contrib.gis.geos import MultiLineString, LineString
+from django.contrib.gis.geos import GEOSGeometry, MultiLineString, LineString
 
-from geotrek.core.models import Path
+from geotrek.core.models import Path, Topology
 from geotrek.core.factories import TopologyFactory
 from geotrek.altimetry.helpers import AltimetryHelper
 
@@ -43,6 +52,46 @@ class ElevationTest(TestCase):
         self.assertEqual(profile[4][3], 14.0)
         self.assertEqual(profile[5][3], 22.0)
 
+    def test_elevation_drape_points_in_batch(self):
+        cur = connections[DEFAULT_DB_ALIAS].cursor()
+        cur.execute("""SELECT ST_Z(d), ST_Z(add_point_elevation(ST_SetSRID(ST_MakePoint(ST_X(d), ST_Y(d)), ST_SRID(d))))
+                       FROM (SELECT ft_drape_line(geom, 25) AS d FROM l_t_troncon WHERE id = %s) AS draped""",
+                    [self.path.pk])
+        elevations = cur.fetchall()
+        self.assertEqual(len(elevations), 6)
+        for batch, single in elevations:
+            self.assertEqual(batch, single)
+
+    def test_elevation_points_in_batch_keep_order_and_z(self):
+        cur = connections[DEFAULT_DB_ALIAS].cursor()
+        cur.execute("""SELECT ST_AsEWKT(p) FROM add_points_elevation(ARRAY[
+                           ST_SetSRID(ST_MakePoint(78, 117), %(srid)s),
+                           ST_SetSRID(ST_MakePoint(3, 17, 1000), %(srid)s),
+                           ST_SetSRID(ST_MakePoint(3, 17), %(srid)s)]) AS p""", {'srid': settings.SRID})
+        points = [GEOSGeometry(p) for p, in cur.fetchall()]
+        self.assertEqual([p.z for p in points], [5, 1000, 30])
+
+    def test_redrape_after_dem_change(self):
+        topo = TopologyFactory.create(no_path=True)
+        topo.add_path(self.path, start=0.2, end=0.8)
+        topo.save()
+        cur = connections[DEFAULT_DB_ALIAS].cursor()
+        cur.execute('UPDATE mnt SET rast = ST_MapAlgebraExpr(rast, 1, \'16BSI\', \'[rast] + 100\')')
+        call_command('redrape', processes=1, stdout=StringIO())
+        path = Path.objects.get(pk=self.path.pk)
+        self.assertEqual(path.min_elevation, 104)
+        self.assertEqual(path.max_elevation, 122)
+        self.assertEqual(path.geom_3d.coords[0][2], 105)
+        topo = Topology.objects.get(pk=topo.pk)
+        self.assertEqual(topo.min_elevation, 105)
+        self.assertEqual(topo.max_elevation, 110)
+
+    def test_redrape_within_bbox(self):
+        cur = connections[DEFAULT_DB_ALIAS].cursor()
+        cur.execute('UPDATE mnt SET rast = ST_MapAlgebraExpr(rast, 1, \'16BSI\', \'[rast] + 100\')')
+        call_command('redrape', processes=1, bbox='500,500,600,600', stdout=StringIO())
+        self.assertEqual(Path.objects.get(pk=self.path.pk).min_elevation, 4)
+
     def test_elevation_topology_line(self):
         topo = TopologyFactory.create(no_path=True)
         topo.add_path(self.path, start=0.2, end=0.8)
@@ -74,6 +123,64 @@ class ElevationTest(TestCase):
         self.assertEqual(topo.min_elevation, 15)
         self.assertEqual(topo.max_elevation, 15)
 
+    def test_elevation_chart_rendered_in_process(self):
+        cairosvg = mock.MagicMock()
+        path = self.path.get_elevation_chart_path()
+        if os.path.exists(path):
+            os.remove(path)
+        with mock.patch.dict('sys.modules', {'cairosvg': cairosvg}):
+            self.assertTrue(self.path.render_elevation_chart())
+            kwargs = cairosvg.svg2png.call_args[1]
+            self.assertIn('Generated with pygal', kwargs['bytestring'])
+            self.assertEqual(kwargs['write_to'], path)
+            # Up-to-date charts are not rendered again
+            open(path, 'w').close()
+            self.assertFalse(self.path.render_elevation_chart())
+            self.assertEqual(cairosvg.svg2png.call_count, 1)
+        os.remove(path)
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'fat': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'altimetry-tests'}})
+    def test_elevation_cached_until_update(self):
+        etag, svg = self.path.get_cached_elevation('svg')
+        self.assertIn('Generated with pygal', svg)
+        with mock.patch.object(Path, 'render_elevation') as render:
+            self.assertEqual(self.path.get_cached_elevation('svg'), (etag, svg))
+            self.assertFalse(render.called)
+            self.path.save()
+            render.return_value = 'updated'
+            self.assertEqual(self.path.get_cached_elevation('svg')[1], 'updated')
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'fat': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'altimetry-tests'}})
+    def test_elevation_chart_cached_per_language(self):
+        with mock.patch.object(Path, 'render_elevation') as render:
+            render.side_effect = lambda name: translation.get_language()
+            with translation.override('en'):
+                self.assertEqual(self.path.get_cached_elevation('svg')[1], 'en')
+            with translation.override('fr'):
+                self.assertEqual(self.path.get_cached_elevation('svg')[1], 'fr')
+                self.assertEqual(self.path.get_cached_elevation('profile')[1], 'fr')
+            with translation.override('en'):
+                self.assertEqual(self.path.get_cached_elevation('svg')[1], 'en')
+                self.assertEqual(self.path.get_cached_elevation('profile')[1], 'fr')
+            self.assertEqual(render.call_count, 3)
+
+    def test_elevation_cache_not_warmed_by_default(self):
+        with mock.patch.object(Path, 'get_cached_elevation') as cached:
+            self.path.save()
+            self.assertFalse(cached.called)
+
+    @override_settings(ALTIMETRIC_PROFILE_CACHE_WARM=True)
+    def test_elevation_cache_warmed_on_save(self):
+        with mock.patch.object(Path, 'get_cached_elevation') as cached:
+            self.path.save()
+            self.assertEqual([c[0][0] for c in cached.call_args_list], ['profile', 'svg'])
+
 
 class ElevationProfileTest(TestCase):
     def test_elevation_profile_wrong_geom(self):
@@ -84,6 +191,23 @@ class ElevationProfileTest(TestCase):
         profile = AltimetryHelper.elevation_profile(geom)
         self.assertEqual(len(profile), 4)
 
+    def test_elevation_profile_without_queries(self):
+        geom = LineString((0, 0, 8), (3, 4, 10), (3, 10, 12), srid=settings.SRID)
+        with self.assertNumQueries(0):
+            profile = AltimetryHelper.elevation_profile(geom)
+        self.assertEqual([p[0] for p in profile], [0.0, 5.0, 11.0])
+        self.assertEqual([p[3] for p in profile], [8, 10, 12])
+        lnglat = geom.transform(settings.API_SRID, clone=True).coords[1]
+        self.assertEqual(profile[1][1:3], lnglat[:2])
+
+    def test_elevation_profile_multilinestring_distances(self):
+        geom = MultiLineString(LineString((0, 0, 8), (3, 4, 10)),
+                               LineString((3, 4, 10), (3, 10, 12)),
+                               srid=settings.SRID)
+        profile = AltimetryHelper.elevation_profile(geom)
+        # Each part is offset by the length of parts until its end
+        self.assertEqual([p[0] for p in profile], [5.0, 10.0, 11.0, 17.0])
+
     def test_elevation_svg_output(self):
         geom = LineString((1.5, 2.5, 8), (2.5, 2.5, 10),
                           srid=settings.SRID)
@@ -167,4 +291,22 @@ class ElevationAreaTest(TestCase):
     def test_area_provides_altitudes_extent(self):
         extent = self.area['extent']
         self.assertEqual(extent['altitudes']['max'], 45)
-        self.assertEqual(extent['altitudes']['min'], 0)
\ No newline at end of file
+        self.assertEqual(extent['altitudes']['min'], 0)
+
+    def test_area_altitudes_are_sampled_from_south_west(self):
+        # Point (75, 19) is in the DEM pixel of altitude 45
+        self.assertEqual(self.area['altitudes'][2][5], 45)
+        self.assertEqual(self.area['altitudes'][2][4], 40)
+        # Outside DEM
+        self.assertEqual(self.area['altitudes'][-1][-1], 0)
+
+    def test_area_binary_output(self):
+        packed = AltimetryHelper.pack_area(self.area)
+        magic, length = struct.unpack_from('<4sI', packed)
+        self.assertEqual(magic, 'GTD1')
+        metadata = json.loads(packed[8:8 + length])
+        self.assertEqual(metadata['resolution']['x'], 53)
+        self.assertNotIn('altitudes', metadata)
+        altitudes = struct.unpack_from('<%sh' % (53 * 33), packed, 8 + length)
+        self.assertEqual(altitudes[2 * 53 + 5], 45)
+        self.assertEqual(len(packed), 8 + length + 2 * 53 * 33)
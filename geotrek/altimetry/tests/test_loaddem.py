@@ -0,0 +1,71 @@
+from StringIO import StringIO
+
+import mock
+from django.test import TestCase
+
+from geotrek.altimetry.management.commands.loaddem import Command, CopyStream
+
+
+RASTER2PGSQL_OUTPUT = """BEGIN;
+CREATE TABLE "mnt" ("rid" serial PRIMARY KEY,"rast" raster);
+COPY "mnt" ("rast") FROM stdin;
+0100000100
+0100000200
+\\.
+CREATE INDEX ON "mnt" USING gist (st_convexhull("rast"));
+END;
+VACUUM ANALYZE "mnt";
+"""
+
+
+class CopyStreamTest(TestCase):
+    def test_copy_data_stops_at_end_marker(self):
+        lines = iter(['a\n', 'b\n', '\\.\n', 'c\n'])
+        data = CopyStream(lines)
+        self.assertEqual(data.read(8192), 'a\n')
+        self.assertEqual(data.read(8192), 'b\n')
+        self.assertEqual(data.read(8192), '')
+        self.assertEqual(data.read(8192), '')
+        self.assertEqual(data.rows, 2)
+        self.assertEqual(next(lines), 'c\n')
+
+
+class LoadSQLTest(TestCase):
+    def test_statements_are_executed_and_tiles_copied(self):
+        cursor = mock.MagicMock()
+        copied = []
+        cursor.copy_expert.side_effect = lambda sql, f: copied.extend(iter(lambda: f.read(8192), ''))
+        command = Command()
+        command.stdout = StringIO()
+        with mock.patch('geotrek.altimetry.management.commands.loaddem.connection') as connection:
+            connection.cursor.return_value = cursor
+            maintenance = command.load_sql(iter(RASTER2PGSQL_OUTPUT.splitlines(True)))
+        executed = [c[0][0] for c in cursor.execute.call_args_list]
+        self.assertEqual(executed, ['CREATE TABLE "mnt" ("rid" serial PRIMARY KEY,"rast" raster);',
+                                    'CREATE INDEX ON "mnt" USING gist (st_convexhull("rast"));'])
+        self.assertEqual(cursor.copy_expert.call_args[0][0], 'COPY "mnt" ("rast") FROM stdin;')
+        self.assertEqual(copied, ['0100000100\n', '0100000200\n'])
+        self.assertEqual(maintenance, ['VACUUM ANALYZE "mnt";'])
+        self.assertIn('2 tiles loaded', command.stdout.getvalue())
+
+
+class LoadTest(TestCase):
+    def test_load_is_rolled_back_if_raster2pgsql_fails(self):
+        process = mock.MagicMock()
+        process.stdout = StringIO(RASTER2PGSQL_OUTPUT[:RASTER2PGSQL_OUTPUT.index('0100000200')])
+        process.wait.return_value = 1
+        command = Command()
+        command.stdout = StringIO()
+        module = 'geotrek.altimetry.management.commands.loaddem'
+        with mock.patch(module + '.connection') as connection, \
+                mock.patch(module + '.transaction') as transaction:
+            connection.cursor.return_value.fetchall.return_value = []
+            atomic = transaction.atomic.return_value
+            atomic.__exit__.return_value = False
+            self.assertRaises(Exception, command.load, process, drop=True)
+        executed = [c[0][0] for c in connection.cursor.return_value.execute.call_args_list]
+        self.assertIn('DROP TABLE mnt', executed)
+        # Failure was raised within the transaction
+        self.assertTrue(atomic.__enter__.called)
+        self.assertIsNotNone(atomic.__exit__.call_args[0][0])
+        self.assertTrue(process.stdout.closed)
@@ -2,9 +2,12 @@ from django.views.generic.edit import BaseDetailView
 from django.http import HttpResponse
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import etag
 
-from mapentity.decorators import view_cache_response_content
-from mapentity.views import JSONResponseMixin, LastModifiedMixin
+from mapentity.views import LastModifiedMixin
+
+from .helpers import DEM_BINARY_CONTENT_TYPE
 
 
 class HttpSVGResponse(HttpResponse):
@@ -14,58 +17,79 @@ class HttpSVGResponse(HttpResponse):
         super(HttpSVGResponse, self).__init__(content, **kwargs)
 
 
-class ElevationChart(LastModifiedMixin, BaseDetailView):
+class CachedElevationMixin(object):
+    """Serve elevation rendered by ``AltimetryMixin.get_cached_elevation()``,
+    with an ETag to skip transfers of unchanged content. The ETag is checked
+    before loading the object (see ``AltimetryMixin.get_elevation_etag()``).
+    """
+    elevation_name = None
+    response_class = HttpResponse
+    # Request headers the content depends on (also sent with 304 responses)
+    vary_headers = ()
+
+    def get_elevation_name(self):
+        return self.elevation_name
+
+    def get_etag(self):
+        queryset = self.get_queryset()
+        pk = self.kwargs.get(self.pk_url_kwarg)
+        dates = queryset.filter(pk=pk).values_list('date_update', flat=True)
+        if not dates or dates[0] is None:
+            return None
+        return queryset.model.get_elevation_etag(pk, dates[0], self.get_elevation_name())
+
+    def get(self, request, *args, **kwargs):
+        @etag(lambda request, *args, **kwargs: self.get_etag())
+        def get(request, *args, **kwargs):
+            return super(CachedElevationMixin, self).get(request, *args, **kwargs)
+        response = get(request, *args, **kwargs)
+        patch_vary_headers(response, self.vary_headers)
+        return response
+
+    def render_to_response(self, context, **response_kwargs):
+        content = self.object.get_cached_elevation(self.get_elevation_name())[1]
+        return self.response_class(content, **response_kwargs)
+
+
+class ElevationChart(CachedElevationMixin, LastModifiedMixin, BaseDetailView):
+    elevation_name = 'svg'
+    response_class = HttpSVGResponse
+    # Axis titles are translated
+    vary_headers = ('Accept-Language',)
 
     @method_decorator(login_required)
     def dispatch(self, *args, **kwargs):
         return super(ElevationChart, self).dispatch(*args, **kwargs)
 
-    def render_to_response(self, context, **response_kwargs):
-        return HttpSVGResponse(self.get_object().get_elevation_profile_svg(),
-                               **response_kwargs)
-
 
-class ElevationProfile(LastModifiedMixin, JSONResponseMixin, BaseDetailView):
+class ElevationProfile(CachedElevationMixin, LastModifiedMixin, BaseDetailView):
     """Extract elevation profile from a path and return it as JSON"""
+    elevation_name = 'profile'
 
     @method_decorator(login_required)
     def dispatch(self, *args, **kwargs):
         return super(ElevationProfile, self).dispatch(*args, **kwargs)
 
-    def get_context_data(self, **kwargs):
-        """
-        Put elevation profile into response context.
-        """
-        obj = self.get_object()
-        data = {}
-        # Formatted as distance, elevation, [lng, lat]
-        for step in obj.get_elevation_profile():
-            formatted = step[0], step[3], step[1:3]
-            data.setdefault('profile', []).append(formatted)
-        return data
-
-
-class ElevationArea(LastModifiedMixin, JSONResponseMixin, BaseDetailView):
-    """Extract elevation profile on an area and return it as JSON"""
-
-    def view_cache_key(self):
-        """Used by the ``view_cache_response_content`` decorator.
-        """
-        obj = self.get_object()
-        return 'altimetry_dem_area_%s' % obj.pk
-
-    def latest_updated(self):
-        """Used by the ``view_cache_response_content`` decorator.
-        """
-        obj = self.get_object()
-        return obj.date_update
+    def render_to_response(self, context, **response_kwargs):
+        response_kwargs['content_type'] = 'application/json'
+        return super(ElevationProfile, self).render_to_response(context, **response_kwargs)
+
+
+class ElevationArea(CachedElevationMixin, LastModifiedMixin, BaseDetailView):
+    """Extract elevation profile on an area and return it as JSON,
+    or in a compact binary format if requested (see ``AltimetryHelper.pack_area()``)"""
+    vary_headers = ('Accept',)
 
     @method_decorator(login_required)
-    @view_cache_response_content()
     def dispatch(self, *args, **kwargs):
         return super(ElevationArea, self).dispatch(*args, **kwargs)
 
-    def get_context_data(self, **kwargs):
-        obj = self.get_object()
-        return obj.get_elevation_area()
+    def is_binary(self):
+        return DEM_BINARY_CONTENT_TYPE in self.request.META.get('HTTP_ACCEPT', '')
+
+    def get_elevation_name(self):
+        return 'area_binary' if self.is_binary() else 'area'
 
+    def render_to_response(self, context, **response_kwargs):
+        response_kwargs['content_type'] = DEM_BINARY_CONTENT_TYPE if self.is_binary() else 'application/json'
+        return super(ElevationArea, self).render_to_response(context, **response_kwargs)
@@ -7,6 +7,69 @@ from paperclip.models import FileType as BaseFileType
 from geotrek.authent.models import StructureRelated
 
 
+class AddPropertyMixin(object):
+    """
+    Allows other applications to add properties to a model (see ``add_property()``),
+    which can be computed for many instances at once (see ``prefetch_topology_relations()``).
+    """
+    @classmethod
+    def add_property(cls, name, func, prefetch=None):
+        """
+        Add a property ``name``, computed by ``func(instance)``.
+
+        ``prefetch`` computes it for a list of instances: it returns a dict of
+        values for each instance pk (or ``None`` if it cannot be done). It can
+        also be the name of another property, from which this one is computed.
+        """
+        if hasattr(cls, name):
+            raise AttributeError("%s has already an attribute %s" % (cls, name))
+
+        def getter(self):
+            prefetched = getattr(self, '_prefetched_relations', {})
+            if name in prefetched:
+                return prefetched[name]
+            return func(self)
+        setattr(cls, name, property(getter))
+
+        if prefetch is not None:
+            if '_prefetchers' not in cls.__dict__:
+                cls._prefetchers = {}
+            cls._prefetchers[name] = prefetch
+
+    @classmethod
+    def get_prefetcher(cls, name):
+        for klass in cls.__mro__:
+            prefetcher = klass.__dict__.get('_prefetchers', {}).get(name)
+            if prefetcher is not None:
+                return prefetcher
+        return None
+
+    @classmethod
+    def prefetch_topology_relations(cls, objects, *names):
+        """
+        Compute the specified properties for all objects at once, and cache them
+        on instances. Returns the list of objects.
+        Properties that cannot be prefetched will be computed for each instance, as usual.
+        """
+        objects = list(objects)
+        done = set()
+        for name in names:
+            prefetcher = cls.get_prefetcher(name)
+            # Property computed from another one
+            while isinstance(prefetcher, basestring):
+                name, prefetcher = prefetcher, cls.get_prefetcher(prefetcher)
+            if prefetcher is None or name in done:
+                continue
+            done.add(name)
+            values = prefetcher(objects)
+            if values is None:
+                continue
+            for obj in objects:
+                prefetched = obj.__dict__.setdefault('_prefetched_relations', {})
+                prefetched[name] = values[obj.pk]
+        return objects
+
+
 class TimeStampedModel(models.Model):
     # Computed values (managed at DB-level with triggers)
     date_insert = models.DateTimeField(auto_now_add=True, editable=False, verbose_name=_(u"Insertion date"), db_column='date_insert')
@@ -0,0 +1,31 @@
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+
+ROLLBACK_HELP = 'Objects are created in a transaction which is rolled back.\n'
+
+
+def origin():
+    """ Lower-left corner of spatial extent, where benchmark objects are created. """
+    return settings.SPATIAL_EXTENT[:2]
+
+
+@contextmanager
+def rolled_back():
+    """ Everything written within the block is rolled back when leaving it. """
+    with transaction.atomic():
+        sid = transaction.savepoint()
+        try:
+            yield
+        finally:
+            transaction.savepoint_rollback(sid)
+
+
+def timed(func, *args, **kwargs):
+    """ Call ``func`` and return its duration (in seconds) with its result. """
+    start = time.time()
+    result = func(*args, **kwargs)
+    return time.time() - start, result
@@ -0,0 +1,83 @@
+import os.path
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry
+
+
+class LoadLayerCommand(BaseCommand):
+    """
+    Base command loading the features of a layer (any format read by GDAL),
+    with model fields set from layer fields (``--field``) or values (``--default``).
+
+    Subclasses open the layer with ``open_layer()``, and implement ``read_feature()``
+    to obtain objects from features, read by batches with ``read_batch()``.
+    """
+    can_import_settings = True
+
+    option_list = BaseCommand.option_list + (
+        make_option('--field', action='append', dest='fields', default=[],
+                    help='Model field set from a layer field, as model_field:layer_field (repeatable)'),
+        make_option('--default', action='append', dest='defaults', default=[],
+                    help='Model field set to a value, as model_field=value (repeatable)'),
+        make_option('--srid', type='int', dest='srid', default=settings.SRID,
+                    help='SRID of the layer geometries (default: %s)' % settings.SRID),
+    )
+
+    def open_layer(self, filename, options):
+        """
+        Return the first layer of the file, and its number of features.
+        """
+        try:
+            from osgeo import ogr
+        except ImportError:
+            msg = 'GDAL Python bindings are not available. Can not proceed.'
+            raise CommandError(msg)
+
+        if not os.path.exists(filename):
+            raise CommandError('File does not exists at: %s' % filename)
+
+        try:
+            self.fields = [f.split(':', 1) for f in options.get('fields') or []]
+            self.defaults = dict([d.split('=', 1) for d in options.get('defaults') or []])
+        except ValueError:
+            raise CommandError('Invalid --field or --default option. See help')
+        self.srid = options.get('srid') or settings.SRID
+
+        # Layers can not be used once their datasource is released
+        self.datasource = ogr.Open(filename)
+        if self.datasource is None:
+            raise CommandError('Could not open %s' % filename)
+        layer = self.datasource.GetLayer()
+        count = layer.GetFeatureCount()
+        self.stdout.write('%s objects found' % count)
+        return layer, count
+
+    def read_geometry(self, feature):
+        """ Feature geometry, in the projection of the database. """
+        geometry = GEOSGeometry(feature.GetGeometryRef().ExportToWkt(), srid=self.srid)
+        if geometry.srid != settings.SRID:
+            geometry.transform(settings.SRID)
+        return geometry
+
+    def read_values(self, feature):
+        """ Model fields values, from ``--field`` and ``--default`` options. """
+        values = dict(self.defaults)
+        for model_field, layer_field in self.fields:
+            value = feature.GetFieldAsString(layer_field)
+            values[model_field] = value.decode('utf-8') if value else None
+        return values
+
+    def read_feature(self, feature):
+        raise NotImplementedError
+
+    def read_batch(self, layer, size):
+        """ Read the next features of the layer (see ``read_feature()``). """
+        objects = []
+        for i in range(size):
+            feature = layer.GetNextFeature()
+            if feature is None:
+                break
+            objects.append(self.read_feature(feature))
+        return objects
@@ -2,10 +2,12 @@ import re
 import os
 import logging
 import traceback
+from cStringIO import StringIO
 from functools import wraps
 
 from django.db import connection, models
 from django.conf import settings
+from django.contrib.gis.db.models import GeometryField
 
 
 logger = logging.getLogger(__name__)
@@ -96,3 +98,49 @@ def load_sql_files(app_label):
                             (sql_file, e))
             traceback.print_exc()
             raise
+
+
+def _copy_value(value):
+    """ Text representation of a value in COPY data. """
+    if value is None:
+        return r'\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if not isinstance(value, basestring):
+        value = unicode(value)
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+                 .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def copy_objects(objects):
+    """
+    Create model instances (of the same model) with a single COPY statement,
+    much faster than INSERT for large imports. As with ``bulk_create()``,
+    ``save()`` is not called, and primary keys are not set on instances.
+    Database triggers are executed.
+    """
+    if not objects:
+        return 0
+    model = objects[0].__class__
+    fields = [f for f in model._meta.local_concrete_fields
+              if not isinstance(f, models.AutoField)]
+    data = StringIO()
+    for obj in objects:
+        values = []
+        for field in fields:
+            value = field.pre_save(obj, True)
+            if isinstance(field, GeometryField):
+                if value is not None and value.srid is None:
+                    value.srid = field.srid
+                value = value.hexewkb if value is not None else None
+            else:
+                value = field.get_db_prep_save(value, connection)
+            values.append(_copy_value(value))
+        data.write('\t'.join(values) + '\n')
+    data.seek(0)
+    columns = ', '.join(connection.ops.quote_name(f.column) for f in fields)
+    cursor = connection.cursor()
+    cursor.copy_expert('COPY %s (%s) FROM STDIN' % (connection.ops.quote_name(model._meta.db_table), columns), data)
+    return len(objects)
@@ -80,13 +80,16 @@ class SnappedLineStringField(LineStringField):
             snaplist = value.get('snap', [])
             if geom.num_coords != len(snaplist):
                 raise ValueError("Snap list length != %s (%s)" % (geom.num_coords, snaplist))
-            paths = [Path.objects.get(pk=pk) if pk is not None else None
-                     for pk in snaplist]
+            pks = set([pk for pk in snaplist if pk is not None])
+            paths = Path.objects.in_bulk(pks)
+            if len(paths) != len(pks):
+                raise Path.DoesNotExist("Unknown paths %s" % sorted(pks - set(paths)))
+            # Snap vertices on their path, all at once for each path
             coords = list(geom.coords)
-            for i, (vertex, path) in enumerate(zip(coords, paths)):
-                if path:
-                    # Snap vertex on path
-                    snap = path.snap(Point(*vertex, srid=geom.srid))
+            for pk, path in paths.items():
+                indices = [i for i, snap in enumerate(snaplist) if snap == pk]
+                vertices = [Point(*coords[i], srid=geom.srid) for i in indices]
+                for i, snap in zip(indices, path.snap_points(vertices)):
                     coords[i] = snap.coords
             return LineString(*coords, srid=settings.SRID)
         except (TypeError, Path.DoesNotExist, ValueError) as e:
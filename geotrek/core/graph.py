@@ -1,16 +1,233 @@
+import json
 import math
+import struct
+import sys
+from array import array
 from collections import defaultdict
 
+from django.db import connection, transaction
 
-def path_modifier(path):
-    l = 0.0 if math.isnan(path.length) else path.length
-    return {"id": path.pk, "length": l}
 
+GRAPH_BINARY_CONTENT_TYPE = 'application/x-geotrek-graph'
+GRAPH_BINARY_MAGIC = 'GTG1'
 
-def get_key_optimizer():
-    next_id = iter(xrange(1, 1000000)).next
-    mapping = defaultdict(next_id)
-    return lambda x: mapping[x]
+
+def path_modifier(pk, length):
+    l = 0.0 if length is None or math.isnan(length) else length
+    return {"id": pk, "length": l}
+
+
+def iter_paths_extremities(qs, batch_size=2000):
+    """
+    Yield ``(pk, start_point, end_point, length)`` for each path of the queryset.
+
+    Geometries are not loaded: extremities are extracted in database, and rows
+    are fetched by batches through a server-side cursor.
+    """
+    table = qs.model._meta.db_table
+    qs = qs.extra(select={
+        'start_x': 'ST_X(ST_StartPoint(%s.geom))' % table,
+        'start_y': 'ST_Y(ST_StartPoint(%s.geom))' % table,
+        'end_x': 'ST_X(ST_EndPoint(%s.geom))' % table,
+        'end_y': 'ST_Y(ST_EndPoint(%s.geom))' % table,
+    }).values_list('pk', 'start_x', 'start_y', 'end_x', 'end_y', 'length')
+    sql, params = qs.query.sql_with_params()
+
+    # Named cursors are only available within transactions
+    with transaction.atomic():
+        connection.ensure_connection()
+        cursor = connection.connection.cursor(name='paths_extremities')
+        cursor.itersize = batch_size
+        try:
+            cursor.execute(sql, params)
+            for pk, start_x, start_y, end_x, end_y, length in cursor:
+                yield pk, (start_x, start_y), (end_x, end_y), length
+        finally:
+            cursor.close()
+
+
+class PathGraphStore(object):
+    """
+    Paths graph (see ``graph_edges_nodes_of_qs``) that can be modified
+    path by path, instead of being rebuilt from scratch.
+
+    Changes are read from the table ``l_t_troncon_graphe`` (kept up-to-date
+    by triggers, including for paths created or shrunk by the split trigger),
+    and each set of changes applied is stamped with a new version. This allows
+    to extract the changes since a given version (see ``delta()``).
+
+    Versions of changes are drawn when written, but visible once committed:
+    a transaction can commit a change with a lower version than those already
+    read. Changes of transactions which were still running at the previous
+    read (``txid`` not older than the snapshot ``xmin``) are thus read again.
+
+    Only the versions of the last ``history`` changes are kept: deltas since
+    older versions are not available (see ``compact()``).
+    """
+    history = 10000
+
+    def __init__(self, version=0, xmin=0):
+        self.version = version
+        self.base_version = version
+        # Changes table position: last version read, and oldest running transaction
+        self.db_version = version
+        self.xmin = xmin
+        self.path_versions = {}
+        self.edges = {}
+        self.nodes = {}
+        self.edge_versions = {}
+        self.node_versions = {}
+        self._node_edges = defaultdict(set)
+        self._node_keys = {}
+
+    @classmethod
+    def current_version(cls):
+        cursor = connection.cursor()
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM l_t_troncon_graphe")
+        return cursor.fetchone()[0]
+
+    @classmethod
+    def current_xmin(cls):
+        """
+        Oldest transaction still running: those before are committed or aborted.
+        """
+        cursor = connection.cursor()
+        cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        return cursor.fetchone()[0]
+
+    @classmethod
+    def build(cls, qs):
+        """
+        Build the graph of the whole queryset, at current version.
+        """
+        # Obtain versions first: changes occuring during build will be applied twice,
+        # which is harmless.
+        xmin = cls.current_xmin()
+        store = cls(cls.current_version(), xmin)
+        # Changes which may be read again, already applied if committed
+        cursor = connection.cursor()
+        cursor.execute("SELECT troncon, version FROM l_t_troncon_graphe WHERE txid >= %s", [xmin])
+        store.path_versions = dict(cursor.fetchall())
+        for pk, start, end, length in iter_paths_extremities(qs):
+            store.add_edge(pk, start, end, length)
+        # No delta since a version older than the build
+        store.compact(store.version)
+        return store
+
+    def _node_key(self, coords):
+        if coords not in self._node_keys:
+            self._node_keys[coords] = len(self._node_keys) + 1
+        return self._node_keys[coords]
+
+    def _refresh_nodes(self, nodes, version):
+        for node in set(nodes):
+            adjacency = {}
+            for edge_id in sorted(self._node_edges[node]):
+                start, end = self.edges[edge_id]['nodes_id']
+                adjacency[end if start == node else start] = edge_id
+            if adjacency:
+                self.nodes[node] = adjacency
+            else:
+                self.nodes.pop(node, None)
+                self._node_edges.pop(node, None)
+            self.node_versions[node] = version
+
+    def add_edge(self, pk, start_point, end_point, length, version=None):
+        version = self.version if version is None else version
+        self.remove_path(pk, version)
+        start, end = self._node_key(start_point), self._node_key(end_point)
+        edge = path_modifier(pk, length)
+        edge['nodes_id'] = [start, end]
+        self.edges[pk] = edge
+        self.edge_versions[pk] = version
+        self._node_edges[start].add(pk)
+        self._node_edges[end].add(pk)
+        self._refresh_nodes(edge['nodes_id'], version)
+
+    def remove_path(self, pk, version=None):
+        version = self.version if version is None else version
+        edge = self.edges.pop(pk, None)
+        if edge is None:
+            return
+        self.edge_versions[pk] = version
+        for node in edge['nodes_id']:
+            self._node_edges[node].discard(pk)
+        self._refresh_nodes(edge['nodes_id'], version)
+
+    def update(self):
+        """
+        Apply paths changes that occured since the store version.
+        Returns True if the graph was modified.
+        """
+        from .models import Path
+
+        xmin = self.current_xmin()
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT troncon, supprime, version, txid FROM l_t_troncon_graphe
+            WHERE version > %s OR txid >= %s ORDER BY version""", [self.db_version, self.xmin])
+        rows = cursor.fetchall()
+        # Skip changes read again, but already applied
+        changes = [(pk, deleted, version) for pk, deleted, version, txid in rows
+                   if self.path_versions.get(pk) != version]
+        # Only changes of transactions still running will be read again
+        self.path_versions = dict([(pk, version) for pk, deleted, version, txid in rows
+                                   if txid >= xmin])
+        self.xmin = xmin
+        if not changes:
+            return False
+
+        # Changes committed late may have lower versions than those already read
+        self.db_version = max(self.db_version, changes[-1][2])
+        version = max(self.version + 1, self.db_version)
+        for pk, deleted, db_version in changes:
+            if deleted:
+                self.remove_path(pk, version)
+        modified = set([pk for pk, deleted, db_version in changes if not deleted])
+        for pk, start, end, length in iter_paths_extremities(Path.objects.filter(pk__in=modified)):
+            self.add_edge(pk, start, end, length, version)
+            modified.discard(pk)
+        for pk in modified:  # Deleted in the meantime
+            self.remove_path(pk, version)
+        self.version = version
+        self.compact(version - self.history)
+        return True
+
+    def compact(self, version):
+        """
+        Forget versions of changes up to the specified version, including
+        those of deleted edges and nodes: deltas since older versions
+        are not available anymore.
+        """
+        if version < self.base_version:
+            return
+        self.edge_versions = dict([(pk, v) for pk, v in self.edge_versions.items() if v > version])
+        self.node_versions = dict([(node, v) for node, v in self.node_versions.items() if v > version])
+        self.base_version = version
+
+    def delta(self, since):
+        """
+        Return the edges and nodes modified since the specified version
+        (``None`` values for deleted ones), or ``None`` if this version
+        is older than the store.
+        """
+        if since < self.base_version or since > self.version:
+            return None
+        edges = dict([(pk, self.edges.get(pk))
+                      for pk, version in self.edge_versions.items() if version > since])
+        nodes = dict([(node, self.nodes.get(node))
+                      for node, version in self.node_versions.items() if version > since])
+        return {
+            'version': self.version,
+            'edges': edges,
+            'nodes': nodes,
+        }
+
+    def as_graph(self):
+        return {
+            'edges': dict(self.edges),
+            'nodes': dict(self.nodes),
+        }
 
 
 def graph_edges_nodes_of_qs(qs):
@@ -31,27 +248,48 @@ def graph_edges_nodes_of_qs(qs):
 
     coord_point are tuple of float
     """
+    store = PathGraphStore()
+    for pk, start, end, length in iter_paths_extremities(qs):
+        store.add_edge(pk, start, end, length)
+    return store.as_graph()
 
-    key_modifier = get_key_optimizer()
-    value_modifier = path_modifier
 
-    edges = defaultdict(dict)
-    nodes = defaultdict(dict)
+def iter_graph_json(graph, batch_size=1000):
+    """
+    Serialize the graph to JSON, chunk by chunk.
+    """
+    yield '{'
+    for i, key in enumerate(('edges', 'nodes')):
+        yield '%s"%s": {' % (', ' if i > 0 else '', key)
+        items = graph[key].items()
+        for j in xrange(0, len(items), batch_size):
+            batch = json.dumps(dict(items[j:j + batch_size]))
+            yield '%s%s' % (', ' if j > 0 else '', batch[1:-1])
+        yield '}'
+    yield '}'
 
-    for path in qs:
-        coords = path.geom.coords
-        start_point, end_point = coords[0], coords[-1]
-        k_start_point, k_end_point = key_modifier(start_point), key_modifier(end_point)
 
-        v_path = value_modifier(path)
-        v_path['nodes_id'] = [k_start_point, k_end_point]
-        edge_id = v_path['id']
+def pack_graph(graph):
+    """
+    Compact binary encoding of the graph, decoded by ``Geotrek.Dijkstra.decode_graph``.
 
-        nodes[k_start_point][k_end_point] = edge_id
-        nodes[k_end_point][k_start_point] = edge_id
-        edges[edge_id] = v_path
+    Little-endian, edges sorted by id::
 
-    return {
-        'edges': dict(edges),
-        'nodes': dict(nodes),
-    }
+        'GTG1' | uint32 N | int32 ids[N] | uint32 nodes[2N] | float32 lengths[N]
+
+    Nodes adjacency is not transmitted, since it can be rebuilt from edges.
+    """
+    edges = graph['edges']
+    ids = array('i')
+    nodes = array('I')
+    lengths = array('f')
+    for pk in sorted(edges.keys()):
+        edge = edges[pk]
+        ids.append(edge['id'])
+        nodes.extend(edge['nodes_id'])
+        lengths.append(edge['length'])
+    if sys.byteorder == 'big':
+        for a in (ids, nodes, lengths):
+            a.byteswap()
+    header = struct.pack('<4sI', GRAPH_BINARY_MAGIC, len(ids))
+    return header + ids.tostring() + nodes.tostring() + lengths.tostring()
@@ -1,16 +1,42 @@
 import json
 import logging
+import multiprocessing
+import threading
+from contextlib import contextmanager
+from itertools import chain
 
 from django.conf import settings
-from django.db import connection
-from django.contrib.gis.geos import Point
+from django.db import connection, transaction
+from django.contrib.gis.geos import fromstr, Point
 from django.db.models.query import QuerySet
 
+from geotrek.altimetry.helpers import REDRAPE_SQL
 from geotrek.common.utils import sqlfunction, uniquify
 
+from .linearref import LinearReference
+from .routing import get_router
+from .signals import paths_imported, check_imported_paths
+
 
 logger = logging.getLogger(__name__)
 
+_deferred = threading.local()
+_router = None
+
+
+def _match_steps(steps):
+    """ Match a line (snapped vertices) on the paths network, in a worker process."""
+    return _router.match(steps)
+
+
+def cached_queryset(queryset, objects):
+    """
+    Set the results of the queryset, as if it had been evaluated.
+    """
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    return queryset
+
 
 class TopologyHelper(object):
     @classmethod
@@ -92,47 +118,241 @@ class TopologyHelper(object):
         PathAggregation.objects.filter(topo_object=topology).delete()
 
         try:
-            counter = 0
-            for j, subtopology in enumerate(objdict):
-                last_topo = j == len(objdict) - 1
-                positions = subtopology.get('positions', {})
-                paths = subtopology['paths']
-                # Create path aggregations
-                for i, path in enumerate(paths):
-                    last_path = i == len(paths) - 1
-                    # Javascript hash keys are parsed as a string
-                    idx = str(i)
-                    start_position, end_position = positions.get(idx, (0.0, 1.0))
-                    path = Path.objects.get(pk=path)
-                    topology.add_path(path, start=start_position, end=end_position, order=counter, reload=False)
-                    if not last_topo and last_path:
-                        counter += 1
-                        # Intermediary marker.
-                        # make sure pos will be [X, X]
-                        # [0, X] or [X, 1] or [X, 0] or [1, X] --> X
-                        # [0.0, 0.0] --> 0.0  : marker at beginning of path
-                        # [1.0, 1.0] --> 1.0  : marker at end of path
-                        pos = -1
-                        if start_position == end_position:
-                            pos = start_position
-                        if start_position == 0.0:
-                            pos = end_position
-                        elif start_position == 1.0:
-                            pos = end_position
-                        elif end_position == 0.0:
-                            pos = start_position
-                        elif end_position == 1.0:
-                            pos = start_position
-                        elif len(paths) == 1:
-                            pos = end_position
-                        assert pos >= 0, "Invalid position (%s, %s)." % (start_position, end_position)
-                        topology.add_path(path, start=pos, end=pos, order=counter, reload=False)
-                    counter += 1
-        except (AssertionError, ValueError, KeyError, Path.DoesNotExist) as e:
+            aggregations = cls.aggregations(objdict)
+            # Check all paths exist, in one query
+            path_ids = set([int(aggr[0]) for aggr in aggregations])
+            existing = set(Path.objects.filter(pk__in=path_ids).values_list('pk', flat=True))
+            missing = path_ids - existing
+            if missing:
+                raise Path.DoesNotExist("Unknown paths %s" % sorted(missing))
+            cls.bulk_add_paths(topology, aggregations)
+        except (AssertionError, ValueError, KeyError, TypeError, Path.DoesNotExist) as e:
             raise ValueError("Invalid serialized topology : %s" % e)
         topology.save()
         return topology
 
+    @classmethod
+    def aggregations(cls, objdict):
+        """
+        Returns the path aggregations of a serialized linear topology (list of
+        sub-topologies, see ``deserialize()``), as ``(path_id, start, end, order)``.
+        """
+        counter = 0
+        aggregations = []
+        for j, subtopology in enumerate(objdict):
+            last_topo = j == len(objdict) - 1
+            positions = subtopology.get('positions', {})
+            paths = subtopology['paths']
+            # Create path aggregations
+            for i, path in enumerate(paths):
+                last_path = i == len(paths) - 1
+                # Javascript hash keys are parsed as a string
+                idx = str(i)
+                start_position, end_position = positions.get(idx, (0.0, 1.0))
+                aggregations.append((path, start_position, end_position, counter))
+                if not last_topo and last_path:
+                    counter += 1
+                    # Intermediary marker.
+                    # make sure pos will be [X, X]
+                    # [0, X] or [X, 1] or [X, 0] or [1, X] --> X
+                    # [0.0, 0.0] --> 0.0  : marker at beginning of path
+                    # [1.0, 1.0] --> 1.0  : marker at end of path
+                    pos = -1
+                    if start_position == end_position:
+                        pos = start_position
+                    if start_position == 0.0:
+                        pos = end_position
+                    elif start_position == 1.0:
+                        pos = end_position
+                    elif end_position == 0.0:
+                        pos = start_position
+                    elif end_position == 1.0:
+                        pos = start_position
+                    elif len(paths) == 1:
+                        pos = end_position
+                    assert pos >= 0, "Invalid position (%s, %s)." % (start_position, end_position)
+                    aggregations.append((path, pos, pos, counter))
+                counter += 1
+        return aggregations
+
+    @classmethod
+    def bulk_add_paths(cls, topology, aggregations):
+        """
+        Create the path aggregations of the topology, given as a list of
+        ``(path_id, start, end, order)``, with a single query.
+        """
+        from .models import PathAggregation
+
+        with cls.deferred_geometry():
+            PathAggregation.objects.bulk_create([
+                PathAggregation(topo_object=topology, path_id=path_id,
+                                start_position=start, end_position=end, order=order)
+                for (path_id, start, end, order) in aggregations
+            ])
+
+    @classmethod
+    def bulk_create(cls, objects, aggregations, geoms=None):
+        """
+        Save new topologies (instances of the same model) with their path aggregations,
+        given as a list of ``(path_id, start, end, order)`` for each object, with a few
+        queries for all of them. Geometries are computed once, in deferred mode.
+
+        Like ``save()``, this sets kind and static offset of objects, but neither calls
+        overridden ``save()`` methods nor sends signals.
+        """
+        from .models import Topology, PathAggregation
+
+        objects = list(objects)
+        if not objects:
+            return objects
+        model = objects[0].__class__
+        geoms = geoms or [None] * len(objects)
+
+        # Reserve primary keys, shared by tables of inherited models
+        cursor = connection.cursor()
+        cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                       [Topology._meta.db_table, len(objects)])
+        pks = [row[0] for row in cursor.fetchall()]
+
+        shortmodelname = model._meta.object_name.lower().replace('edge', '')
+        static_offset = settings.TOPOLOGY_STATIC_OFFSETS.get(shortmodelname)
+        for obj, pk, geom in zip(objects, pks, geoms):
+            obj.pk = obj.id = pk
+            obj.kind = obj.kind or model.KIND
+            if static_offset is not None:
+                obj.offset = static_offset
+            # We cannot have NULL geometry, it will be computed by triggers.
+            obj.geom = fromstr('POINT (0 0)') if geom is None else geom
+
+        with transaction.atomic():
+            # Insert rows of each table, from the base one (bulk_create() does not
+            # support models inheritance)
+            for klass in list(reversed(model._meta.get_parent_list())) + [model]:
+                klass._base_manager._insert(objects, fields=klass._meta.local_concrete_fields)
+            with cls.deferred_geometry():
+                PathAggregation.objects.bulk_create([
+                    PathAggregation(topo_object_id=obj.pk, path_id=path_id, order=order,
+                                    start_position=start, end_position=end)
+                    for obj, aggrs in zip(objects, aggregations)
+                    for (path_id, start, end, order) in aggrs
+                ])
+        return objects
+
+    @classmethod
+    def bulk_create_points(cls, objects, points):
+        """
+        Save new point topologies, each one snapped on the closest path of its
+        point (see ``bulk_create()``).
+        """
+        objects = list(objects)
+        points = [p.transform(settings.SRID, clone=True) for p in points]
+        positions = PathHelper.closest_positions(points)
+        aggregations = []
+        for obj, (path, position, offset) in zip(objects, positions):
+            obj.offset = offset
+            aggregations.append([(path.pk, position, position, 0)])
+        return cls.bulk_create(objects, aggregations, geoms=points)
+
+    @classmethod
+    def bulk_create_lines(cls, objects, lines, processes=1):
+        """
+        Save new linear topologies, matched on the paths network along their line
+        (see ``PathRouter.match()``), then created with ``bulk_create()``.
+
+        Objects can also be models with a ``topology`` foreign key (e.g. interventions):
+        plain topologies are then created, and objects saved in bulk.
+
+        Lines are matched in parallel if ``processes`` is greater than 1.
+        Raises ``ValueError`` if one of the lines cannot be matched.
+        """
+        from .models import Topology
+
+        objects = list(objects)
+        if not objects:
+            return objects
+        lines = [l.transform(settings.SRID, clone=True) for l in lines]
+        # Snap all vertices at once
+        vertices = [Point(*c[:2], srid=settings.SRID) for l in lines for c in l.coords]
+        snapped = [(path.pk, position) for path, position, offset
+                   in PathHelper.closest_positions(vertices)]
+        steps = []
+        i = 0
+        for line in lines:
+            steps.append(snapped[i:i + len(line)])
+            i += len(line)
+
+        global _router
+        _router = get_router()
+        if processes > 1:
+            # Forked workers only use the router (no database access)
+            pool = multiprocessing.Pool(processes)
+            try:
+                matched = pool.map(_match_steps, steps)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            matched = map(_match_steps, steps)
+        for i, subtopology in enumerate(matched):
+            if subtopology is None:
+                raise ValueError("Line %s could not be matched on paths network" % i)
+        aggregations = [cls.aggregations([subtopology]) for subtopology in matched]
+
+        if isinstance(objects[0], Topology):
+            return cls.bulk_create(objects, aggregations)
+        with transaction.atomic():
+            topologies = cls.bulk_create([Topology() for obj in objects], aggregations)
+            for obj, topology in zip(objects, topologies):
+                obj.topology = topology
+            objects[0].__class__.objects.bulk_create(objects)
+        return objects
+
+    @classmethod
+    @contextmanager
+    def deferred_geometry(cls):
+        """
+        Within this block, triggers do not compute the geometry of topologies each
+        time one of their path aggregations changes. Affected topologies are
+        collected (in a session temporary table, see ``evenement_geometry_deferred()``
+        in SQL), and their geometry is computed once when leaving the block.
+
+        Blocks can be nested, only the outermost one computes geometries.
+        """
+        if cls.geometry_deferred():
+            yield
+            return
+        with transaction.atomic():
+            cursor = connection.cursor()
+            cursor.execute("CREATE TEMPORARY TABLE tmp_evenements_differes"
+                           " (evenement integer PRIMARY KEY)")
+            _deferred.active = True
+            try:
+                yield
+                cls.flush_deferred_geometry()
+            finally:
+                _deferred.active = False
+            cursor.execute("DROP TABLE tmp_evenements_differes")
+
+    @classmethod
+    def geometry_deferred(cls):
+        return getattr(_deferred, 'active', False)
+
+    @classmethod
+    def flush_deferred_geometry(cls, pks=None):
+        """
+        Compute now the geometry of topologies (all or specified ones) whose
+        computation was deferred.
+        """
+        if not cls.geometry_deferred():
+            return
+        where, params = '', []
+        if pks is not None:
+            where, params = 'WHERE evenement = ANY(%s)', [list(pks)]
+        cursor = connection.cursor()
+        cursor.execute("""
+            WITH flushed AS (DELETE FROM tmp_evenements_differes %s RETURNING evenement)
+            SELECT update_geometry_of_evenement(evenement) FROM flushed""" % where, params)
+
     @classmethod
     def _topologypoint(cls, lng, lat, kind=None, snap=None):
         """
@@ -227,11 +447,12 @@ class TopologyHelper(object):
                             WHERE a.troncon = p.id
                             ORDER BY a.ordre)
         -- Retrieve primary keys
+        -- (intervals overlap is obtained from index, see e_r_evenement_troncon_interval_idx)
         SELECT t.id
         FROM %(topology_table)s t, %(aggregations_table)s a, paths_aggr pa
         WHERE a.troncon = pa.id AND a.evenement = t.id
-          AND least(a.pk_debut, a.pk_fin) <= greatest(pa.start, pa.end)
-          AND greatest(a.pk_debut, a.pk_fin) >= least(pa.start, pa.end)
+          AND box(point(a.troncon, least(a.pk_debut, a.pk_fin)), point(a.troncon, greatest(a.pk_debut, a.pk_fin)))
+           && box(point(pa.id, least(pa.start, pa.end)), point(pa.id, greatest(pa.start, pa.end)))
           AND %(extra_condition)s
         ORDER BY (pa.order + CASE WHEN pa.start > pa.end THEN (1 - a.pk_debut) ELSE a.pk_debut END);
         """ % {
@@ -247,51 +468,240 @@ class TopologyHelper(object):
         result = cursor.fetchall()
         pk_list = uniquify([row[0] for row in result])
 
-        # Return a QuerySet and preserve pk list order
-        # http://stackoverflow.com/a/1310188/141895
-        ordering = 'CASE %s END' % ' '.join(['WHEN %s.id=%s THEN %s' % (Topology._meta.db_table, id_, i)
-                                             for i, id_ in enumerate(pk_list)])
-        queryset = all_objects.filter(pk__in=pk_list).extra(
-            select={'ordering': ordering}, order_by=('ordering',))
-        return queryset
+        return cls._ordered_queryset(all_objects, pk_list)
+
+    @classmethod
+    def _ordered_queryset(cls, queryset, pk_list):
+        """ Return a QuerySet of the pk list, preserving its order.
+        """
+        from .models import Topology
+
+        # Rows positions are looked up by binary search (see ft_sorted_position)
+        positions = {}
+        for i, pk in enumerate(pk_list):
+            positions.setdefault(pk, i)
+        keys = sorted(positions)
+        ordering = 'ft_sorted_position(%%s::integer[], %%s::integer[], %s.id)' % Topology._meta.db_table
+        return queryset.filter(pk__in=pk_list).extra(
+            select={'ordering': ordering}, select_params=[keys, [positions[pk] for pk in keys]],
+            order_by=('ordering',))
+
+    @classmethod
+    def overlapping_map(cls, klass, topologies):
+        """
+        Bulk version of ``overlapping()``, with a single query: return a dict
+        giving, for each of the specified topologies (queryset or list of pks),
+        the list of pks of ``klass`` objects overlapping it (in order of progression).
+        """
+        from .models import Topology, PathAggregation
+
+        if isinstance(topologies, QuerySet):
+            topologies = topologies.values_list('pk', flat=True)
+        topology_pks = [int(pk) for pk in topologies]
+        if len(topology_pks) == 0:
+            return {}
+
+        is_generic = klass.KIND == Topology.KIND
+        sql = """
+        WITH sources AS (SELECT a.evenement AS source, a.troncon AS path, a.pk_debut AS start,
+                                a.pk_fin AS end, a.ordre AS order
+                         FROM %(aggregations_table)s a
+                         WHERE a.evenement = ANY(%%s))
+        SELECT s.source, t.id
+        FROM %(topology_table)s t, %(aggregations_table)s a, sources s
+        WHERE a.troncon = s.path AND a.evenement = t.id
+          AND box(point(a.troncon, least(a.pk_debut, a.pk_fin)), point(a.troncon, greatest(a.pk_debut, a.pk_fin)))
+           && box(point(s.path, least(s.start, s.end)), point(s.path, greatest(s.start, s.end)))
+          AND NOT t.supprime
+          AND %(extra_condition)s
+        ORDER BY s.source, (s.order + CASE WHEN s.start > s.end THEN (1 - a.pk_debut) ELSE a.pk_debut END);
+        """ % {
+            'topology_table': Topology._meta.db_table,
+            'aggregations_table': PathAggregation._meta.db_table,
+            'extra_condition': 'true' if is_generic else "kind = '%s'" % klass.KIND
+        }
+
+        cursor = connection.cursor()
+        cursor.execute(sql, [topology_pks])
+        result = {}
+        for source, pk in cursor.fetchall():
+            result.setdefault(source, []).append(pk)
+        return dict([(source, uniquify(pks)) for source, pks in result.items()])
+
+    @classmethod
+    def overlapping_prefetcher(cls, klass, *related):
+        """
+        Return a function computing ``klass.overlapping()`` for a list of
+        topologies at once (see ``add_property()``).
+        """
+        def prefetch(topologies):
+            if not settings.TREKKING_TOPOLOGY_ENABLED:
+                return None
+            by_topology = cls.overlapping_map(klass, [t.pk for t in topologies])
+            all_objects = klass.objects.existing().select_related(*related)
+            pks = set(chain(*by_topology.values()))
+            by_pk = dict([(o.pk, o) for o in all_objects.filter(pk__in=pks)])
+            result = {}
+            for topology in topologies:
+                pk_list = [pk for pk in by_topology.get(topology.pk, []) if pk in by_pk]
+                queryset = cls._ordered_queryset(all_objects, pk_list)
+                result[topology.pk] = cached_queryset(queryset, [by_pk[pk] for pk in pk_list])
+            return result
+        return prefetch
 
 
 class PathHelper(object):
+    @classmethod
+    def related_prefetcher(cls, queryset, lookup='aggregations__path'):
+        """
+        Return a function computing, for a list of paths at once, the objects
+        of queryset related to each of them (see ``add_property()``).
+        """
+        def prefetch(paths):
+            pairs = queryset.filter(**{'%s__in' % lookup: [p.pk for p in paths]})\
+                            .values_list(lookup, 'pk')
+            by_path = {}
+            for path_pk, pk in pairs:
+                by_path.setdefault(path_pk, set()).add(pk)
+            pks = set(chain(*by_path.values()))
+            by_pk = dict([(o.pk, o) for o in queryset.filter(pk__in=pks)])
+            result = {}
+            for path in paths:
+                pk_list = sorted(by_path.get(path.pk, []))
+                result[path.pk] = cached_queryset(queryset.filter(pk__in=pk_list),
+                                                  [by_pk[pk] for pk in pk_list])
+            return result
+        return prefetch
+
+    @classmethod
+    def _transformed(cls, path, points):
+        for point in points:
+            if point.srid != path.geom.srid:
+                point.transform(path.geom.srid)
+        return points
+
     @classmethod
     def snap(cls, path, point):
-        if not path.pk:
-            raise ValueError("Cannot compute snap on unsaved path")
-        if point.srid != path.geom.srid:
-            point.transform(path.geom.srid)
-        cursor = connection.cursor()
-        sql = """
-        WITH p AS (SELECT ST_ClosestPoint(geom, '%(ewkt)s'::geometry) AS geom
-                   FROM %(table)s
-                   WHERE id = '%(pk)s')
-        SELECT ST_X(p.geom), ST_Y(p.geom) FROM p
-        """ % {'ewkt': point.ewkt, 'table': path._meta.db_table, 'pk': path.pk}
-        cursor.execute(sql)
-        result = cursor.fetchall()
-        return Point(*result[0], srid=path.geom.srid)
+        return cls.snap_points(path, [point])[0]
+
+    @classmethod
+    def snap_points(cls, path, points):
+        """
+        Returns the points snapped (i.e closest) to the path geometry, computed
+        in-process like ``ST_ClosestPoint()``.
+        """
+        if path.geom is None:
+            raise ValueError("Cannot compute snap on path without geometry")
+        points = cls._transformed(path, points)
+        reference = LinearReference(path.geom)
+        return [Point(*coords, srid=path.geom.srid)
+                for coords in reference.snap_points(points)]
 
     @classmethod
     def interpolate(cls, path, point):
-        if not path.pk:
-            raise ValueError("Cannot compute interpolation on unsaved path")
-        if point.srid != path.geom.srid:
-            point.transform(path.geom.srid)
+        return cls.interpolate_points(path, [point])[0]
+
+    @classmethod
+    def interpolate_points(cls, path, points):
+        """
+        Returns the list of position ([0.0-1.0]) and offset (distance) of points
+        along the path, computed in-process like ``ST_InterpolateAlong()``.
+        """
+        if path.geom is None:
+            raise ValueError("Cannot compute interpolation on path without geometry")
+        points = cls._transformed(path, points)
+        return LinearReference(path.geom).locate_points(points)
+
+    @classmethod
+    def closest_pks(cls, points, candidates=8, batch_size=1000):
+        """
+        Returns the pk of the closest path of each point (``None`` if there is no path).
+
+        Candidates are obtained with the KNN index on bounding boxes (``<#>`` operator).
+        Since the distance to a box is a lower bound of the distance to the path, the
+        result is exact as soon as the farthest candidate box is farther than the
+        closest candidate path. Otherwise, the search is widened for this point.
+        """
+        coords = []
+        for point in points:
+            if point.srid != settings.SRID:
+                point = point.transform(settings.SRID, clone=True)
+            coords.append((point.x, point.y))
+
+        result = [None] * len(coords)
+        pending = range(len(coords))
+        while pending:
+            unsure = []
+            for i in xrange(0, len(pending), batch_size):
+                batch = pending[i:i + batch_size]
+                rows = cls._closest_candidates([coords[j] for j in batch], candidates)
+                for j, (pk, distance, farthest, count) in zip(batch, rows):
+                    result[j] = pk
+                    if pk is not None and count >= candidates and distance > farthest:
+                        unsure.append(j)
+            pending = unsure
+            candidates *= 4
+        return result
+
+    @classmethod
+    def _closest_candidates(cls, coords, candidates):
+        """
+        Returns, for each point, the closest of the candidate paths, its distance,
+        the distance to the farthest candidate box and the number of candidates.
+        """
         cursor = connection.cursor()
-        sql = """
-        SELECT position, distance
-        FROM ft_troncon_interpolate(%(pk)s, ST_GeomFromText('POINT(%(x)s %(y)s)',%(srid)s))
-             AS (position FLOAT, distance FLOAT)
-        """ % {'pk': path.pk,
-               'x': point.x,
-               'y': point.y,
-               'srid': path.geom.srid}
-        cursor.execute(sql)
-        result = cursor.fetchall()
-        return result[0]
+        cursor.execute("""
+            WITH points AS (
+                SELECT n, ST_SetSRID(ST_MakePoint((%(xs)s::float[])[n], (%(ys)s::float[])[n]), %(srid)s) AS geom
+                FROM generate_series(1, %(count)s) AS n
+            )
+            SELECT (SELECT ARRAY[c.id, ST_Distance(c.geom, points.geom),
+                                 MAX(c.box) OVER (), COUNT(*) OVER ()]
+                    FROM (SELECT t.id, t.geom, t.geom <#> points.geom AS box
+                          FROM l_t_troncon t
+                          ORDER BY t.geom <#> points.geom
+                          LIMIT %(candidates)s) AS c
+                    ORDER BY ST_Distance(c.geom, points.geom), c.id
+                    LIMIT 1)
+            FROM points
+            ORDER BY n""", {'xs': [x for x, y in coords],
+                            'ys': [y for x, y in coords],
+                            'srid': settings.SRID,
+                            'count': len(coords),
+                            'candidates': candidates})
+        rows = []
+        for (closest,) in cursor.fetchall():
+            if closest is None:
+                rows.append((None, None, None, 0))
+            else:
+                pk, distance, farthest, count = closest
+                rows.append((int(pk), distance, farthest, int(count)))
+        return rows
+
+    @classmethod
+    def closest_positions(cls, points):
+        """
+        Returns the closest path of each point, along with the position and offset
+        of the point on it (see ``interpolate()``). Paths are fetched in one query.
+        """
+        from .models import Path
+
+        points = [p if p.srid == settings.SRID else p.transform(settings.SRID, clone=True)
+                  for p in points]
+        pks = cls.closest_pks(points)
+        if None in pks:
+            raise Path.DoesNotExist("No path to snap points on")
+        paths = Path.objects.in_bulk(set(pks))
+        by_path = {}
+        for i, pk in enumerate(pks):
+            by_path.setdefault(pk, []).append(i)
+        result = [None] * len(points)
+        for pk, indices in by_path.items():
+            path = paths[pk]
+            located = cls.interpolate_points(path, [points[i] for i in indices])
+            for i, (position, offset) in zip(indices, located):
+                result[i] = (path, position, offset)
+        return result
 
     @classmethod
     def disjoint(cls, geom, pk):
@@ -303,3 +713,152 @@ class PathHelper(object):
         wkt = "ST_GeomFromText('%s', %s)" % (geom, settings.SRID)
         disjoint = sqlfunction('SELECT * FROM check_path_not_overlap', str(pk), wkt)
         return disjoint[0]
+
+    @classmethod
+    def split_paths(cls, pks):
+        """
+        Split paths where they cross each other or other paths, each one once
+        at all its crossings (see ``ft_split_troncons()`` in SQL), instead of
+        recursively by the split trigger. Returns the number of paths created.
+        """
+        with TopologyHelper.deferred_geometry():
+            cursor = connection.cursor()
+            cursor.execute("SELECT ft_split_troncons(%s)", [list(pks)])
+            return cursor.fetchone()[0]
+
+    @classmethod
+    @contextmanager
+    def deferred_split(cls):
+        """
+        Within this block, paths are not split by the trigger when created or
+        modified. They are recorded (in a session temporary table, see
+        ``troncon_split_deferred()`` in SQL), and split at once when leaving
+        the block (see ``split_paths()``).
+
+        Blocks can be nested, only the outermost one splits paths.
+        """
+        if cls.split_deferred():
+            yield
+            return
+        with transaction.atomic():
+            cursor = connection.cursor()
+            cursor.execute("CREATE TEMPORARY TABLE tmp_troncons_differes"
+                           " (troncon integer PRIMARY KEY)")
+            _deferred.split = True
+            try:
+                yield
+            finally:
+                _deferred.split = False
+            cursor.execute("WITH deferred AS (DELETE FROM tmp_troncons_differes RETURNING troncon)"
+                           " SELECT troncon FROM deferred")
+            pks = [pk for pk, in cursor.fetchall()]
+            if pks:
+                cls.split_paths(pks)
+            cursor.execute("DROP TABLE tmp_troncons_differes")
+
+    @classmethod
+    def split_deferred(cls):
+        return getattr(_deferred, 'split', False)
+
+    @classmethod
+    @contextmanager
+    def import_session(cls):
+        """
+        Within this block, paths are not snapped, split, draped nor intersected
+        with land layers by triggers when created or modified. They are recorded
+        (in a session temporary table, see ``troncon_import_deferred()`` in SQL),
+        and processed at once when leaving the block, by a few set-based statements
+        (see ``process_imported()``). Meant for bulk imports (see ``loadpaths`` command).
+
+        The list given by the block is filled with processed paths when leaving it.
+        Blocks can be nested, only the outermost one processes paths.
+        """
+        if cls.import_deferred():
+            yield []
+            return
+        with transaction.atomic():
+            with TopologyHelper.deferred_geometry():
+                cursor = connection.cursor()
+                cursor.execute("CREATE TEMPORARY TABLE tmp_troncons_importes"
+                               " (troncon integer PRIMARY KEY)")
+                _deferred.imported = True
+                imported = []
+                try:
+                    yield imported
+                finally:
+                    _deferred.imported = False
+                imported.extend(cls.process_imported())
+                cursor.execute("DROP TABLE tmp_troncons_importes")
+
+    @classmethod
+    def import_deferred(cls):
+        return getattr(_deferred, 'imported', False)
+
+    @classmethod
+    def imported_pks(cls):
+        """ Paths created or modified within the current import session. """
+        cursor = connection.cursor()
+        cursor.execute("SELECT troncon FROM tmp_troncons_importes ORDER BY troncon")
+        return [pk for pk, in cursor.fetchall()]
+
+    @classmethod
+    def process_imported(cls):
+        """
+        Do for all paths of the import session what their triggers would have
+        done: snap extremities, split crossings, drape on DEM, and then let
+        receivers of ``paths_imported`` signal compute their data (e.g. land
+        layers edges). Returns the paths processed.
+        """
+        pks = cls.imported_pks()
+        if not pks:
+            return []
+        cursor = connection.cursor()
+        # Same as troncons_snap_extremities() trigger, only snapped paths are updated
+        cursor.execute("""
+            UPDATE l_t_troncon t SET geom = s.geom
+            FROM (SELECT id, ft_troncon_snap_extremities(id, geom) AS geom
+                  FROM l_t_troncon WHERE id = ANY(%s) OFFSET 0) AS s
+            WHERE t.id = s.id AND NOT ST_OrderingEquals(t.geom, s.geom)""", [pks])
+        cls.split_paths(pks)
+        # Including paths created or shrunk when splitting
+        pks = cls.imported_pks()
+        cursor.execute(REDRAPE_SQL.format(table='l_t_troncon'), [pks])
+        paths_imported.send(sender=cls, pks=pks)
+        # Geometry of topologies on these paths depends on their 3D geometry
+        cursor.execute("""
+            SELECT evenement_geometry_deferred(evenement)
+            FROM (SELECT DISTINCT evenement FROM e_r_evenement_troncon
+                  WHERE troncon = ANY(%s)) AS e""", [pks])
+        return pks
+
+    @classmethod
+    def check_imported(cls, pks):
+        """
+        Returns the paths (among ``pks``) whose state differs from the one
+        triggers give: extremities not snapped, crossings not split, no
+        elevation, or data of ``check_imported_paths`` signal receivers.
+        """
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT id FROM l_t_troncon
+            WHERE id = ANY(%s)
+              AND (geom_3d IS NULL OR NOT ST_OrderingEquals(geom, ft_troncon_snap_extremities(id, geom)))
+            UNION
+            SELECT id FROM (
+                SELECT t.id, t.geom AS geom1, o.geom AS geom2,
+                       (ST_Dump(ST_Intersection(t.geom, o.geom))).geom AS point
+                FROM l_t_troncon t, l_t_troncon o
+                WHERE t.id = ANY(%s) AND t.id != o.id AND t.geom && o.geom
+                  AND ST_Intersects(t.geom, o.geom)
+                  AND NOT ST_Relate(t.geom, o.geom, 'FF*F*****')) AS crossings
+            -- Like ft_split_troncons(), ignore crossings less than 1m from extremities
+            WHERE GeometryType(point) = 'POINT'
+              AND ((ST_Line_Locate_Point(geom1, point) * ST_Length(geom1) >= 1 AND
+                    (1 - ST_Line_Locate_Point(geom1, point)) * ST_Length(geom1) >= 1) OR
+                   (ST_Line_Locate_Point(geom2, point) * ST_Length(geom2) >= 1 AND
+                    (1 - ST_Line_Locate_Point(geom2, point)) * ST_Length(geom2) >= 1))""",
+                       [list(pks), list(pks)])
+        invalid = set(pk for pk, in cursor.fetchall())
+        for receiver, response in check_imported_paths.send(sender=cls, pks=pks):
+            invalid.update(response or [])
+        return sorted(invalid)
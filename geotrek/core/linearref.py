@@ -0,0 +1,79 @@
+"""
+Linear referencing on paths geometries, computed in-process.
+
+Results match those of the SQL functions used in triggers:
+``ST_Line_Locate_Point()``, ``ST_ClosestPoint()`` and ``ST_InterpolateAlong()``
+(see ``00_utilities.sql``), without a database round trip per point.
+"""
+import math
+
+
+# Side offsets below this distance are rounded to 0 (see ST_InterpolateAlong)
+SIDE_OFFSET_ROUNDING = 0.1
+
+
+class LinearReference(object):
+    """
+    Segments of a line geometry, prepared for locating many points on it.
+
+    Like PostGIS, a point is located on the first of the closest segments.
+    """
+    def __init__(self, line):
+        coords = [c[:2] for c in line.coords]
+        self.srid = line.srid
+        self.segments = []
+        self.length = 0.0
+        for (ax, ay), (bx, by) in zip(coords[:-1], coords[1:]):
+            dx, dy = bx - ax, by - ay
+            self.segments.append((ax, ay, dx, dy, dx * dx + dy * dy, self.length))
+            self.length += math.sqrt(dx * dx + dy * dy)
+
+    def closest(self, x, y):
+        """
+        Returns ``(squared distance, segment, projected x, projected y)`` of
+        the closest point of line.
+        """
+        best = None
+        for ax, ay, dx, dy, length2, start in self.segments:
+            if length2 == 0:
+                t = 0.0
+            else:
+                t = ((x - ax) * dx + (y - ay) * dy) / length2
+                t = min(max(t, 0.0), 1.0)
+            px, py = ax + t * dx, ay + t * dy
+            distance2 = (x - px) ** 2 + (y - py) ** 2
+            if best is None or distance2 < best[0]:
+                best = (distance2, (ax, ay, dx, dy, length2, start), px, py)
+                if distance2 == 0:
+                    break
+        return best
+
+    def locate(self, x, y):
+        """
+        Returns ``(position, side offset, closest point coords)`` of a point,
+        where position is in [0.0-1.0] and offset is positive on the left side.
+        """
+        distance2, segment, px, py = self.closest(x, y)
+        ax, ay, dx, dy, length2, start = segment
+        if self.length > 0:
+            position = (start + math.sqrt((px - ax) ** 2 + (py - ay) ** 2)) / self.length
+        else:
+            position = 0.0
+        offset = math.sqrt(distance2)
+        if offset < SIDE_OFFSET_ROUNDING:
+            offset = 0.0
+        elif dx * (y - py) - dy * (x - px) < 0:
+            offset = -offset
+        return min(position, 1.0), offset, (px, py)
+
+    def locate_points(self, points):
+        """
+        Returns the list of ``(position, side offset)`` of points.
+        """
+        return [self.locate(*p.coords[:2])[:2] for p in points]
+
+    def snap_points(self, points):
+        """
+        Returns the list of closest coords of points on line.
+        """
+        return [self.closest(*p.coords[:2])[2:] for p in points]
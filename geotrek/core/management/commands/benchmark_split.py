@@ -0,0 +1,58 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.contrib.gis.geos import LineString
+
+from geotrek.common.utils.benchmark import ROLLBACK_HELP, origin, rolled_back, timed
+from geotrek.core.factories import PathFactory
+from geotrek.core.helpers import PathHelper
+from geotrek.core.models import Path
+
+
+class Command(BaseCommand):
+    help = 'Measure creation time of a grid of crossing paths, split recursively\n'
+    help += 'by the trigger or at once when created (see PathHelper.deferred_split).\n'
+    help += ROLLBACK_HELP
+    can_import_settings = True
+
+    option_list = BaseCommand.option_list + (
+        make_option('--size',
+                    type='int',
+                    default=10,
+                    help='Number of paths in each direction (default: 10).'),
+    )
+
+    def create_grid(self, size):
+        # Horizontal and vertical paths, from a corner of spatial extent
+        x, y = origin()
+        step = 100
+        for i in range(1, size + 1):
+            PathFactory.create(geom=LineString((x, y + i * step),
+                                               (x + (size + 1) * step, y + i * step),
+                                               srid=settings.SRID))
+            PathFactory.create(geom=LineString((x + i * step, y),
+                                               (x + i * step, y + (size + 1) * step),
+                                               srid=settings.SRID))
+
+    def create_deferred_grid(self, size):
+        with PathHelper.deferred_split():
+            self.create_grid(size)
+
+    def handle(self, *args, **options):
+        size = options['size']
+        existing = Path.objects.count()
+
+        with rolled_back():
+            trigger_duration, _ = timed(self.create_grid, size)
+            trigger_count = Path.objects.count() - existing
+
+        with rolled_back():
+            deferred_duration, _ = timed(self.create_deferred_grid, size)
+            deferred_count = Path.objects.count() - existing
+
+        assert trigger_count == deferred_count
+        self.stdout.write('Grid of %sx%s paths (%s paths once split)\n' % (size, size, trigger_count))
+        self.stdout.write('Split by trigger: %.3f s\n' % trigger_duration)
+        self.stdout.write('Deferred split: %.3f s (x%.1f)\n' % (deferred_duration,
+                                                              trigger_duration / deferred_duration))
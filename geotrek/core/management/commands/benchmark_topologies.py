@@ -0,0 +1,54 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.contrib.gis.geos import LineString
+
+from geotrek.common.utils.benchmark import ROLLBACK_HELP, origin, rolled_back, timed
+from geotrek.core.factories import PathFactory, TopologyFactory
+from geotrek.core.helpers import TopologyHelper
+
+
+class Command(BaseCommand):
+    help = 'Measure topologies creation time, with geometry computed by triggers\n'
+    help += 'for each path aggregation or deferred (computed once).\n'
+    help += ROLLBACK_HELP
+    can_import_settings = True
+
+    option_list = BaseCommand.option_list + (
+        make_option('--paths',
+                    type='int',
+                    default=200,
+                    help='Number of paths of the topology (default: 200).'),
+    )
+
+    def create_topology(self, paths):
+        topology = TopologyFactory.create(no_path=True)
+        for i, path in enumerate(paths):
+            topology.add_path(path, order=i, reload=False)
+        topology.reload()
+        return topology
+
+    def create_deferred_topology(self, paths):
+        with TopologyHelper.deferred_geometry():
+            return self.create_topology(paths)
+
+    def handle(self, *args, **options):
+        nb_paths = options['paths']
+
+        with rolled_back():
+            # A straight line of contiguous paths, from a corner of spatial extent
+            x, y = origin()
+            paths = [PathFactory.create(geom=LineString((x + i * 10, y),
+                                                        (x + (i + 1) * 10, y),
+                                                        srid=settings.SRID))
+                     for i in range(nb_paths)]
+
+            immediate_duration, immediate = timed(self.create_topology, paths)
+            deferred_duration, deferred = timed(self.create_deferred_topology, paths)
+            assert immediate.geom.equals(deferred.geom)
+
+        self.stdout.write('Topology of %s paths\n' % nb_paths)
+        self.stdout.write('Immediate geometry: %.3f s\n' % immediate_duration)
+        self.stdout.write('Deferred geometry: %.3f s (x%.1f)\n' % (deferred_duration,
+                                                                 immediate_duration / deferred_duration))
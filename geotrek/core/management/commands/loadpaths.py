@@ -0,0 +1,71 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.contrib.gis.geos import LineString
+
+from geotrek.common.utils.layers import LoadLayerCommand
+from geotrek.common.utils.postgresql import copy_objects
+from geotrek.core.helpers import PathHelper
+from geotrek.core.models import Path
+
+
+class Command(LoadLayerCommand):
+    args = '<line_layer>'
+    help = 'Load a layer with line geometries as paths.\n'
+    help += 'Paths are copied by batches, then snapped, split, draped and intersected\n'
+    help += 'with land layers all at once (see PathHelper.import_session).\n'
+    help += 'The whole import is done in one transaction.\n'
+
+    option_list = LoadLayerCommand.option_list + (
+        make_option('--batch-size', type='int', dest='batch_size', default=1000,
+                    help='Number of features copied per batch (default: 1000)'),
+        make_option('--check', action='store_true', dest='check', default=False,
+                    help='Check that imported paths are the same as if created one by one '
+                         '(by triggers), and cancel the import otherwise'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Filename missing. See help')
+        filename = args[0]
+
+        layer, count = self.open_layer(filename, options)
+        self.load(layer, count, options.get('batch_size') or 1000, options.get('check'))
+
+    def read_feature(self, feature):
+        geometry = self.read_geometry(feature)
+        if geometry.geom_type == 'MultiLineString':
+            geometry = geometry.merged
+        if not isinstance(geometry, LineString):
+            raise ValueError('Feature %s is not a line' % feature.GetFID())
+        return Path(geom=geometry, **self.read_values(feature))
+
+    def load(self, layer, count, batch_size, check):
+        start = time.time()
+        with transaction.atomic():
+            with PathHelper.import_session() as imported:
+                copied = 0
+                for i in range(0, count, batch_size):
+                    try:
+                        paths = self.read_batch(layer, min(batch_size, count - i))
+                        copy_objects(paths)
+                    except Exception as e:
+                        raise CommandError('Import failed at features %s-%s (%s)'
+                                           % (i, i + batch_size - 1, e))
+                    copied += len(paths)
+                    elapsed = time.time() - start
+                    self.stdout.write('%s/%s paths copied (%.1f paths/s)'
+                                      % (copied, count, copied / max(elapsed, 0.001)))
+                copy_duration = time.time() - start
+            self.stdout.write('%s paths snapped, split, draped and intersected with land layers (%.1f s)'
+                              % (len(imported), time.time() - start - copy_duration))
+
+            if check:
+                invalid = PathHelper.check_imported(imported)
+                if invalid:
+                    raise CommandError('Import cancelled, %s paths differ from triggers result: %s'
+                                       % (len(invalid), ', '.join(str(pk) for pk in invalid)))
+                self.stdout.write('%s paths checked' % len(imported))
+        self.stdout.write('%s paths imported (%.1f s)' % (copied, time.time() - start))
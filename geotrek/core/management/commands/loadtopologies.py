@@ -0,0 +1,76 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import CommandError
+from django.db import models, transaction
+from django.contrib.gis.geos import LineString
+
+from geotrek.common.utils.layers import LoadLayerCommand
+from geotrek.core.helpers import TopologyHelper
+from geotrek.core.models import Topology
+
+
+class Command(LoadLayerCommand):
+    args = '<app_label.ModelName> <line_layer>'
+    help = 'Load a layer with line geometries as topologies of a model (e.g. land.LandEdge).\n'
+    help += 'Lines are matched on the paths network, and objects created by batches.\n'
+
+    option_list = LoadLayerCommand.option_list + (
+        make_option('--batch-size', type='int', dest='batch_size', default=500,
+                    help='Number of features per batch (default: 500)'),
+        make_option('--offset', type='int', dest='offset', default=0,
+                    help='Index of the first feature to import (to resume a failed import)'),
+        make_option('--processes', type='int', dest='processes', default=1,
+                    help='Number of processes matching lines on paths (default: 1)'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 2:
+            raise CommandError('Model and filename are required. See help')
+        modelname, filename = args
+
+        try:
+            app_label, model_name = modelname.split('.')
+        except ValueError:
+            raise CommandError('Model should be given as app_label.ModelName')
+        self.model = models.get_model(app_label, model_name)
+        if self.model is None:
+            raise CommandError('Unknown model %s' % modelname)
+        if not issubclass(self.model, Topology) and 'topology' not in self.model._meta.get_all_field_names():
+            raise CommandError('%s is not a topology' % modelname)
+
+        self.processes = options.get('processes') or 1
+        layer, count = self.open_layer(filename, options)
+        self.load(layer, count, options.get('offset') or 0, options.get('batch_size') or 500)
+
+    def read_feature(self, feature):
+        geometry = self.read_geometry(feature)
+        if geometry.geom_type == 'MultiLineString':
+            geometry = geometry.merged
+        if not isinstance(geometry, LineString):
+            raise ValueError('Feature %s is not a line' % feature.GetFID())
+        return self.model(**self.read_values(feature)), geometry
+
+    def load(self, layer, count, offset, batch_size):
+        """
+        Import features by batches, each one in its own transaction.
+        If a batch fails, previous ones are kept, and the import can be resumed
+        with ``--offset``.
+        """
+        start = time.time()
+        layer.SetNextByIndex(offset)
+        imported = 0
+        for i in range(offset, count, batch_size):
+            try:
+                batch = self.read_batch(layer, min(batch_size, count - i))
+                objects = [obj for obj, line in batch]
+                lines = [line for obj, line in batch]
+                with transaction.atomic():
+                    TopologyHelper.bulk_create_lines(objects, lines, processes=self.processes)
+            except Exception as e:
+                raise CommandError('Import failed at features %s-%s (%s). Resume with --offset=%s'
+                                   % (i, i + batch_size - 1, e, i))
+            imported += len(objects)
+            elapsed = time.time() - start
+            self.stdout.write('%s/%s objects imported (%.1f objects/s)'
+                              % (i + len(objects), count, imported / max(elapsed, 0.001)))
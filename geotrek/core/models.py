@@ -10,7 +10,7 @@ from django.contrib.gis.geos import fromstr, LineString
 from mapentity.models import MapEntityMixin
 
 from geotrek.authent.models import StructureRelated
-from geotrek.common.models import TimeStampedModel, NoDeleteMixin
+from geotrek.common.models import AddPropertyMixin, TimeStampedModel, NoDeleteMixin
 from geotrek.common.utils import classproperty
 from geotrek.common.utils.postgresql import debug_pg_notices
 from geotrek.altimetry.models import AltimetryMixin
@@ -26,7 +26,7 @@ logger = logging.getLogger(__name__)
 # syntax which is not compatible with PostGIS 2.0. That's why index creation
 # is explicitly disbaled here (see manual index creation in custom SQL files).
 
-class Path(MapEntityMixin, AltimetryMixin, TimeStampedModel, StructureRelated):
+class Path(AddPropertyMixin, MapEntityMixin, AltimetryMixin, TimeStampedModel, StructureRelated):
     geom = models.LineStringField(srid=settings.SRID, spatial_index=False)
     geom_cadastre = models.LineStringField(null=True, srid=settings.SRID, spatial_index=False,
                                            editable=False)
@@ -77,10 +77,10 @@ class Path(MapEntityMixin, AltimetryMixin, TimeStampedModel, StructureRelated):
         Returns the closest path of the point.
         Will fail if no path in database.
         """
-        # TODO: move to custom manager
-        if point.srid != settings.SRID:
-            point = point.transform(settings.SRID, clone=True)
-        return cls.objects.all().distance(point).order_by('distance')[0]
+        pk = PathHelper.closest_pks([point])[0]
+        if pk is None:
+            raise cls.DoesNotExist("No path in database")
+        return cls.objects.get(pk=pk)
 
     def is_overlap(self):
         return not PathHelper.disjoint(self.geom, self.pk)
@@ -108,6 +108,12 @@ class Path(MapEntityMixin, AltimetryMixin, TimeStampedModel, StructureRelated):
         """
         return PathHelper.snap(self, point)
 
+    def snap_points(self, points):
+        """
+        Returns the list of points snapped to the path line geometry.
+        """
+        return PathHelper.snap_points(self, points)
+
     def reload(self, fromdb=None):
         # Update object's computed values (reload from database)
         if self.pk:
@@ -159,7 +165,7 @@ class Path(MapEntityMixin, AltimetryMixin, TimeStampedModel, StructureRelated):
         return _("None")
 
 
-class Topology(AltimetryMixin, TimeStampedModel, NoDeleteMixin):
+class Topology(AddPropertyMixin, AltimetryMixin, TimeStampedModel, NoDeleteMixin):
     paths = models.ManyToManyField(Path, editable=False, db_column='troncons', through='PathAggregation', verbose_name=_(u"Path"))
     offset = models.FloatField(default=0.0, db_column='decallage', verbose_name=_(u"Offset"))  # in SRID units
     kind = models.CharField(editable=False, verbose_name=_(u"Kind"), max_length=32)
@@ -184,12 +190,6 @@ class Topology(AltimetryMixin, TimeStampedModel, NoDeleteMixin):
         if not self.pk:
             self.kind = self.__class__.KIND
 
-    @classmethod
-    def add_property(cls, name, func):
-        if hasattr(cls, name):
-            raise AttributeError("%s has already an attribute %s" % (cls, name))
-        setattr(cls, name, property(func))
-
     @classproperty
     def KIND(cls):
         return cls._meta.object_name.upper()
@@ -228,6 +228,12 @@ class Topology(AltimetryMixin, TimeStampedModel, NoDeleteMixin):
         """
         return TopologyHelper.overlapping(cls, topologies)
 
+    @classmethod
+    def overlapping_map(cls, topologies):
+        """ Return a dict of overlapping pks, for each of the specified topologies.
+        """
+        return TopologyHelper.overlapping_map(cls, topologies)
+
     def mutate(self, other, delete=True):
         """
         Take alls attributes of the other topology specified and
@@ -260,6 +266,8 @@ class Topology(AltimetryMixin, TimeStampedModel, NoDeleteMixin):
         Reload into instance all computed attributes in triggers.
         """
         if self.pk:
+            # Geometry computation may have been deferred
+            TopologyHelper.flush_deferred_geometry([self.pk])
             # Update computed values
             fromdb = self.__class__.objects.get(pk=self.pk)
             self.geom = fromdb.geom
@@ -277,6 +285,7 @@ class Topology(AltimetryMixin, TimeStampedModel, NoDeleteMixin):
         # but they can be changed at DB level. Since Django write all fields
         # to DB anyway, it is important to update it before writting
         if self.pk and settings.TREKKING_TOPOLOGY_ENABLED:
+            TopologyHelper.flush_deferred_geometry([self.pk])
             existing = self.__class__.objects.get(pk=self.pk)
             self.length = existing.length
             # In the case of points, the geom can be set by Django. Don't override.
@@ -475,5 +484,7 @@ class Trail(MapEntityMixin, Topology, StructureRelated):
         return cls.objects.filter(aggregations__path=path)
 
 
-Path.add_property('trails', lambda self: Trail.path_trails(self))
-Topology.add_property('trails', lambda self: Trail.overlapping(self))
+Path.add_property('trails', lambda self: Trail.path_trails(self),
+                  prefetch=PathHelper.related_prefetcher(Trail.objects.all()))
+Topology.add_property('trails', lambda self: Trail.overlapping(self),
+                      prefetch=TopologyHelper.overlapping_prefetcher(Trail))
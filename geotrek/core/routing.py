@@ -0,0 +1,280 @@
+"""
+Server-side shortest path computation on the paths network.
+
+The graph produced by :func:`geotrek.core.graph.graph_edges_nodes_of_qs`
+is packed into flat arrays (CSR adjacency), and routes are computed with a
+bidirectional Dijkstra. Results are returned as serialized topologies,
+like those built by ``topology_helper.js`` and accepted by
+:meth:`geotrek.core.helpers.TopologyHelper.deserialize`.
+"""
+import heapq
+import logging
+from array import array
+
+from .graph import graph_edges_nodes_of_qs, PathGraphStore
+
+
+logger = logging.getLogger(__name__)
+
+
+class PathRouter(object):
+    """
+    Compact, read-only representation of the paths graph.
+
+    Nodes and edges are renumbered contiguously, and adjacency is stored
+    in three arrays (``offsets``, ``adjacent_nodes``, ``adjacent_edges``):
+    neighbours of node ``n`` are found between ``offsets[n]`` and
+    ``offsets[n + 1]``.
+    """
+    def __init__(self, graph):
+        edges = graph['edges']
+        node_index = {}
+
+        self.edge_ids = array('l')
+        self.edge_lengths = array('d')
+        self.edge_start = array('l')
+        self.edge_end = array('l')
+        self.edge_index = {}
+
+        for edge_id in sorted(edges.keys()):
+            edge = edges[edge_id]
+            start, end = edge['nodes_id']
+            self.edge_index[edge['id']] = len(self.edge_ids)
+            self.edge_ids.append(edge['id'])
+            self.edge_lengths.append(edge['length'])
+            self.edge_start.append(node_index.setdefault(start, len(node_index)))
+            self.edge_end.append(node_index.setdefault(end, len(node_index)))
+
+        nb_nodes = len(node_index)
+        degrees = array('l', [0] * (nb_nodes + 1))
+        for start, end in zip(self.edge_start, self.edge_end):
+            degrees[start + 1] += 1
+            if start != end:
+                degrees[end + 1] += 1
+        self.offsets = array('l', [0] * (nb_nodes + 1))
+        for n in xrange(nb_nodes):
+            self.offsets[n + 1] = self.offsets[n] + degrees[n + 1]
+
+        nb_adjacent = self.offsets[nb_nodes]
+        self.adjacent_nodes = array('l', [0] * nb_adjacent)
+        self.adjacent_edges = array('l', [0] * nb_adjacent)
+        cursor = array('l', self.offsets[:-1])
+        for i, (start, end) in enumerate(zip(self.edge_start, self.edge_end)):
+            self.adjacent_nodes[cursor[start]] = end
+            self.adjacent_edges[cursor[start]] = i
+            cursor[start] += 1
+            if start != end:
+                self.adjacent_nodes[cursor[end]] = start
+                self.adjacent_edges[cursor[end]] = i
+                cursor[end] += 1
+
+    @classmethod
+    def from_queryset(cls, qs):
+        return cls(graph_edges_nodes_of_qs(qs))
+
+    def __len__(self):
+        return len(self.edge_ids)
+
+    def _seeds(self, path, position):
+        """
+        Return the graph nodes reachable from a position on a path,
+        along with the cost to reach them.
+        """
+        try:
+            i = self.edge_index[path]
+        except KeyError:
+            raise ValueError("Unknown path %s" % path)
+        if not 0.0 <= position <= 1.0:
+            raise ValueError("Invalid position %s on path %s" % (position, path))
+        length = self.edge_lengths[i]
+        return [(self.edge_start[i], position * length),
+                (self.edge_end[i], (1.0 - position) * length)]
+
+    def _neighbours(self, node):
+        for k in xrange(self.offsets[node], self.offsets[node + 1]):
+            yield self.adjacent_nodes[k], self.adjacent_edges[k]
+
+    def shortest_path(self, source, target):
+        """
+        Bidirectional Dijkstra between two lists of ``(node, initial cost)``.
+
+        Returns ``(cost, source node, edges, target node)`` where ``edges`` is
+        the list of ``(edge index, from node, to node)`` traversed, or ``None``
+        if target cannot be reached.
+        """
+        dists = ({}, {})
+        preds = ({}, {})
+        heaps = ([], [])
+        visited = (set(), set())
+        best, meeting = float('inf'), None
+
+        for side, seeds in enumerate((source, target)):
+            for node, cost in seeds:
+                if cost < dists[side].get(node, float('inf')):
+                    dists[side][node] = cost
+                    preds[side][node] = None
+                    heapq.heappush(heaps[side], (cost, node))
+        for node, cost in dists[0].items():
+            if node in dists[1] and cost + dists[1][node] < best:
+                best, meeting = cost + dists[1][node], node
+
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            # Expand the smallest frontier
+            side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+            dist, other_dist = dists[side], dists[1 - side]
+            cost, node = heapq.heappop(heaps[side])
+            if node in visited[side]:
+                continue
+            visited[side].add(node)
+            for neighbour, edge in self._neighbours(node):
+                new_cost = cost + self.edge_lengths[edge]
+                if new_cost < dist.get(neighbour, float('inf')):
+                    dist[neighbour] = new_cost
+                    preds[side][neighbour] = (node, edge)
+                    heapq.heappush(heaps[side], (new_cost, neighbour))
+                if neighbour in other_dist:
+                    candidate = dist[neighbour] + other_dist[neighbour]
+                    if candidate < best:
+                        best, meeting = candidate, neighbour
+
+        if meeting is None:
+            return None
+
+        forward = []
+        node = meeting
+        while preds[0][node] is not None:
+            previous, edge = preds[0][node]
+            forward.append((edge, previous, node))
+            node = previous
+        forward.reverse()
+        source_node = node
+
+        backward = []
+        node = meeting
+        while preds[1][node] is not None:
+            following, edge = preds[1][node]
+            backward.append((edge, node, following))
+            node = following
+        target_node = node
+
+        return best, source_node, forward + backward, target_node
+
+    def _edge_positions(self, edge, from_node):
+        """ Positions of a full path, according to traversal direction."""
+        if self.edge_start[edge] == from_node:
+            return (0.0, 1.0)
+        return (1.0, 0.0)
+
+    def route(self, start, end):
+        """
+        Compute the shortest route between two ``(path, position)`` and
+        return it as a serialized sub-topology (``paths`` and ``positions``).
+        Returns ``None`` if no route exists.
+        """
+        (start_path, start_position), (end_path, end_position) = start, end
+        source = self._seeds(start_path, start_position)
+        target = self._seeds(end_path, end_position)
+
+        if start_path == end_path:
+            return {'offset': 0,
+                    'paths': [start_path],
+                    'positions': {'0': (start_position, end_position)}}
+
+        result = self.shortest_path(source, target)
+        if result is None:
+            return None
+        cost, source_node, steps, target_node = result
+
+        i_start = self.edge_index[start_path]
+        i_end = self.edge_index[end_path]
+
+        paths = [start_path]
+        positions = [(start_position, 0.0 if source_node == self.edge_start[i_start] else 1.0)]
+        for edge, from_node, to_node in steps:
+            paths.append(self.edge_ids[edge])
+            positions.append(self._edge_positions(edge, from_node))
+        paths.append(end_path)
+        positions.append((0.0 if target_node == self.edge_start[i_end] else 1.0, end_position))
+
+        # Drop empty extremities (when steps are exactly on graph nodes)
+        if positions[-1][0] == positions[-1][1]:
+            paths.pop()
+            positions.pop()
+        if len(paths) > 1 and positions[0][0] == positions[0][1]:
+            paths.pop(0)
+            positions.pop(0)
+
+        return {'offset': 0,
+                'paths': paths,
+                'positions': dict((str(i), p) for i, p in enumerate(positions))}
+
+    def route_steps(self, steps):
+        """
+        Route through a list of ``(path, position)`` steps (start, waypoints, end).
+        Returns a serialized topology (one sub-topology per leg), or ``None``
+        if one of the legs cannot be routed.
+        """
+        if len(steps) < 2:
+            raise ValueError("At least two steps are required")
+        topology = []
+        for start, end in zip(steps[:-1], steps[1:]):
+            subtopology = self.route(start, end)
+            if subtopology is None:
+                return None
+            topology.append(subtopology)
+        return topology
+
+    def match(self, steps):
+        """
+        Match a line on the paths network, given the ``(path, position)`` of its
+        vertices: vertices are routed one after the other, and the legs are merged
+        into a single serialized sub-topology (without intermediary markers).
+        Returns ``None`` if the line cannot be matched.
+        """
+        steps = [step for i, step in enumerate(steps) if i == 0 or step != steps[i - 1]]
+        if len(steps) < 2:
+            return None
+        legs = self.route_steps(steps)
+        if legs is None:
+            return None
+        paths, positions = [], []
+        for leg in legs:
+            for i, path in enumerate(leg['paths']):
+                start, end = leg['positions'].get(str(i), (0.0, 1.0))
+                if paths and paths[-1] == path and positions[-1][1] == start:
+                    previous = positions[-1]
+                    # Continue on the same path, in the same direction
+                    if (previous[1] - previous[0]) * (end - start) >= 0:
+                        positions[-1] = (previous[0], end)
+                        continue
+                paths.append(path)
+                positions.append((start, end))
+        # Remove empty parts (when changing of path on a graph node)
+        parts = [(path, position) for path, position in zip(paths, positions)
+                 if position[0] != position[1]] or [(paths[0], positions[0])]
+        return {'offset': 0,
+                'paths': [path for path, position in parts],
+                'positions': dict((str(i), position) for i, (path, position) in enumerate(parts))}
+
+
+_router_cache = {}
+
+
+def get_router():
+    """
+    Return a router on the whole paths network, rebuilt only
+    when paths were modified (or deleted), according to the
+    paths changes table (see ``PathGraphStore``).
+    """
+    from .models import Path
+    version = PathGraphStore.current_version()
+    cached = _router_cache.get('router')
+    if cached is not None:
+        cache_version, router = cached
+        if cache_version == version:
+            return router
+    router = PathRouter.from_queryset(Path.objects.all())
+    _router_cache['router'] = (version, router)
+    return router
@@ -0,0 +1,11 @@
+from django.dispatch import Signal
+
+
+# Sent when leaving ``PathHelper.import_session()``, once imported paths are
+# snapped, split and draped: receivers compute their data for all of them at
+# once, in place of their triggers.
+paths_imported = Signal(providing_args=['pks'])
+
+# Sent by ``PathHelper.check_imported()``: receivers return the list of
+# imported paths (among ``pks``) whose data differs from triggers result.
+check_imported_paths = Signal(providing_args=['pks'])
@@ -16,6 +16,32 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-------------------------------------------------------------------------------
+-- Position of a key, given sorted keys and their positions (binary search)
+-------------------------------------------------------------------------------
+
+DROP FUNCTION IF EXISTS ft_array_position(anyarray, anyelement);
+
+CREATE OR REPLACE FUNCTION ft_sorted_position(keys integer[], positions integer[], key integer) RETURNS integer AS $$
+DECLARE
+    low integer := 1;
+    high integer := array_length(keys, 1);
+    middle integer;
+BEGIN
+    WHILE low <= high LOOP
+        middle := (low + high) / 2;
+        IF keys[middle] = key THEN
+            RETURN positions[middle];
+        ELSIF keys[middle] < key THEN
+            low := middle + 1;
+        ELSE
+            high := middle - 1;
+        END IF;
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
 -------------------------------------------------------------------------------
 -- Length trigger function
 -------------------------------------------------------------------------------
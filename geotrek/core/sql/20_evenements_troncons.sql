@@ -23,6 +23,17 @@ $$;
 ALTER TABLE e_r_evenement_troncon ADD FOREIGN KEY (troncon) REFERENCES l_t_troncon(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED;
 
 
+-------------------------------------------------------------------------------
+-- Index linear intervals (used to find overlapping topologies)
+-------------------------------------------------------------------------------
+
+-- Intervals [least(pk_debut, pk_fin), greatest(pk_debut, pk_fin)] on troncon are
+-- indexed as flat boxes, queried with the && operator (see TopologyHelper.overlapping)
+DROP INDEX IF EXISTS e_r_evenement_troncon_interval_idx;
+CREATE INDEX e_r_evenement_troncon_interval_idx ON e_r_evenement_troncon
+    USING gist(box(point(troncon, least(pk_debut, pk_fin)), point(troncon, greatest(pk_debut, pk_fin))));
+
+
 -------------------------------------------------------------------------------
 -- Evenements utilities
 -------------------------------------------------------------------------------
@@ -45,6 +56,22 @@ $$ LANGUAGE plpgsql;
 
 DROP TRIGGER IF EXISTS e_r_evenement_troncon_geometry_tgr ON e_r_evenement_troncon;
 
+CREATE OR REPLACE FUNCTION evenement_geometry_deferred(eid integer) RETURNS boolean AS $$
+BEGIN
+    -- Geometry computation is deferred while the session temporary table exists
+    -- (see TopologyHelper.deferred_geometry) : topology is recorded in it, and
+    -- its geometry will be computed once, later.
+    IF NOT EXISTS (SELECT 1 FROM pg_class
+                   WHERE relname = 'tmp_evenements_differes' AND relpersistence = 't'
+                     AND pg_table_is_visible(oid)) THEN
+        RETURN FALSE;
+    END IF;
+    INSERT INTO tmp_evenements_differes (evenement)
+        SELECT eid WHERE NOT EXISTS (SELECT 1 FROM tmp_evenements_differes WHERE evenement = eid);
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
 CREATE OR REPLACE FUNCTION ft_evenements_troncons_geometry() RETURNS trigger AS $$
 DECLARE
     eid integer;
@@ -62,7 +89,9 @@ BEGIN
     END IF;
 
     FOREACH eid IN ARRAY eids LOOP
-        PERFORM update_geometry_of_evenement(eid);
+        IF NOT evenement_geometry_deferred(eid) THEN
+            PERFORM update_geometry_of_evenement(eid);
+        END IF;
     END LOOP;
 
     RETURN NULL;
@@ -49,6 +49,27 @@ CREATE TRIGGER l_t_troncon_date_update_tgr
     FOR EACH ROW EXECUTE PROCEDURE ft_date_update();
 
 
+-------------------------------------------------------------------------------
+-- Defer paths computations during bulk imports
+-------------------------------------------------------------------------------
+
+CREATE OR REPLACE FUNCTION troncon_import_deferred(tid integer) RETURNS boolean AS $$
+BEGIN
+    -- Snapping, splitting, elevation and land layers intersection are deferred
+    -- while the session temporary table exists (see PathHelper.import_session) :
+    -- path is recorded in it, and will be processed later, along with others.
+    IF NOT EXISTS (SELECT 1 FROM pg_class
+                   WHERE relname = 'tmp_troncons_importes' AND relpersistence = 't'
+                     AND pg_table_is_visible(oid)) THEN
+        RETURN FALSE;
+    END IF;
+    INSERT INTO tmp_troncons_importes (troncon)
+        SELECT tid WHERE NOT EXISTS (SELECT 1 FROM tmp_troncons_importes WHERE troncon = tid);
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+
 -------------------------------------------------------------------------------
 -- Check overlapping paths
 -------------------------------------------------------------------------------
@@ -100,7 +121,9 @@ BEGIN
                FROM e_r_evenement_troncon et, e_t_evenement e
                WHERE et.troncon = NEW.id AND et.evenement = e.id AND (et.pk_debut != et.pk_fin OR e.decallage = 0.0)
     LOOP
-        PERFORM update_geometry_of_evenement(eid);
+        IF NOT evenement_geometry_deferred(eid) THEN
+            PERFORM update_geometry_of_evenement(eid);
+        END IF;
     END LOOP;
 
     -- Special case of point geometries with offset != 0
@@ -146,6 +169,9 @@ CREATE OR REPLACE FUNCTION elevation_troncon_iu() RETURNS trigger AS $$
 DECLARE
     elevation elevation_infos;
 BEGIN
+    IF troncon_import_deferred(NEW.id) THEN
+        RETURN NEW;
+    END IF;
 
     SELECT * FROM ft_elevation_infos(NEW.geom) INTO elevation;
     -- Update path geometry
@@ -211,3 +237,56 @@ $$ LANGUAGE plpgsql;
 CREATE TRIGGER l_t_troncon_latest_updated_d_tgr
 AFTER DELETE ON l_t_troncon
 FOR EACH ROW EXECUTE PROCEDURE troncon_latest_updated_d();
+
+
+-------------------------------------------------------------------------------
+-- Keep track of paths changes (incremental graph updates)
+-------------------------------------------------------------------------------
+
+-- Versions are drawn when changes are written, but visible once committed:
+-- the transaction is recorded (txid) to find changes committed late.
+CREATE TABLE IF NOT EXISTS l_t_troncon_graphe (
+    troncon integer PRIMARY KEY,
+    version bigserial,
+    supprime boolean NOT NULL DEFAULT FALSE,
+    txid bigint NOT NULL DEFAULT txid_current()
+);
+
+DROP INDEX IF EXISTS l_t_troncon_graphe_version_idx;
+CREATE INDEX l_t_troncon_graphe_version_idx ON l_t_troncon_graphe(version);
+DROP INDEX IF EXISTS l_t_troncon_graphe_txid_idx;
+CREATE INDEX l_t_troncon_graphe_txid_idx ON l_t_troncon_graphe(txid);
+
+DROP TRIGGER IF EXISTS l_t_troncon_99_graph_iud_tgr ON l_t_troncon;
+
+CREATE OR REPLACE FUNCTION troncons_graph_iud() RETURNS trigger AS $$
+DECLARE
+    tid integer;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        tid := OLD.id;
+    ELSE
+        tid := NEW.id;
+    END IF;
+
+    -- Only extremities and length matter in the graph
+    IF TG_OP = 'UPDATE' THEN
+        IF ST_OrderingEquals(NEW.geom, OLD.geom) AND NEW.longueur IS NOT DISTINCT FROM OLD.longueur THEN
+            RETURN NULL;
+        END IF;
+    END IF;
+
+    -- One record per path: the last version it was modified
+    UPDATE l_t_troncon_graphe
+        SET version = nextval('l_t_troncon_graphe_version_seq'), supprime = (TG_OP = 'DELETE'), txid = txid_current()
+        WHERE troncon = tid;
+    IF NOT FOUND THEN
+        INSERT INTO l_t_troncon_graphe (troncon, supprime) VALUES (tid, TG_OP = 'DELETE');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER l_t_troncon_99_graph_iud_tgr
+AFTER INSERT OR UPDATE OF geom, longueur OR DELETE ON l_t_troncon
+FOR EACH ROW EXECUTE PROCEDURE troncons_graph_iud();
@@ -1,77 +1,74 @@
 DROP TRIGGER IF EXISTS l_t_troncon_00_snap_geom_iu_tgr ON l_t_troncon;
 
-CREATE OR REPLACE FUNCTION troncons_snap_extremities() RETURNS trigger AS $$
+CREATE OR REPLACE FUNCTION ft_troncon_snap_point(tid integer, point geometry) RETURNS geometry AS $$
 DECLARE
-    linestart geometry;
-    lineend geometry;
     other geometry;
     result geometry;
-    newline geometry[];
-    d float8;
+    vertex geometry;
 
     DISTANCE float8;
 BEGIN
     DISTANCE := {{PATH_SNAPPING_DISTANCE}};
 
-    linestart := ST_StartPoint(NEW.geom);
-    lineend := ST_EndPoint(NEW.geom);
-
-    result := NULL;
-    SELECT ST_ClosestPoint(geom, linestart), geom INTO result, other
+    -- Closest other path: only those around the point are fetched from the
+    -- spatial index (point box expanded by DISTANCE, not the whole line one)
+    SELECT ST_ClosestPoint(geom, point), geom INTO result, other
       FROM l_t_troncon
-      WHERE geom && ST_Buffer(NEW.geom, DISTANCE * 2)
-        AND id != NEW.id
-        AND ST_Distance(geom, linestart) < DISTANCE
-      ORDER BY ST_Distance(geom, linestart)
+      WHERE ST_DWithin(geom, point, DISTANCE)
+        AND id != tid
+        AND ST_Distance(geom, point) < DISTANCE
+      ORDER BY ST_Distance(geom, point)
       LIMIT 1;
 
     IF result IS NULL THEN
-        result := linestart;
-    ELSE
-        d := DISTANCE;
-        FOR i IN 1..ST_NPoints(other) LOOP
-            IF ST_Distance(result, ST_PointN(other, i)) < DISTANCE AND ST_Distance(result, ST_PointN(other, i)) < d THEN
-                d := ST_Distance(result, ST_PointN(other, i));
-                result := ST_PointN(other, i);
-            END IF;
-        END LOOP;
-        IF NOT ST_Equals(linestart, result) THEN
-            RAISE NOTICE 'Snapped start % to %, from %', ST_AsText(linestart), ST_AsText(result), ST_AsText(other);
-        END IF;
+        RETURN point;
     END IF;
-    newline := array_append(newline, result);
 
-    FOR i IN 2..ST_NPoints(NEW.geom)-1 LOOP
-        newline := array_append(newline, ST_PointN(NEW.geom, i));
-    END LOOP;
+    -- Prefer its closest vertex, if any within DISTANCE
+    SELECT v.geom INTO vertex
+      FROM (SELECT (ST_DumpPoints(other)).*) AS v
+      WHERE ST_Distance(v.geom, result) < DISTANCE
+      ORDER BY ST_Distance(v.geom, result), v.path[1]
+      LIMIT 1;
+    IF vertex IS NOT NULL THEN
+        result := vertex;
+    END IF;
 
-    result := NULL;
-    SELECT ST_ClosestPoint(geom, lineend), geom INTO result, other
+    IF NOT ST_Equals(point, result) THEN
+        RAISE NOTICE 'Snapped % to %, from %', ST_AsText(point), ST_AsText(result), ST_AsText(other);
+    END IF;
+    RETURN result;
+END;
+$$ LANGUAGE plpgsql;
 
-      FROM l_t_troncon
-      WHERE geom && ST_Buffer(NEW.geom, DISTANCE * 2)
-        AND id != NEW.id
-        AND ST_Distance(geom, lineend) < DISTANCE
-      ORDER BY ST_Distance(geom, lineend)
-      LIMIT 1;
-    IF result IS NULL THEN
-        result := lineend;
-    ELSE
-        d := DISTANCE;
-        FOR i IN 1..ST_NPoints(other) LOOP
-            IF ST_Distance(result, ST_PointN(other, i)) < DISTANCE AND ST_Distance(result, ST_PointN(other, i)) < d THEN
-                d := ST_Distance(result, ST_PointN(other, i));
-                result := ST_PointN(other, i);
-            END IF;
-        END LOOP;
-        IF NOT ST_Equals(lineend, result) THEN
-            RAISE NOTICE 'Snapped end % to %, from %', ST_AsText(lineend), ST_AsText(result), ST_AsText(other);
-        END IF;
+CREATE OR REPLACE FUNCTION ft_troncon_snap_extremities(tid integer, line geometry) RETURNS geometry AS $$
+DECLARE
+    linestart geometry;
+    lineend geometry;
+    result geometry;
+BEGIN
+    -- Only extremities are replaced, other vertices are kept as is
+    linestart := ft_troncon_snap_point(tid, ST_StartPoint(line));
+    lineend := ft_troncon_snap_point(tid, ST_EndPoint(line));
+
+    result := line;
+    IF NOT ST_Equals(linestart, ST_StartPoint(line)) THEN
+        result := ST_SetPoint(result, 0, linestart);
+    END IF;
+    IF NOT ST_Equals(lineend, ST_EndPoint(line)) THEN
+        result := ST_SetPoint(result, ST_NPoints(line) - 1, lineend);
+    END IF;
+    RETURN result;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION troncons_snap_extremities() RETURNS trigger AS $$
+BEGIN
+    IF troncon_import_deferred(NEW.id) THEN
+        RETURN NEW;
     END IF;
-    newline := array_append(newline, result);
 
-    RAISE NOTICE 'New geom %', ST_AsText(ST_MakeLine(newline));
-    NEW.geom := ST_MakeLine(newline);
+    NEW.geom := ft_troncon_snap_extremities(NEW.id, NEW.geom);
     RETURN NEW;
 END;
 $$ LANGUAGE plpgsql;
@@ -88,6 +85,22 @@ FOR EACH ROW EXECUTE PROCEDURE troncons_snap_extremities();
 DROP TRIGGER IF EXISTS l_t_troncon_split_geom_iu_tgr ON l_t_troncon;
 DROP TRIGGER IF EXISTS l_t_troncon_10_split_geom_iu_tgr ON l_t_troncon;
 
+CREATE OR REPLACE FUNCTION troncon_split_deferred(tid integer) RETURNS boolean AS $$
+BEGIN
+    -- Split is deferred while the session temporary table exists
+    -- (see PathHelper.deferred_split and ft_split_troncons) : path is recorded
+    -- in it, and will be split later, along with others.
+    IF NOT EXISTS (SELECT 1 FROM pg_class
+                   WHERE relname = 'tmp_troncons_differes' AND relpersistence = 't'
+                     AND pg_table_is_visible(oid)) THEN
+        RETURN FALSE;
+    END IF;
+    INSERT INTO tmp_troncons_differes (troncon)
+        SELECT tid WHERE NOT EXISTS (SELECT 1 FROM tmp_troncons_differes WHERE troncon = tid);
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
 CREATE OR REPLACE FUNCTION troncons_evenement_intersect_split() RETURNS trigger AS $$
 DECLARE
     troncon record;
@@ -105,6 +118,9 @@ DECLARE
     intersections_on_new float8[];
     intersections_on_current float8[];
 BEGIN
+    IF troncon_split_deferred(NEW.id) OR troncon_import_deferred(NEW.id) THEN
+        RETURN NULL;
+    END IF;
 
     -- Copy original geometry
     newgeom := NEW.geom;
@@ -421,3 +437,216 @@ $$ LANGUAGE plpgsql;
 CREATE TRIGGER l_t_troncon_10_split_geom_iu_tgr
 AFTER INSERT OR UPDATE OF geom ON l_t_troncon
 FOR EACH ROW EXECUTE PROCEDURE troncons_evenement_intersect_split();
+
+
+-------------------------------------------------------------------------------
+-- Split a set of paths at once
+-------------------------------------------------------------------------------
+
+DROP FUNCTION IF EXISTS ft_split_troncons(integer[]);
+
+CREATE OR REPLACE FUNCTION ft_split_troncons(troncons integer[]) RETURNS integer AS $$
+DECLARE
+    troncon record;
+    tid_clone integer;
+    created integer;
+    deferred boolean;
+    existing_et integer[];
+    splitted integer[];
+    junctions geometry[];
+    rec record;
+    linear_offset float8;
+    side_offset float8;
+    fraction float8;
+    bounds float8[];
+    length float8;
+    a float8;
+    b float8;
+BEGIN
+    -- Same result as troncons_evenement_intersect_split(), but each path is
+    -- split once at all its crossings, instead of recursively by the trigger.
+    -- Split trigger is deferred meanwhile (see troncon_split_deferred()).
+    deferred := EXISTS (SELECT 1 FROM pg_class
+                        WHERE relname = 'tmp_troncons_differes' AND relpersistence = 't'
+                          AND pg_table_is_visible(oid));
+    IF NOT deferred THEN
+        CREATE TEMPORARY TABLE tmp_troncons_differes (troncon integer PRIMARY KEY);
+    END IF;
+    created := 0;
+    splitted := ARRAY[]::integer[];
+    junctions := ARRAY[]::geometry[];
+
+    -- Crossings of given paths with each other or with other paths, excluding
+    -- those touching by extremities, located on both paths.
+    -- (Geometries are those before splitting)
+    FOR troncon IN WITH pairs AS (SELECT t.id AS id1, t.geom AS geom1, o.id AS id2, o.geom AS geom2,
+                                         ST_Intersection(t.geom, o.geom) AS crossing
+                                    FROM l_t_troncon t, l_t_troncon o
+                                   WHERE t.id = ANY(troncons)
+                                     AND t.geom && o.geom
+                                     AND t.id != o.id
+                                     AND (t.id < o.id OR NOT o.id = ANY(troncons))
+                                     AND ST_Intersects(t.geom, o.geom)
+                                     AND NOT ST_Relate(t.geom, o.geom, 'FF*F*****')
+                                  OFFSET 0),
+                        points AS (SELECT id1, geom1, id2, geom2, (ST_Dump(crossing)).geom AS point
+                                     FROM pairs
+                                    WHERE GeometryType(crossing) IN ('POINT', 'MULTIPOINT')),
+                        located AS (SELECT id1 AS id, ST_Line_Locate_Point(geom1, point) AS fraction FROM points
+                                    UNION
+                                    SELECT id2 AS id, ST_Line_Locate_Point(geom2, point) AS fraction FROM points)
+                   SELECT t.*, array_agg(l.fraction ORDER BY l.fraction) AS fractions
+                     FROM located l, l_t_troncon t
+                    WHERE l.id = t.id AND l.fraction > 0 AND l.fraction < 1
+                 GROUP BY t.id
+    LOOP
+        -- Skip segments shorter than 1m (merged with next ones)
+        length := ST_Length(troncon.geom);
+        bounds := ARRAY[0::float8];
+        FOREACH fraction IN ARRAY troncon.fractions LOOP
+            IF (fraction - bounds[array_length(bounds, 1)]) * length >= 1 AND (1 - fraction) * length >= 1 THEN
+                bounds := array_append(bounds, fraction);
+            END IF;
+        END LOOP;
+        bounds := array_append(bounds, 1::float8);
+        CONTINUE WHEN array_length(bounds, 1) <= 2;
+
+        RAISE NOTICE 'Split %-% (%) on %', troncon.id, troncon.nom, ST_AsText(troncon.geom), bounds;
+
+        SELECT array_agg(id) INTO existing_et FROM e_r_evenement_troncon et WHERE et.troncon = troncon.id;
+        splitted := array_append(splitted, troncon.id);
+
+        -- Next segments : create clones !
+        FOR i IN 2..(array_length(bounds, 1) - 1)
+        LOOP
+            a := bounds[i];
+            b := bounds[i+1];
+
+            INSERT INTO l_t_troncon (structure,
+                                  valide,
+                                  nom,
+                                  remarques,
+                                  source,
+                                  enjeu,
+                                  geom_cadastre,
+                                  depart,
+                                  arrivee,
+                                  confort,
+                                  geom)
+                VALUES (troncon.structure,
+                        troncon.valide,
+                        troncon.nom,
+                        troncon.remarques,
+                        troncon.source,
+                        troncon.enjeu,
+                        troncon.geom_cadastre,
+                        troncon.depart,
+                        troncon.arrivee,
+                        troncon.confort,
+                        ST_Line_Substring(troncon.geom, a, b))
+                RETURNING id INTO tid_clone;
+            created := created + 1;
+            splitted := array_append(splitted, tid_clone);
+            junctions := array_append(junctions, ST_Line_Interpolate_Point(troncon.geom, a));
+
+            -- Copy N-N relations
+            INSERT INTO l_r_troncon_reseau (path_id, network_id)
+                SELECT tid_clone, tr.network_id
+                FROM l_r_troncon_reseau tr
+                WHERE tr.path_id = troncon.id;
+            INSERT INTO l_r_troncon_usage (path_id, usage_id)
+                SELECT tid_clone, tr.usage_id
+                FROM l_r_troncon_usage tr
+                WHERE tr.path_id = troncon.id;
+
+            -- Copy topologies overlapping segment, and points at its start (or end of path)
+            IF existing_et IS NOT NULL THEN
+                INSERT INTO e_r_evenement_troncon (troncon, evenement, pk_debut, pk_fin, ordre)
+                    SELECT
+                        tid_clone,
+                        et.evenement,
+                        CASE WHEN pk_debut <= pk_fin THEN
+                            (greatest(a, pk_debut) - a) / (b - a)
+                        ELSE
+                            (least(b, pk_debut) - a) / (b - a)
+                        END,
+                        CASE WHEN pk_debut <= pk_fin THEN
+                            (least(b, pk_fin) - a) / (b - a)
+                        ELSE
+                            (greatest(a, pk_fin) - a) / (b - a)
+                        END,
+                        et.ordre
+                    FROM e_r_evenement_troncon et,
+                         e_t_evenement e
+                    WHERE et.evenement = e.id
+                          AND et.id = ANY(existing_et)
+                          AND ((least(pk_debut, pk_fin) < b AND greatest(pk_debut, pk_fin) > a) OR   -- Overlapping
+                               (pk_debut = pk_fin AND pk_debut = a AND decallage = 0) OR            -- Point at start
+                               (pk_debut = pk_fin AND pk_debut = 1 AND b = 1 AND decallage = 0));   -- Point at end
+            END IF;
+        END LOOP;
+
+        -- First segment : shrink it !
+        b := bounds[2];
+        IF existing_et IS NOT NULL THEN
+            DELETE FROM e_r_evenement_troncon et WHERE et.id = ANY(existing_et)
+                                                 AND least(pk_debut, pk_fin) > b;
+            UPDATE e_r_evenement_troncon et SET
+                pk_debut = least(pk_debut / b, 1),
+                pk_fin = least(pk_fin / b, 1)
+                WHERE et.id = ANY(existing_et)
+                  AND least(pk_debut, pk_fin) <= b;
+        END IF;
+        UPDATE l_t_troncon SET geom = ST_Line_Substring(troncon.geom, 0, b) WHERE id = troncon.id;
+    END LOOP;
+
+    -- Point topologies exactly at a crossing are also attached to the other
+    -- paths meeting there (the trigger attaches them to the crossing path).
+    -- Extremities of paths split at a crossing match within float precision.
+    INSERT INTO e_r_evenement_troncon (troncon, evenement, pk_debut, pk_fin, ordre)
+        SELECT DISTINCT ON (t.id, et.evenement)
+               t.id, et.evenement,
+               CASE WHEN ST_DWithin(ST_StartPoint(t.geom), j.junction, 0.001) THEN 0 ELSE 1 END,
+               CASE WHEN ST_DWithin(ST_StartPoint(t.geom), j.junction, 0.001) THEN 0 ELSE 1 END,
+               et.ordre
+          FROM unnest(junctions) AS j (junction),
+               l_t_troncon o, e_r_evenement_troncon et, e_t_evenement e, l_t_troncon t
+         WHERE o.id = ANY(splitted) AND ST_DWithin(o.geom, j.junction, 0.001)
+           AND et.troncon = o.id AND et.evenement = e.id
+           AND et.pk_debut = et.pk_fin AND e.decallage = 0
+           AND ((et.pk_debut = 0 AND ST_DWithin(ST_StartPoint(o.geom), j.junction, 0.001)) OR
+                (et.pk_debut = 1 AND ST_DWithin(ST_EndPoint(o.geom), j.junction, 0.001)))
+           AND t.id != o.id AND ST_DWithin(t.geom, j.junction, 0.001)
+           AND (ST_DWithin(ST_StartPoint(t.geom), j.junction, 0.001) OR ST_DWithin(ST_EndPoint(t.geom), j.junction, 0.001))
+           AND NOT EXISTS (SELECT 1 FROM e_r_evenement_troncon x WHERE x.troncon = t.id AND x.evenement = et.evenement);
+
+    -- Point topologies with offset are re-attached to the closest path among
+    -- those split (as the trigger does), at the same location.
+    FOR rec IN WITH points AS (SELECT et.id AS aid, et.troncon, e.id AS evenement, e.geom, abs(e.decallage) AS distance
+                                   FROM e_r_evenement_troncon et, e_t_evenement e
+                                  WHERE et.evenement = e.id
+                                    AND et.troncon = ANY(splitted)
+                                    AND et.pk_debut = et.pk_fin
+                                    AND e.decallage != 0
+                                    AND NOT EXISTS (SELECT 1 FROM e_r_evenement_troncon l
+                                                     WHERE l.evenement = e.id AND l.pk_debut != l.pk_fin))
+                 SELECT * FROM (SELECT DISTINCT ON (p.aid) p.aid, p.troncon, p.evenement, p.geom,
+                                       t.id AS closest_id, t.geom AS closest_geom
+                                  FROM points p, l_t_troncon t
+                                 WHERE t.id = ANY(splitted)
+                                   AND ST_DWithin(p.geom, t.geom, p.distance)
+                              ORDER BY p.aid, ST_Distance(p.geom, t.geom), t.id) AS closest
+                  WHERE closest_id != troncon
+    LOOP
+        SELECT * INTO linear_offset, side_offset FROM ST_InterpolateAlong(rec.closest_geom, rec.geom) AS (position float, distance float);
+        UPDATE e_r_evenement_troncon SET troncon = rec.closest_id, pk_debut = linear_offset, pk_fin = linear_offset
+         WHERE id = rec.aid;
+        UPDATE e_t_evenement SET decallage = side_offset WHERE id = rec.evenement;
+    END LOOP;
+
+    IF NOT deferred THEN
+        DROP TABLE tmp_troncons_differes;
+    END IF;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
@@ -170,8 +170,36 @@ Geotrek.Dijkstra = (function() {
 
     };
 
+    // Decode the compact binary graph (see geotrek.core.graph.pack_graph)
+    // into the same structure as the JSON graph.
+    function decode_graph(buffer) {
+        var view = new DataView(buffer),
+            magic = String.fromCharCode(view.getUint8(0), view.getUint8(1),
+                                        view.getUint8(2), view.getUint8(3));
+        if (magic != 'GTG1')
+            throw 'Unknown graph format: ' + magic;
+
+        var n = view.getUint32(4, true),
+            offset = 8,
+            ids = new Int32Array(buffer, offset, n),
+            nodes_ids = new Uint32Array(buffer, offset + 4 * n, 2 * n),
+            lengths = new Float32Array(buffer, offset + 12 * n, n);
+
+        var graph = {'edges': {}, 'nodes': {}};
+        for (var i = 0; i < n; i++) {
+            var id = ids[i],
+                start = nodes_ids[2 * i],
+                end = nodes_ids[2 * i + 1];
+            graph.edges[id] = {'id': id, 'length': lengths[i], 'nodes_id': [start, end]};
+            (graph.nodes[start] = graph.nodes[start] || {})[end] = id;
+            (graph.nodes[end] = graph.nodes[end] || {})[start] = id;
+        }
+        return graph;
+    }
+
     return {
-        'get_shortest_path_from_graph': get_shortest_path_from_graph
+        'get_shortest_path_from_graph': get_shortest_path_from_graph,
+        'decode_graph': decode_graph
     };
 })();
 
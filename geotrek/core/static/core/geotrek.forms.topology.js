@@ -118,11 +118,45 @@ MapEntity.GeometryField.TopologyField = MapEntity.GeometryField.extend({
             return;
         }
 
+        if (window.SETTINGS.urls.path_route) {
+            // Routes are computed server-side, graph is only loaded if it fails
+            var handler = this._lineControl.handler;
+            handler.on('route_error', function onRouteError() {
+                handler.off('route_error', onRouteError, this);
+                this._loadGraph(this._onFallbackGraphLoaded);
+            }, this);
+            this._lineControl.setRouteUrl(window.SETTINGS.urls.path_route);
+            this.load();
+            return;
+        }
+
         // Path layer is ready, load graph !
+        this._loadGraph(this._onGraphLoaded);
+    },
+
+    _loadGraph: function (onLoaded) {
         this._pathsLayer.fire('data:loading');
         var url = window.SETTINGS.urls.path_graph + '?_u=' + (new Date().getTime());
-        $.getJSON(url, this._onGraphLoaded.bind(this))
-         .error(graphError.bind(this));
+        if (window.ArrayBuffer && window.DataView) {
+            // Compact binary graph
+            var xhr = new XMLHttpRequest();
+            xhr.open('GET', url, true);
+            xhr.responseType = 'arraybuffer';
+            xhr.setRequestHeader('Accept', 'application/x-geotrek-graph');
+            xhr.onload = (function () {
+                if (xhr.status != 200)
+                    return graphError.call(this, xhr, xhr.statusText);
+                onLoaded.call(this, Geotrek.Dijkstra.decode_graph(xhr.response));
+            }).bind(this);
+            xhr.onerror = (function () {
+                graphError.call(this, xhr, xhr.statusText);
+            }).bind(this);
+            xhr.send();
+        }
+        else {
+            $.getJSON(url, onLoaded.bind(this))
+             .error(graphError.bind(this));
+        }
 
         function graphError(jqXHR, textStatus, errorThrown) {
             this._pathsLayer.fire('data:loaded');
@@ -140,6 +174,13 @@ MapEntity.GeometryField.TopologyField = MapEntity.GeometryField.extend({
         this._pathsLayer.fire('data:loaded');
     },
 
+    _onFallbackGraphLoaded: function (graph) {
+        // Route again in browser, without restoring the initial topology
+        this._lineControl.setGraph(graph);
+        this._pathsLayer.fire('data:loaded');
+        this._lineControl.handler.computePaths();
+    },
+
     load: function () {
         if (this._pathsLayer === null) {
             // Use basic behaviour from MapEntityField until
@@ -158,8 +199,19 @@ MapEntity.GeometryField.TopologyField = MapEntity.GeometryField.extend({
             if (this._pointControl && topo.lat && topo.lng) {
                 this._pointControl.handler.restoreTopology(topo);
             }
-            // Unlock now, user can edit
-            this.store.unlock();
+            if (this._lineControl && this._lineControl.handler.isRouting()) {
+                // Unlock once the route is computed server-side
+                var handler = this._lineControl.handler,
+                    store = this.store;
+                handler.on('computed_topology', function unlock() {
+                    handler.off('computed_topology', unlock);
+                    store.unlock();
+                });
+            }
+            else {
+                // Unlock now, user can edit
+                this.store.unlock();
+            }
         }
     },
 
@@ -181,6 +181,14 @@ L.Control.LineTopology = L.Control.extend({
         this.activable(true);
     },
 
+    setRouteUrl: function (url) {
+        /**
+         * Compute routes server-side until a graph is set
+         */
+        this.handler.setRouteUrl(url);
+        this.activable(true);
+    },
+
     onAdd: function (map) {
         this._container = L.DomUtil.create('div', 'leaflet-draw leaflet-control leaflet-bar leaflet-control-zoom');
         var link = L.DomUtil.create('a', 'leaflet-control-zoom-out linetopology-control', this._container);
@@ -243,6 +251,8 @@ L.Handler.MultiPath = L.Handler.extend({
         this.options = options;
 
         this.graph = null;
+        this.routeUrl = null;
+        this._routeRequest = null;
 
         // markers
         this.markersFactory = this.getMarkers();
@@ -298,6 +308,14 @@ L.Handler.MultiPath = L.Handler.extend({
         this.graph = graph;
     },
 
+    setRouteUrl: function (url) {
+        this.routeUrl = url;
+    },
+
+    isRouting: function () {
+        return this._routeRequest !== null;
+    },
+
     setState: function(state, autocompute) {
         autocompute = autocompute === undefined ? true : autocompute;
         var self = this;
@@ -335,6 +353,8 @@ L.Handler.MultiPath = L.Handler.extend({
         });
 
         // reset state
+        this._routeRequest && this._routeRequest.abort();
+        this._routeRequest = null;
         this.steps = [];
         this.computed_paths = [];
         this.all_edges = [];
@@ -461,7 +481,7 @@ L.Handler.MultiPath = L.Handler.extend({
     },
 
     canCompute: function() {
-        if (!this.graph)
+        if (!this.graph && !this.routeUrl)
             return false;
 
         if (this.steps.length < 2)
@@ -489,11 +509,42 @@ L.Handler.MultiPath = L.Handler.extend({
 
     computePaths: function() {
         if (this.canCompute()) {
+            if (!this.graph) {
+                this._routeOnServer();
+                return;
+            }
             var computed_paths = Geotrek.shortestPath(this.graph, this.steps);
             this._onComputedPaths(computed_paths);
         }
     },
 
+    // Route steps server-side, as (path, position) (see core.views.get_route_json)
+    _routeOnServer: function() {
+        var self = this;
+
+        var steps = $.map(this.steps, function(pop) {
+            return [[pop.polyline.properties.pk, pop.percent_distance]];
+        });
+
+        // Only the last request matters (markers may be dragged meanwhile)
+        this._routeRequest && this._routeRequest.abort();
+        var request = this._routeRequest = $.getJSON(this.routeUrl, {steps: JSON.stringify(steps)});
+        request.done(function(serialized) {
+            if (request !== self._routeRequest)
+                return;
+            self._routeRequest = null;
+            var topology = Geotrek.TopologyHelper.buildTopologyFromSerialized(self.idToLayer, serialized);
+            self.onComputedTopology(topology);
+        });
+        request.fail(function(jqXHR, textStatus) {
+            if (request !== self._routeRequest)
+                return;
+            self._routeRequest = null;
+            console.error("Could not compute route on server: " + textStatus);
+            self.fire('route_error');
+        });
+    },
+
 
     // Extract the complete edges list from the first to the last one
     _eachInnerComputedPathsEdges: function(computed_paths, f) {
@@ -757,8 +808,12 @@ L.Handler.MultiPath = L.Handler.extend({
     },
 
     onComputedPaths: function(data) {
-        var self = this;
         var topology = Geotrek.TopologyHelper.buildTopologyFromComputedPath(this.idToLayer, data);
+        this.onComputedTopology(topology);
+    },
+
+    onComputedTopology: function(topology) {
+        var self = this;
 
         this.showPathGeom(topology.layer);
         this.fire('computed_topology', {topology:topology.serialized});
@@ -279,7 +279,34 @@ Geotrek.TopologyHelper = (function() {
         };
     }
 
+    /**
+     * @param idToLayer : callback to obtain a layer object from a pk/id.
+     * @param serialized : topology computed server-side (list of sub-topologies)
+     */
+    function buildTopologyFromSerialized(idToLayer, serialized) {
+        if (!serialized) {
+            return {
+                layer: null,
+                serialized: null
+            }
+        }
+
+        var layer = L.featureGroup();
+        for (var i = 0; i < serialized.length; i++) {
+            // Geometry for each sub-topology
+            var group_layer = buildGeometryFromTopology(serialized[i], idToLayer);
+            group_layer.step_idx = i;
+            layer.addLayer(group_layer);
+        }
+
+        return {
+            layer: layer,
+            serialized: serialized
+        };
+    }
+
     return {
-        buildTopologyFromComputedPath: buildTopologyFromComputedPath
+        buildTopologyFromComputedPath: buildTopologyFromComputedPath,
+        buildTopologyFromSerialized: buildTopologyFromSerialized
     };
 })();
@@ -8,6 +8,9 @@ from .test_topology import *
 from .test_path_split import *
 from .test_filters import *
 from .test_graph import *
+from .test_routing import *
+from .test_linearref import *
 from .test_forms import *
 from .test_fields import *
 from .test_models import *
+from .test_path_import import *
@@ -1,6 +1,6 @@
 from django.test import TestCase
 from django.core.exceptions import ValidationError
-from django.contrib.gis.geos import LineString
+from django.contrib.gis.geos import LineString, Point
 from django.conf import settings
 
 from geotrek.core.fields import SnappedLineStringField
@@ -55,3 +55,17 @@ class FieldsTest(TestCase):
         self.assertTrue(self.f.clean(value).equals_exact(
             LineString((100000, 100000), (2, 2),
                        srid=settings.SRID), 0.1))
+
+    def test_geom_vertices_are_snapped_with_one_query(self):
+        path = PathFactory.create()
+        coords = ','.join(['-0.7 -5.%s' % i for i in range(50)])
+        value = '{"geom": "LINESTRING(%s)", "snap": [%s]}' % (coords, ','.join([str(path.pk)] * 50))
+        with self.assertNumQueries(1):
+            geom = self.f.clean(value)
+        self.assertEqual(len(geom.coords), 50)
+        for vertex in geom.coords:
+            self.assertTrue(path.geom.distance(Point(*vertex, srid=settings.SRID)) < 0.001)
+
+    def test_geom_cannot_be_snapped_on_unknown_path(self):
+        value = '{"geom": "%s", "snap": [null, 999999]}' % self.wktgeom
+        self.assertRaises(ValidationError, self.f.clean, value)
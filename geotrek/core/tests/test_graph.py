@@ -1,14 +1,22 @@
 import json
+import struct
 import time
 
+import mock
+
 from django.test import TestCase
+from django.test.utils import override_settings
+from django.db import connection
 from django.contrib.auth.models import User
 from django.contrib.gis.geos import LineString
+from django.core.cache import get_cache
 from django.core.urlresolvers import reverse
 from django.utils.http import http_date
 
 from geotrek.core.factories import PathFactory
-from geotrek.core.graph import graph_edges_nodes_of_qs
+from geotrek.core.graph import (graph_edges_nodes_of_qs, PathGraphStore,
+                                iter_paths_extremities, iter_graph_json,
+                                pack_graph, GRAPH_BINARY_CONTENT_TYPE)
 from geotrek.core.models import Path
 
 
@@ -57,6 +65,20 @@ class SimpleGraph(TestCase):
         computed_graph = graph_edges_nodes_of_qs(Path.objects.all())
         self.assertDictEqual(computed_graph, graph)
 
+    def test_paths_extremities(self):
+        path = PathFactory(geom=LineString((0, 0), (5, 5), (10, 0)))
+        extremities = list(iter_paths_extremities(Path.objects.all(), batch_size=1))
+        self.assertEqual(extremities, [(path.pk, (0.0, 0.0), (10.0, 0.0), path.length)])
+
+    def test_graph_json_chunks(self):
+        graph = {'edges': dict((i, {'id': i, 'length': 1.0, 'nodes_id': [i, i + 1]}) for i in range(5)),
+                 'nodes': dict((i, {i + 1: i}) for i in range(5))}
+        chunks = list(iter_graph_json(graph, batch_size=2))
+        self.assertTrue(len(chunks) > 6)
+        self.assertEqual(json.loads(''.join(chunks)), json.loads(json.dumps(graph)))
+        self.assertEqual(json.loads(''.join(iter_graph_json({'edges': {}, 'nodes': {}}))),
+                         {'edges': {}, 'nodes': {}})
+
     def test_json_graph_empty(self):
 
         response = self.client.get(self.url)
@@ -72,6 +94,24 @@ class SimpleGraph(TestCase):
         self.assertDictEqual({'edges': {str(path.pk): {u'id': path.pk, u'length': 1.4142135623731, u'nodes_id': [1, 2]}},
                               'nodes': {u'1': {u'2': path.pk}, u'2': {u'1': path.pk}}}, graph)
 
+    def test_binary_graph(self):
+        graph = {'edges': {7: {'id': 7, 'length': 2.5, 'nodes_id': [1, 2]},
+                           3: {'id': 3, 'length': 0.5, 'nodes_id': [2, 3]}}}
+        packed = pack_graph(graph)
+        self.assertEqual(len(packed), 8 + 16 * 2)
+        self.assertEqual(struct.unpack('<4sI', packed[:8]), ('GTG1', 2))
+        self.assertEqual(struct.unpack('<2i', packed[8:16]), (3, 7))
+        self.assertEqual(struct.unpack('<4I', packed[16:32]), (2, 3, 1, 2))
+        self.assertEqual(struct.unpack('<2f', packed[32:]), (0.5, 2.5))
+
+    def test_binary_graph_negotiation(self):
+        path = PathFactory(geom=LineString((0, 0), (1, 1)))
+        response = self.client.get(self.url, HTTP_ACCEPT=GRAPH_BINARY_CONTENT_TYPE)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], GRAPH_BINARY_CONTENT_TYPE)
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(struct.unpack('<4sIi', response.content[:12]), ('GTG1', 1, path.pk))
+
     def test_json_graph_headers(self):
         """
         Last modified depends on
@@ -82,3 +122,117 @@ class SimpleGraph(TestCase):
         expires = response['Expires']
         self.assertNotEqual(expires, None)
         self.assertEqual(expires, last_modified)
+
+    def test_json_graph_version_header(self):
+        PathFactory(geom=LineString((0, 0), (1, 1)))
+        response = self.client.get(self.url)
+        self.assertTrue(int(response['X-Graph-Version']) > 0)
+
+    def test_json_graph_delta(self):
+        path = PathFactory(geom=LineString((0, 0), (1, 1)))
+        response = self.client.get(self.url)
+        version = int(response['X-Graph-Version'])
+        with mock.patch('django.core.cache.backends.dummy.DummyCache.get') as mocked:
+            mocked.return_value = PathGraphStore.build(Path.objects.all())
+            path.delete()
+            response = self.client.get(self.url, {'since': version})
+        delta = json.loads(response.content)
+        self.assertTrue(delta['version'] > version)
+        self.assertDictEqual({str(path.pk): None}, delta['edges'])
+        self.assertDictEqual({u'1': None, u'2': None}, delta['nodes'])
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        'fat': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'graph'},
+    })
+    def test_full_graph_serialized_once_per_version(self):
+        get_cache('fat').clear()
+        PathFactory(geom=LineString((0, 0), (1, 1)))
+        with mock.patch('geotrek.core.graph.iter_graph_json', wraps=iter_graph_json) as serialize:
+            first = self.client.get(self.url)
+            second = self.client.get(self.url)
+            self.assertEqual(serialize.call_count, 1)
+            self.assertEqual(first.content, second.content)
+            PathFactory(geom=LineString((2, 2), (3, 3)))
+            third = self.client.get(self.url)
+            self.assertEqual(serialize.call_count, 2)
+        self.assertEqual(len(json.loads(third.content)['edges']), 2)
+        self.assertTrue(int(third['X-Graph-Version']) > int(first['X-Graph-Version']))
+
+    def test_json_graph_delta_invalid_version(self):
+        response = self.client.get(self.url, {'since': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PathGraphStoreTest(TestCase):
+
+    def setUp(self):
+        self.path_1 = PathFactory(geom=LineString((0, 0), (10, 0)))
+        self.path_2 = PathFactory(geom=LineString((10, 0), (10, 10)))
+        self.store = PathGraphStore.build(Path.objects.all())
+
+    def test_build_is_similar_to_full_graph(self):
+        self.assertDictEqual(self.store.as_graph(),
+                             graph_edges_nodes_of_qs(Path.objects.all()))
+
+    def test_no_change_since_build(self):
+        self.assertFalse(self.store.update())
+        delta = self.store.delta(self.store.version)
+        self.assertDictEqual({}, delta['edges'])
+        self.assertDictEqual({}, delta['nodes'])
+
+    def test_unknown_version_has_no_delta(self):
+        self.assertEqual(self.store.delta(self.store.version - 1), None)
+        self.assertEqual(self.store.delta(self.store.version + 1), None)
+
+    def test_update_path_geometry(self):
+        version = self.store.version
+        self.path_2.geom = LineString((10, 0), (20, 0))
+        self.path_2.save()
+        self.assertTrue(self.store.update())
+        self.assertEqual(self.store.edges[self.path_2.pk]['nodes_id'], [2, 4])
+        delta = self.store.delta(version)
+        self.assertEqual(delta['edges'].keys(), [self.path_2.pk])
+        # Former extremity was removed, new one was added
+        self.assertDictEqual({2: {1: self.path_1.pk, 4: self.path_2.pk},
+                              3: None,
+                              4: {2: self.path_2.pk}}, delta['nodes'])
+
+    def test_update_path_split(self):
+        version = self.store.version
+        PathFactory(geom=LineString((5, -5), (5, 5)))
+        self.store.update()
+        self.assertItemsEqual(self.store.edges.keys(),
+                              Path.objects.values_list('pk', flat=True))
+        self.assertEqual(len(self.store.delta(version)['edges']), 4)
+
+    def test_old_versions_are_forgotten(self):
+        self.assertDictEqual({}, self.store.edge_versions)
+        version = self.store.version
+        self.store.history = 0
+        self.path_1.delete()
+        self.assertTrue(self.store.update())
+        self.assertEqual(self.store.delta(version), None)
+        self.assertDictEqual({}, self.store.delta(self.store.version)['edges'])
+        self.assertDictEqual({}, self.store.edge_versions)
+        self.assertDictEqual({}, self.store.node_versions)
+
+    def test_attributes_changes_are_ignored(self):
+        self.path_1.name = 'Renamed'
+        self.path_1.save()
+        self.assertFalse(self.store.update())
+
+    def test_changes_committed_late_are_applied(self):
+        self.path_2.geom = LineString((10, 0), (20, 0))
+        self.path_2.save()
+        self.assertTrue(self.store.update())
+        version = self.store.version
+        # A transaction still running at previous update commits a lower version
+        self.path_1.geom = LineString((0, 5), (10, 0))
+        self.path_1.save()
+        cursor = connection.cursor()
+        cursor.execute("UPDATE l_t_troncon_graphe SET version = 1 WHERE troncon = %s", [self.path_1.pk])
+        self.assertTrue(self.store.update())
+        self.assertTrue(self.store.version > version)
+        self.assertEqual(self.store.delta(version)['edges'].keys(), [self.path_1.pk])
+        self.assertFalse(self.store.update())
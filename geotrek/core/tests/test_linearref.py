@@ -0,0 +1,72 @@
+import math
+
+from django.test import TestCase
+from django.conf import settings
+from django.db import connection
+from django.contrib.gis.geos import Point, LineString
+
+from geotrek.common.utils import almostequal
+from geotrek.core.factories import PathFactory
+from geotrek.core.linearref import LinearReference
+
+
+class LinearReferenceTest(TestCase):
+    def setUp(self):
+        self.reference = LinearReference(LineString((0, 0), (10, 0), (10, 10)))
+
+    def test_length(self):
+        self.assertEqual(self.reference.length, 20)
+
+    def test_locate_on_line(self):
+        self.assertEqual(self.reference.locate(5, 0), (0.25, 0.0, (5.0, 0.0)))
+        self.assertEqual(self.reference.locate(10, 5), (0.75, 0.0, (10.0, 5.0)))
+
+    def test_locate_offset_is_positive_on_left(self):
+        self.assertEqual(self.reference.locate(5, 2), (0.25, 2.0, (5.0, 0.0)))
+        self.assertEqual(self.reference.locate(5, -2), (0.25, -2.0, (5.0, 0.0)))
+        self.assertEqual(self.reference.locate(12, 5), (0.75, -2.0, (10.0, 5.0)))
+
+    def test_locate_rounds_small_offsets(self):
+        self.assertEqual(self.reference.locate(5, 0.05)[1], 0.0)
+
+    def test_locate_beyond_extremities(self):
+        self.assertEqual(self.reference.locate(-3, 0), (0.0, 3.0, (0.0, 0.0)))
+        self.assertEqual(self.reference.locate(10, 13), (1.0, 3.0, (10.0, 10.0)))
+
+    def test_locate_many_points(self):
+        points = [Point(5, 2), Point(12, 5)]
+        self.assertEqual(self.reference.locate_points(points), [(0.25, 2.0), (0.75, -2.0)])
+        self.assertEqual(self.reference.snap_points(points), [(5.0, 0.0), (10.0, 5.0)])
+
+
+class PathInterpolationTest(TestCase):
+    def setUp(self):
+        coords = [(x, 10 * math.sin(x / 3.0)) for x in range(0, 30)]
+        self.path = PathFactory.create(geom=LineString(*coords))
+
+    def test_same_results_as_database(self):
+        cursor = connection.cursor()
+        for x, y in [(0, 0), (4.5, 3), (4.5, 12), (15, -20), (-5, 5), (40, 1), (13.3, 9.1)]:
+            point = Point(x, y, srid=settings.SRID)
+            cursor.execute("""
+                SELECT position, distance,
+                       ST_X(ST_ClosestPoint(l.geom, %(point)s::geometry)),
+                       ST_Y(ST_ClosestPoint(l.geom, %(point)s::geometry))
+                FROM l_t_troncon l,
+                     ft_troncon_interpolate(%(pk)s, %(point)s::geometry)
+                     AS (position FLOAT, distance FLOAT)
+                WHERE l.id = %(pk)s""", {'pk': self.path.pk, 'point': point.ewkt})
+            position, distance, snap_x, snap_y = cursor.fetchone()
+            result = self.path.interpolate(point)
+            self.assertTrue(almostequal(result[0], position, 6), (x, y))
+            self.assertTrue(almostequal(result[1], distance, 6), (x, y))
+            snap = self.path.snap(point)
+            self.assertTrue(almostequal(snap.x, snap_x, 6), (x, y))
+            self.assertTrue(almostequal(snap.y, snap_y, 6), (x, y))
+
+    def test_snap_many_points_without_queries(self):
+        points = [Point(x / 10.0, 5, srid=settings.SRID) for x in range(0, 500)]
+        with self.assertNumQueries(0):
+            snapped = self.path.snap_points(points)
+        self.assertEqual(len(snapped), 500)
+        self.assertEqual(snapped[0].srid, settings.SRID)
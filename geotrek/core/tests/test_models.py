@@ -2,7 +2,8 @@
 import math
 
 from django.test import TestCase
-from django.contrib.gis.geos import LineString
+from django.conf import settings
+from django.contrib.gis.geos import LineString, Point
 from django.db import IntegrityError
 
 from geotrek.common.utils import dbnow
@@ -10,6 +11,7 @@ from geotrek.authent.factories import UserFactory
 from geotrek.authent.models import Structure
 from geotrek.core.factories import (PathFactory, StakeFactory, TrailFactory)
 from geotrek.core.models import Path
+from geotrek.core.helpers import PathHelper
 
 
 class StakeTest(TestCase):
@@ -145,3 +147,44 @@ class PathGeometryTest(TestCase):
         # Snap both
         path_snapped = PathFactory.create(geom=LineString((0, 0), (3.0, 0)))
         self.assertEqual(path_snapped.geom.coords, ((0, 0), (3.0, math.sin(3))))
+
+    def test_snapping_keeps_other_vertices(self):
+        PathFactory.create(geom=LineString((0, 0), (10, 0)))
+        # Long zigzag line, whose start is close to the first path
+        coords = [(5, 0.5)] + [(5 + i, 10 + i % 2) for i in range(1, 100)]
+        path_snapped = PathFactory.create(geom=LineString(*coords))
+        self.assertEqual(path_snapped.geom.coords, tuple([(5, 0)] + coords[1:]))
+
+
+class PathClosestTest(TestCase):
+    def setUp(self):
+        # Long diagonal path, whose bounding box is close to every point
+        self.diagonal = PathFactory.create(geom=LineString((0, 0), (100, 100)))
+        self.short = PathFactory.create(geom=LineString((90, 10), (90, 12)))
+
+    def test_closest(self):
+        self.assertEqual(Path.closest(Point(50, 49, srid=settings.SRID)), self.diagonal)
+        self.assertEqual(Path.closest(Point(80, 10, srid=settings.SRID)), self.short)
+
+    def test_closest_widens_search(self):
+        paths = [PathFactory.create(geom=LineString((60 + i, 0), (60 + i, 0.5))) for i in range(3)]
+        # Point is within the diagonal bounding box, which is the first candidate
+        self.assertEqual(PathHelper.closest_pks([Point(60, 1, srid=settings.SRID)], candidates=1),
+                         [paths[0].pk])
+
+    def test_closest_positions(self):
+        points = [Point(50, 49, srid=settings.SRID), Point(80, 11, srid=settings.SRID),
+                  Point(25, 25, srid=settings.SRID)]
+        with self.assertNumQueries(2):
+            result = PathHelper.closest_positions(points)
+        self.assertEqual([path for path, position, offset in result],
+                         [self.diagonal, self.short, self.diagonal])
+        self.assertAlmostEqual(result[1][1], 0.5)
+        self.assertAlmostEqual(result[1][2], 10)
+        self.assertAlmostEqual(result[2][1], 0.25)
+        self.assertEqual(result[2][2], 0)
+
+    def test_closest_without_paths(self):
+        Path.objects.all().delete()
+        self.assertEqual(PathHelper.closest_pks([Point(0, 0, srid=settings.SRID)]), [None])
+        self.assertRaises(Path.DoesNotExist, Path.closest, Point(0, 0, srid=settings.SRID))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+from django.contrib.gis.geos import LineString
+from django.db import connection
+
+from geotrek.common.utils.postgresql import copy_objects
+from geotrek.core.factories import PathFactory, TopologyFactory
+from geotrek.core.models import Path
+from geotrek.core.helpers import PathHelper
+from geotrek.core.tests.test_path_split import PathGridMixin
+
+
+class ImportSessionTest(PathGridMixin, TestCase):
+    def split_block(self):
+        return PathHelper.import_session()
+
+    def test_paths_not_processed_within_block(self):
+        with PathHelper.import_session() as imported:
+            self.create_grid()
+            self.assertEqual(Path.objects.count(), 4)
+            self.assertEqual(Path.objects.filter(geom_3d__isnull=True).count(), 4)
+            self.assertEqual(imported, [])
+        self.assertEqual(Path.objects.count(), 12)
+        self.assertEqual(Path.objects.filter(geom_3d__isnull=True).count(), 0)
+        self.assertEqual(sorted(imported), sorted(Path.objects.values_list('pk', flat=True)))
+
+    def test_extremities_are_snapped(self):
+        ab = PathFactory.create(name="AB", geom=LineString((0, 0), (10, 0)))
+        with PathHelper.import_session():
+            cd = PathFactory.create(name="CD", geom=LineString((5, 10), (5, 0.5)))
+        ab.reload()
+        cd.reload()
+        self.assertEqual(cd.geom, LineString((5, 10), (5, 0)))
+        self.assertEqual(ab.geom, LineString((0, 0), (5, 0)))
+        self.assertEqual(Path.objects.filter(name="AB").count(), 2)
+
+    def test_topologies_on_split_paths_are_updated(self):
+        ab = PathFactory.create(name="AB", geom=LineString((0, 0), (4, 0)))
+        topology = TopologyFactory.create(no_path=True)
+        topology.add_path(ab, start=0.25, end=0.75)
+        with PathHelper.import_session():
+            PathFactory.create(geom=LineString((2, -2), (2, 2)))
+        topology.reload()
+        self.assertEqual(topology.aggregations.count(), 2)
+        self.assertEqual(topology.geom.coords[0], (1, 0))
+        self.assertEqual(topology.geom.coords[-1], (3, 0))
+
+    def test_copied_paths(self):
+        with PathHelper.import_session() as imported:
+            copy_objects([Path(name="AB\tcopy", geom=LineString((0, 0), (4, 0))),
+                          Path(name=None, comments=u"Côté\nnord", geom=LineString((2, -2), (2, 2)))])
+        self.assertEqual(len(imported), 4)
+        self.assertEqual(Path.objects.filter(name="AB\tcopy").count(), 2)
+        self.assertEqual(Path.objects.filter(comments=u"Côté\nnord").count(), 2)
+        self.assertEqual(PathHelper.check_imported(imported), [])
+
+    def test_check_imported(self):
+        ab = PathFactory.create(geom=LineString((0, 0), (4, 0)))
+        cd = PathFactory.create(geom=LineString((0, 2), (4, 2)))
+        self.assertEqual(PathHelper.check_imported([ab.pk, cd.pk]), [])
+        cursor = connection.cursor()
+        cursor.execute("UPDATE l_t_troncon SET geom_3d = NULL WHERE id = %s", [cd.pk])
+        self.assertEqual(PathHelper.check_imported([ab.pk, cd.pk]), [cd.pk])
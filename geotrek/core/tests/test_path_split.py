@@ -7,6 +7,7 @@ from geotrek.common.utils import almostequal
 
 from geotrek.core.factories import PathFactory, TopologyFactory, NetworkFactory, UsageFactory
 from geotrek.core.models import Path, Topology, PathAggregation
+from geotrek.core.helpers import PathHelper
 
 
 class SplitPathTest(TestCase):
@@ -1326,3 +1327,108 @@ class SplitPathGenericTopologyTest(TestCase):
         # But topology resulting geometry did not change
         originalgeom = LineString((2.2071067811865470, 0), *originalgeom[1:])
         self.assertEqual(topology.geom, originalgeom)
+
+
+class PathGridMixin(object):
+    """
+    Grid of crossing paths, split by the trigger, or when leaving the
+    block given by ``split_block()``.
+    """
+    def split_block(self):
+        raise NotImplementedError
+
+    def create_grid(self):
+        """
+             E   G
+          A -+---+- B
+             |   |
+          C -+---+- D
+             F   H
+        """
+        for name, coords in (('AB', ((0, 20), (30, 20))),
+                             ('CD', ((0, 10), (30, 10))),
+                             ('EF', ((10, 30), (10, 0))),
+                             ('GH', ((20, 30), (20, 0)))):
+            PathFactory.create(name=name, geom=LineString(*coords))
+
+    def geometries(self):
+        return sorted([(p.name, [(round(x, 6), round(y, 6)) for x, y in p.geom.coords])
+                       for p in Path.objects.all()])
+
+    def test_same_paths_as_trigger(self):
+        self.create_grid()
+        expected = self.geometries()
+        Path.objects.all().delete()
+        with self.split_block():
+            self.create_grid()
+        self.assertEqual(self.geometries(), expected)
+
+
+class DeferredSplitPathTest(PathGridMixin, TestCase):
+    def split_block(self):
+        return PathHelper.deferred_split()
+
+    def test_paths_not_split_within_block(self):
+        with PathHelper.deferred_split():
+            self.create_grid()
+            self.assertEqual(Path.objects.count(), 4)
+        self.assertEqual(Path.objects.count(), 12)
+
+    def test_split_paths_with_existing_network(self):
+        ab = PathFactory.create(name="AB", geom=LineString((0, 0), (4, 0)))
+        with PathHelper.deferred_split():
+            cd = PathFactory.create(name="CD", geom=LineString((2, -2), (2, 2)))
+        ab.reload()
+        cd.reload()
+        self.assertEqual(ab.geom, LineString((0, 0), (2, 0)))
+        self.assertEqual(cd.geom, LineString((2, -2), (2, 0)))
+        self.assertEqual(Path.objects.filter(name="AB").count(), 2)
+        self.assertEqual(Path.objects.filter(name="CD").count(), 2)
+
+    def test_topologies_are_remapped(self):
+        ab = PathFactory.create(name="AB", geom=LineString((0, 0), (4, 0)))
+        topology = TopologyFactory.create(no_path=True)
+        topology.add_path(ab, start=0.25, end=0.75)
+        topogeom = topology.geom
+        with PathHelper.deferred_split():
+            PathFactory.create(geom=LineString((2, -2), (2, 2)))
+        cb = Path.objects.filter(name="AB").exclude(pk=ab.pk)[0]
+        aggr_ab = ab.aggregations.all()[0]
+        aggr_cb = cb.aggregations.all()[0]
+        self.assertEqual((0.5, 1.0), (aggr_ab.start_position, aggr_ab.end_position))
+        self.assertEqual((0.0, 0.5), (aggr_cb.start_position, aggr_cb.end_position))
+        topology.reload()
+        self.assertEqual(topology.geom.coords[0], topogeom.coords[0])
+        self.assertEqual(topology.geom.coords[-1], topogeom.coords[-1])
+
+    def test_point_at_crossing_is_attached_to_crossing_path(self):
+        ab = PathFactory.create(name="AB", geom=LineString((0, 0), (4, 0)))
+        topology = TopologyFactory.create(no_path=True)
+        topology.add_path(ab, start=0.5, end=0.5)
+        with PathHelper.deferred_split():
+            PathFactory.create(name="CD", geom=LineString((2, -2), (2, 2)))
+        positions = sorted((a.path.name, a.start_position, a.end_position)
+                           for a in topology.aggregations.all())
+        self.assertEqual(positions, [('AB', 0.0, 0.0), ('AB', 1.0, 1.0),
+                                     ('CD', 0.0, 0.0), ('CD', 1.0, 1.0)])
+        topology.reload()
+        self.assertTrue(almostequal(2, topology.geom.x))
+        self.assertTrue(almostequal(0, topology.geom.y))
+
+    def test_point_with_offset_is_attached_to_closest_path(self):
+        PathFactory.create(name="AB", geom=LineString((0, 0), (8, 0)))
+        poi = Point(5, 3, srid=settings.SRID)
+        poi.transform(settings.API_SRID)
+        topology = Topology.deserialize({'lat': poi.y, 'lng': poi.x})
+        position = topology.geom.coords
+        self.assertTrue(almostequal(3, topology.offset))
+        with PathHelper.deferred_split():
+            PathFactory.create(name="CD", geom=LineString((4, -2), (4, 4)))
+        topology.reload()
+        aggr = topology.aggregations.get()
+        self.assertEqual(aggr.path.name, "CD")
+        self.assertTrue(almostequal(0, aggr.path.geom.coords[0][1]))
+        self.assertTrue(almostequal(0.75, aggr.start_position))
+        self.assertTrue(almostequal(1, abs(topology.offset)), topology.offset)
+        self.assertTrue(almostequal(position[0], topology.geom.coords[0]))
+        self.assertTrue(almostequal(position[1], topology.geom.coords[1]))
@@ -0,0 +1,119 @@
+import json
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import LineString
+from django.core.urlresolvers import reverse
+
+from geotrek.core.factories import PathFactory
+from geotrek.core.helpers import TopologyHelper
+from geotrek.core.routing import PathRouter, get_router
+
+
+class PathRouterTest(TestCase):
+    def setUp(self):
+        #   1 --10-- 2 --11-- 3
+        #   |        |
+        #   |       12
+        #   |        |
+        #   +--13--- 4
+        self.graph = {
+            'edges': {
+                10: {'id': 10, 'length': 10.0, 'nodes_id': [1, 2]},
+                11: {'id': 11, 'length': 10.0, 'nodes_id': [3, 2]},
+                12: {'id': 12, 'length': 5.0, 'nodes_id': [2, 4]},
+                13: {'id': 13, 'length': 50.0, 'nodes_id': [1, 4]},
+                14: {'id': 14, 'length': 1.0, 'nodes_id': [5, 6]},
+            }
+        }
+        self.router = PathRouter(self.graph)
+
+    def test_compact_structure(self):
+        self.assertEqual(len(self.router), 5)
+        self.assertEqual(len(self.router.offsets), 7)
+        self.assertEqual(len(self.router.adjacent_edges), 10)
+
+    def test_route_on_same_path(self):
+        route = self.router.route((10, 0.2), (10, 0.8))
+        self.assertEqual(route['paths'], [10])
+        self.assertEqual(route['positions'], {'0': (0.2, 0.8)})
+
+    def test_route_follows_path_directions(self):
+        route = self.router.route((10, 0.5), (11, 0.5))
+        self.assertEqual(route['paths'], [10, 11])
+        self.assertEqual(route['positions'], {'0': (0.5, 1.0), '1': (1.0, 0.5)})
+
+    def test_route_takes_shortest(self):
+        route = self.router.route((10, 0.5), (13, 0.9))
+        self.assertEqual(route['paths'], [10, 12, 13])
+        self.assertEqual(route['positions'], {'0': (0.5, 1.0),
+                                              '1': (0.0, 1.0),
+                                              '2': (1.0, 0.9)})
+
+    def test_route_from_graph_node(self):
+        route = self.router.route((10, 1.0), (12, 0.5))
+        self.assertEqual(route['paths'], [12])
+        self.assertEqual(route['positions'], {'0': (0.0, 0.5)})
+
+    def test_route_not_connected(self):
+        self.assertEqual(self.router.route((10, 0.5), (14, 0.5)), None)
+
+    def test_route_unknown_path(self):
+        self.assertRaises(ValueError, self.router.route, (10, 0.5), (99, 0.5))
+
+    def test_route_with_waypoints(self):
+        topology = self.router.route_steps([(10, 0.2), (12, 1.0), (11, 0.3)])
+        self.assertEqual(len(topology), 2)
+        self.assertEqual(topology[0]['paths'], [10, 12])
+        self.assertEqual(topology[1]['paths'], [12, 11])
+
+    def test_match_merges_legs(self):
+        topology = self.router.match([(10, 0.2), (10, 0.5), (11, 0.5)])
+        self.assertEqual(topology['paths'], [10, 11])
+        self.assertEqual(topology['positions'], {'0': (0.2, 1.0), '1': (1.0, 0.5)})
+
+    def test_match_keeps_turning_back(self):
+        topology = self.router.match([(10, 0.2), (10, 0.5), (10, 0.3)])
+        self.assertEqual(topology['paths'], [10, 10])
+        self.assertEqual(topology['positions'], {'0': (0.2, 0.5), '1': (0.5, 0.3)})
+
+    def test_match_ignores_repeated_steps(self):
+        topology = self.router.match([(10, 0.2), (10, 0.2), (12, 0.5)])
+        self.assertEqual(topology['paths'], [10, 12])
+        self.assertEqual(self.router.match([(10, 0.2), (10, 0.2)]), None)
+
+    def test_match_not_connected(self):
+        self.assertEqual(self.router.match([(10, 0.5), (14, 0.5)]), None)
+
+
+class GetRouterTest(TestCase):
+    def test_router_is_rebuilt_when_path_is_deleted(self):
+        PathFactory.create(geom=LineString((0, 0), (10, 0)))
+        p2 = PathFactory.create(geom=LineString((10, 0), (10, 10)))
+        self.assertEqual(len(get_router()), 2)
+        self.assertTrue(get_router() is get_router())
+        p2.delete()
+        self.assertEqual(len(get_router()), 1)
+
+
+class RouteViewTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('homer', 'h@s.com', 'dooh')
+        success = self.client.login(username=user.username, password='dooh')
+        self.assertTrue(success)
+        self.url = reverse('core:path_json_route')
+
+    def test_route_is_deserializable(self):
+        p1 = PathFactory.create(geom=LineString((0, 0), (10, 0)))
+        p2 = PathFactory.create(geom=LineString((10, 0), (10, 10)))
+        steps = json.dumps([[p1.pk, 0.5], [p2.pk, 0.5]])
+        response = self.client.get(self.url, {'steps': steps})
+        self.assertEqual(response.status_code, 200)
+        serialized = json.loads(response.content)
+        self.assertEqual(serialized[0]['paths'], [p1.pk, p2.pk])
+        topology = TopologyHelper.deserialize(serialized)
+        self.assertEqual(topology.geom, LineString((5, 0), (10, 0), (10, 5)))
+
+    def test_route_invalid_steps(self):
+        response = self.client.get(self.url, {'steps': 'doh'})
+        self.assertEqual(response.status_code, 400)
@@ -2,13 +2,16 @@ import json
 import math
 
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.conf import settings
+from django.db import connection
 from django.contrib.gis.geos import Point, LineString
 
 from geotrek.common.utils import dbnow, almostequal
 from geotrek.core.factories import (PathFactory, PathAggregationFactory,
-                                    TopologyFactory)
+                                    TopologyFactory, TrailFactory)
 from geotrek.core.models import Path, Topology, PathAggregation
+from geotrek.core.helpers import TopologyHelper
 
 
 class TopologyTest(TestCase):
@@ -778,6 +781,27 @@ class TopologyDerialization(TestCase):
         self.assertEqual(topology.aggregations.all()[2].start_position, 0.0)
         self.assertEqual(topology.aggregations.all()[2].end_position, 0.7)
 
+    def test_deserialize_line_queries_do_not_depend_on_paths_count(self):
+        paths = [PathFactory.create(geom=LineString((i, 0), (i + 1, 0))) for i in range(10)]
+
+        def deserialize(paths):
+            serialized = json.dumps([{"paths": [p.pk for p in paths], "offset": 0}])
+            with CaptureQueriesContext(connection) as queries:
+                topology = Topology.deserialize(serialized)
+            return topology, len(queries)
+
+        short, short_queries = deserialize(paths[:2])
+        full, full_queries = deserialize(paths)
+        self.assertEqual(short_queries, full_queries)
+        self.assertEqual(short.geom, LineString((0, 0), (1, 0), (2, 0)))
+        self.assertEqual(full.geom, LineString(*[(i, 0) for i in range(11)]))
+        self.assertEqual(full.length, 10)
+
+    def test_deserialize_unknown_path(self):
+        path = PathFactory.create()
+        self.assertRaises(ValueError, Topology.deserialize,
+                          '[{"paths": [%s, 9999], "offset": 0}]' % path.pk)
+
     def test_deserialize_point(self):
         PathFactory.create()
         # Take a point
@@ -810,6 +834,49 @@ class TopologyDerialization(TestCase):
         self.assertTrue(almostequal(start_before, start_after), '%s != %s' % (start_before, start_after))
         self.assertTrue(almostequal(end_before, end_after), '%s != %s' % (end_before, end_after))
 
+
+class TopologyDeferredGeometryTest(TestCase):
+
+    def setUp(self):
+        self.p1 = PathFactory.create(geom=LineString((0, 0), (10, 0)))
+        self.p2 = PathFactory.create(geom=LineString((10, 0), (10, 10)))
+        self.topology = TopologyFactory.create(no_path=True)
+
+    def test_geometry_is_computed_when_leaving_block(self):
+        with TopologyHelper.deferred_geometry():
+            self.topology.add_path(self.p1, order=0, reload=False)
+            self.topology.add_path(self.p2, order=1, reload=False)
+            self.assertEqual(Topology.objects.get(pk=self.topology.pk).length, 0)
+        self.topology.reload()
+        self.assertEqual(self.topology.geom, LineString((0, 0), (10, 0), (10, 10)))
+        self.assertEqual(self.topology.length, 20)
+
+    def test_geometry_is_computed_on_reload(self):
+        with TopologyHelper.deferred_geometry():
+            self.topology.add_path(self.p1, order=0, reload=False)
+            self.topology.reload()
+            self.assertEqual(self.topology.geom, LineString((0, 0), (10, 0)))
+
+    def test_nested_blocks(self):
+        with TopologyHelper.deferred_geometry():
+            with TopologyHelper.deferred_geometry():
+                self.topology.add_path(self.p1, order=0, reload=False)
+            self.assertTrue(TopologyHelper.geometry_deferred())
+            self.assertEqual(Topology.objects.get(pk=self.topology.pk).length, 0)
+        self.assertFalse(TopologyHelper.geometry_deferred())
+        self.assertEqual(Topology.objects.get(pk=self.topology.pk).length, 10)
+
+    def test_path_update_is_deferred(self):
+        self.topology.add_path(self.p1, order=0)
+        with TopologyHelper.deferred_geometry():
+            self.p1.geom = LineString((0, 0), (0, 20))
+            self.p1.save()
+            self.assertEqual(Topology.objects.get(pk=self.topology.pk).length, 10)
+        self.topology.reload()
+        self.assertEqual(self.topology.geom, LineString((0, 0), (0, 20)))
+        self.assertEqual(self.topology.length, 20)
+
+
 class TopologyOverlappingTest(TestCase):
 
     def setUp(self):
@@ -860,7 +927,78 @@ class TopologyOverlappingTest(TestCase):
         self.assertEqual(list(overlaps), [self.topo1,
                                           self.point2, self.point3, self.point1, self.topo2])
 
+    def test_overlapping_compares_intervals_on_same_path(self):
+        topo = TopologyFactory.create(no_path=True)
+        topo.add_path(self.path2, start=0.1, end=0.4)
+        overlaps = Topology.overlapping(topo)
+        # point2 and point3 are outside interval, point1 is at its end
+        self.assertEqual(list(overlaps), [self.topo2, topo, self.point1, self.topo1])
+        self.assertItemsEqual(overlaps.values_list('pk', flat=True),
+                              [topo.pk, self.topo1.pk, self.topo2.pk, self.point1.pk])
+
+    def test_overlapping_map(self):
+        overlaps = Topology.overlapping_map([self.topo1.pk, self.topo2.pk, self.point1.pk])
+        self.assertEqual(overlaps[self.topo1.pk], [t.pk for t in Topology.overlapping(self.topo1)])
+        self.assertEqual(overlaps[self.topo2.pk], [self.topo2.pk, self.point1.pk, self.point3.pk,
+                                                   self.point2.pk, self.topo1.pk])
+        self.assertItemsEqual(overlaps[self.point1.pk], [self.point1.pk, self.topo1.pk, self.topo2.pk])
+
+    def test_overlapping_map_empty(self):
+        self.assertEqual(Topology.overlapping_map([]), {})
+        self.assertEqual(Topology.overlapping_map(Topology.objects.none()), {})
+
+    def test_prefetch_topology_relations(self):
+        trail = TrailFactory.create(no_path=True)
+        trail.add_path(self.path2, start=0.5, end=1)
+        topologies = Topology.prefetch_topology_relations(
+            Topology.objects.filter(pk__in=[self.topo1.pk, self.point1.pk, self.point2.pk]).order_by('pk'),
+            'trails')
+        with self.assertNumQueries(0):
+            self.assertEqual([list(t.trails) for t in topologies], [[trail], [], [trail]])
+        self.assertEqual(list(topologies[0].trails.filter(pk=trail.pk)), [trail])
+
+    def test_prefetch_topology_relations_ignores_unknown(self):
+        topologies = Topology.prefetch_topology_relations([self.topo2], 'length')
+        self.assertFalse('_prefetched_relations' in topologies[0].__dict__)
+
+    def test_ordered_queryset_preserves_pk_list_order(self):
+        pks = [self.topo2.pk, self.point1.pk, self.topo1.pk, self.point3.pk, self.point2.pk, self.topo2.pk]
+        ordered = TopologyHelper._ordered_queryset(Topology.objects.existing(), pks)
+        self.assertEqual(list(ordered), [self.topo2, self.point1, self.topo1, self.point3, self.point2])
+
     def test_overlapping_does_not_fail_if_no_records(self):
         from geotrek.trekking.models import Trek
         overlaps = Topology.overlapping(Trek.objects.all())
         self.assertEqual(list(overlaps), [])
+
+
+class TopologyBulkCreateTest(TestCase):
+    def setUp(self):
+        self.path1 = PathFactory.create(geom=LineString((0, 0), (10, 0)))
+        self.path2 = PathFactory.create(geom=LineString((10, 0), (10, 10)))
+
+    def test_bulk_create_lines(self):
+        lines = [LineString((2, 0), (10, 5), srid=settings.SRID),
+                 LineString((10, 8), (10, 1), (6, 1), srid=settings.SRID)]
+        topologies = TopologyHelper.bulk_create_lines([Topology(), Topology()], lines)
+        first, second = [Topology.objects.get(pk=t.pk) for t in topologies]
+        self.assertEqual(first.kind, 'TOPOLOGY')
+        self.assertEqual([(a.path, a.start_position, a.end_position) for a in first.aggregations.all()],
+                         [(self.path1, 0.2, 1.0), (self.path2, 0.0, 0.5)])
+        self.assertEqual(first.geom, LineString((2, 0), (10, 0), (10, 5), srid=settings.SRID))
+        self.assertEqual(second.geom, LineString((10, 8), (10, 0), (6, 0), srid=settings.SRID))
+
+    def test_bulk_create_lines_fails_if_not_connected(self):
+        PathFactory.create(geom=LineString((20, 20), (30, 20)))
+        lines = [LineString((2, 0), (25, 20), srid=settings.SRID)]
+        self.assertRaises(ValueError, TopologyHelper.bulk_create_lines, [Topology()], lines)
+
+    def test_bulk_create_points(self):
+        points = [Point(5, 2, srid=settings.SRID), Point(9, 4, srid=settings.SRID)]
+        topologies = TopologyHelper.bulk_create_points([Topology(), Topology()], points)
+        first, second = [Topology.objects.get(pk=t.pk) for t in topologies]
+        self.assertEqual(first.aggregations.get().path, self.path1)
+        self.assertEqual(first.offset, 2)
+        self.assertEqual(first.geom, Point(5, 2, srid=settings.SRID))
+        self.assertEqual(second.aggregations.get().path, self.path2)
+        self.assertEqual(second.offset, 1)
@@ -104,6 +104,15 @@ class PathViewsTest(CommonTest):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'application/json')
 
+    def test_elevation_area_binary(self):
+        self.login()
+        path = self.modelfactory.create()
+        url = reverse('core:path_elevation_area', kwargs={'pk': path.pk})
+        response = self.client.get(url, HTTP_ACCEPT='application/x-geotrek-dem')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-geotrek-dem')
+        self.assertEqual(response.content[:4], 'GTD1')
+
 
 class DenormalizedTrailTest(AuthentFixturesTest):
     def setUp(self):
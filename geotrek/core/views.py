@@ -8,6 +8,8 @@ from django.views.decorators.http import last_modified as cache_last_modified
 from django.views.decorators.cache import never_cache as force_cache_validation
 from django.core.cache import get_cache
 from django.shortcuts import redirect
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.utils.cache import patch_vary_headers
 from mapentity.views import (MapEntityLayer, MapEntityList, MapEntityJsonList,
                              MapEntityDetail, MapEntityDocument, MapEntityCreate, MapEntityUpdate,
                              MapEntityDelete, MapEntityFormat,
@@ -20,6 +22,7 @@ from .models import Path, Trail, Topology
 from .forms import PathForm, TrailForm
 from .filters import PathFilterSet, TrailFilterSet
 from . import graph as graph_lib
+from .routing import get_router
 
 
 logger = logging.getLogger(__name__)
@@ -54,6 +57,21 @@ class CreateFromTopologyMixin(object):
         return initial
 
 
+class PrefetchTopologyRelationsMixin(object):
+    """
+    Compute the properties listed in ``prefetch_topology_relations`` for all
+    objects at once (see ``AddPropertyMixin``), instead of once per object.
+    """
+    prefetch_topology_relations = ()
+
+    def get_queryset(self):
+        qs = super(PrefetchTopologyRelationsMixin, self).get_queryset()
+        if not self.prefetch_topology_relations:
+            return qs
+        model = self.get_model()
+        return model.prefetch_topology_relations(qs, *self.prefetch_topology_relations)
+
+
 class PathLayer(MapEntityLayer):
     model = Path
     properties = ['name']
@@ -138,29 +156,84 @@ class PathDelete(MapEntityDelete):
         return super(PathDelete, self).dispatch(*args, **kwargs)
 
 
+def graph_payload_keys(version):
+    return {
+        'json': 'path_graph_json_%s' % version,
+        'binary': 'path_graph_binary_%s' % version,
+    }
+
+
 @login_required
 @cache_last_modified(lambda x: Path.latest_updated())
 @force_cache_validation
 def get_graph_json(request):
+    """
+    Return the paths graph as JSON. If a ``since`` version is specified
+    in querystring, only return the changes since this version.
+    The current graph version is given in the ``X-Graph-Version`` header.
+    The full graph is sent in a compact binary form if requested in ``Accept``
+    header (see ``graph.pack_graph()``).
+    """
     cache = get_cache('fat')
-    key = 'path_graph_json'
-
-    result = cache.get(key)
-    latest = Path.latest_updated()
+    store_key = 'path_graph_store'
+
+    # Apply paths changes on the cached graph, or build it if missing
+    store = cache.get(store_key)
+    if store is None:
+        store = graph_lib.PathGraphStore.build(Path.objects.all())
+        cache.set(store_key, store)
+        # Payloads of a former store, with other nodes ids
+        cache.delete_many(graph_payload_keys(store.version).values())
+    else:
+        version = store.version
+        if store.update():
+            cache.set(store_key, store)
+            cache.delete_many(graph_payload_keys(version).values())
+
+    since = request.GET.get('since')
+    if since is not None:
+        try:
+            delta = store.delta(int(since))
+        except ValueError:
+            return HttpResponseBadRequest()
+        # If version is unknown, client will receive the full graph
+        if delta is not None:
+            response = HttpJSONResponse(json.dumps(delta))
+            response['X-Graph-Version'] = store.version
+            return response
+
+    # Full graph is serialized once per version
+    binary = graph_lib.GRAPH_BINARY_CONTENT_TYPE in request.META.get('HTTP_ACCEPT', '')
+    payload_key = graph_payload_keys(store.version)['binary' if binary else 'json']
+    payload = cache.get(payload_key)
+    if payload is None:
+        if binary:
+            payload = graph_lib.pack_graph(store.as_graph())
+        else:
+            payload = ''.join(graph_lib.iter_graph_json(store.as_graph()))
+        cache.set(payload_key, payload)
+    content_type = graph_lib.GRAPH_BINARY_CONTENT_TYPE if binary else 'application/json'
+    response = HttpResponse(payload, content_type=content_type)
+    patch_vary_headers(response, ['Accept'])
+    response['X-Graph-Version'] = store.version
+    return response
 
-    if result and latest:
-        cache_latest, json_graph = result
-        # Not empty and still valid
-        if cache_latest and cache_latest >= latest:
-            return HttpJSONResponse(json_graph)
 
-    # cache does not exist or is not up to date
-    # rebuild the graph and cache the json
-    graph = graph_lib.graph_edges_nodes_of_qs(Path.objects.all())
-    json_graph = json.dumps(graph)
-
-    cache.set(key, (latest, json_graph))
-    return HttpJSONResponse(json_graph)
+@login_required
+def get_route_json(request):
+    """
+    Compute the shortest route through the steps given in querystring,
+    as a JSON list of ``[path, position]``, and return it as a serialized
+    topology (``null`` if steps are not connected).
+    """
+    try:
+        steps = json.loads(request.GET.get('steps', ''))
+        steps = [(int(path), float(position)) for path, position in steps]
+        topology = get_router().route_steps(steps)
+    except (TypeError, ValueError) as e:
+        logger.warning("Invalid route request: %s" % e)
+        return HttpResponseBadRequest()
+    return HttpJSONResponse(json.dumps(topology))
 
 
 class TrailLayer(MapEntityLayer):
@@ -2,7 +2,7 @@ from mapentity.views import (MapEntityLayer, MapEntityList, MapEntityJsonList, M
                              MapEntityDetail, MapEntityDocument, MapEntityCreate, MapEntityUpdate, MapEntityDelete)
 
 from geotrek.authent.decorators import same_structure_required
-from geotrek.core.views import CreateFromTopologyMixin
+from geotrek.core.views import CreateFromTopologyMixin, PrefetchTopologyRelationsMixin
 from geotrek.core.models import AltimetryMixin
 from .models import Infrastructure, Signage
 from .filters import InfrastructureFilterSet, SignageFilterSet
@@ -20,12 +20,13 @@ class InfrastructureList(MapEntityList):
     columns = ['id', 'name', 'type', 'cities']
 
 
-class InfrastructureJsonList(MapEntityJsonList, InfrastructureList):
-    pass
+class InfrastructureJsonList(PrefetchTopologyRelationsMixin, MapEntityJsonList, InfrastructureList):
+    prefetch_topology_relations = ('cities',)
 
 
-class InfrastructureFormatList(MapEntityFormat, InfrastructureList):
+class InfrastructureFormatList(PrefetchTopologyRelationsMixin, MapEntityFormat, InfrastructureList):
     columns = InfrastructureList.columns + AltimetryMixin.COLUMNS
+    prefetch_topology_relations = ('cities',)
 
 
 class InfrastructureDetail(MapEntityDetail):
@@ -74,12 +75,13 @@ class SignageList(MapEntityList):
     columns = ['id', 'name', 'type', 'cities']
 
 
-class SignageJsonList(MapEntityJsonList, SignageList):
-    pass
+class SignageJsonList(PrefetchTopologyRelationsMixin, MapEntityJsonList, SignageList):
+    prefetch_topology_relations = ('cities',)
 
 
-class SignageFormatList(MapEntityFormat, SignageList):
+class SignageFormatList(PrefetchTopologyRelationsMixin, MapEntityFormat, SignageList):
     columns = SignageList.columns + AltimetryMixin.COLUMNS
+    prefetch_topology_relations = ('cities',)
 
 
 class SignageDetail(MapEntityDetail):
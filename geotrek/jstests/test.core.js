@@ -107,6 +107,21 @@ describe('Shortest path', function() {
         assert.equal(path[1].start, 2);
         done();
     });
+
+
+    it('It should decode binary graph', function(done) {
+        var buffer = new ArrayBuffer(8 + 16 * 3),
+            view = new DataView(buffer);
+        'GTG1'.split('').forEach(function (c, i) { view.setUint8(i, c.charCodeAt(0)); });
+        view.setUint32(4, 3, true);
+        [1, 2, 3].forEach(function (id, i) { view.setInt32(8 + 4 * i, id, true); });
+        [1, 2, 2, 3, 4, 5].forEach(function (node, i) { view.setUint32(20 + 4 * i, node, true); });
+        [5, 10, 15].forEach(function (length, i) { view.setFloat32(44 + 4 * i, length, true); });
+
+        var graph = Geotrek.Dijkstra.decode_graph(buffer);
+        assert.deepEqual(graph, simple_valid_jsongraph);
+        done();
+    });
 });
 
 
@@ -306,4 +321,25 @@ describe('Topology helper', function() {
         });
         done();
     });
+
+
+    it('It should safely return if serialized topology is null', function(done) {
+        var topo = Geotrek.TopologyHelper.buildTopologyFromSerialized(idToLayer, null);
+        assert.deepEqual(topo, { layer: null, serialized: null });
+        done();
+    });
+
+
+    it('It should build layers of topology computed server-side', function(done) {
+        var serialized = [{offset: 0, paths: [2, 3], positions: {"0": [0.5, 1.0], "1": [0.0, 0.5]}},
+                          {offset: 0, paths: [3], positions: {"0": [0.5, 1.0]}}];
+        var topo = Geotrek.TopologyHelper.buildTopologyFromSerialized(idToLayer, serialized);
+
+        assert.equal(topo.serialized, serialized);
+        // One layer per sub-topology, to insert via steps
+        var steps = [];
+        topo.layer.eachLayer(function (group_layer) { steps.push(group_layer.step_idx); });
+        assert.deepEqual(steps, [0, 1]);
+        done();
+    });
 });
\ No newline at end of file
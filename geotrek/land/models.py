@@ -5,6 +5,7 @@ from mapentity.models import MapEntityMixin
 
 from geotrek.authent.models import StructureRelated
 from geotrek.core.models import Topology, Path, Trail
+from geotrek.core.helpers import PathHelper, TopologyHelper
 from geotrek.common.models import Organism
 from geotrek.maintenance.models import Intervention, Project
 
@@ -67,8 +68,10 @@ class PhysicalEdge(MapEntityMixin, Topology):
     def topology_physicals(cls, topology):
         return cls.overlapping(topology).select_related('physical_type')
 
-Path.add_property('physical_edges', PhysicalEdge.path_physicals)
-Topology.add_property('physical_edges', PhysicalEdge.topology_physicals)
+Path.add_property('physical_edges', PhysicalEdge.path_physicals,
+                  prefetch=PathHelper.related_prefetcher(PhysicalEdge.objects.select_related('physical_type')))
+Topology.add_property('physical_edges', PhysicalEdge.topology_physicals,
+                      prefetch=TopologyHelper.overlapping_prefetcher(PhysicalEdge, 'physical_type'))
 Intervention.add_property('physical_edges', lambda self: self.topology.physical_edges if self.topology else [])
 Project.add_property('physical_edges', lambda self: self.edges_by_attr('physical_edges'))
 
@@ -131,8 +134,10 @@ class LandEdge(MapEntityMixin, Topology):
     def topology_lands(cls, topology):
         return cls.overlapping(topology).select_related('land_type')
 
-Path.add_property('land_edges', LandEdge.path_lands)
-Topology.add_property('land_edges', LandEdge.topology_lands)
+Path.add_property('land_edges', LandEdge.path_lands,
+                  prefetch=PathHelper.related_prefetcher(LandEdge.objects.select_related('land_type')))
+Topology.add_property('land_edges', LandEdge.topology_lands,
+                      prefetch=TopologyHelper.overlapping_prefetcher(LandEdge, 'land_type'))
 Intervention.add_property('land_edges', lambda self: self.topology.land_edges if self.topology else [])
 Project.add_property('land_edges', lambda self: self.edges_by_attr('land_edges'))
 
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import os
 from datetime import datetime
+from itertools import chain
+from operator import attrgetter
 
 from django.conf import settings
 from django.utils.translation import ugettext_lazy as _
@@ -11,6 +13,7 @@ from mapentity.models import MapEntityMixin
 
 from geotrek.authent.models import StructureRelated
 from geotrek.core.models import Topology, AltimetryMixin, Path, Trail
+from geotrek.core.helpers import PathHelper, cached_queryset
 from geotrek.common.models import Organism, TimeStampedModel, NoDeleteMixin
 from geotrek.common.utils import classproperty
 from geotrek.infrastructure.models import Infrastructure, Signage
@@ -253,8 +256,31 @@ class Intervention(MapEntityMixin, AltimetryMixin, TimeStampedModel, StructureRe
         topos = Topology.overlapping(topology).values_list('pk', flat=True)
         return cls.objects.existing().filter(topology__in=topos).distinct('pk')
 
-Path.add_property('interventions', lambda self: Intervention.path_interventions(self))
-Topology.add_property('interventions', lambda self: Intervention.topology_interventions(self))
+    @classmethod
+    def prefetch_topology_interventions(cls, topologies):
+        """
+        Bulk version of ``topology_interventions()``.
+        """
+        by_topology = Topology.overlapping_map([t.pk for t in topologies])
+        topos = set(chain(*by_topology.values()))
+        interventions = cls.objects.existing().filter(topology__in=topos).order_by('pk')
+        by_topo = {}
+        for intervention in interventions:
+            by_topo.setdefault(intervention.topology_id, []).append(intervention)
+        result = {}
+        for topology in topologies:
+            overlapping = by_topology.get(topology.pk, [])
+            objects = sorted(set(chain(*[by_topo.get(pk, []) for pk in overlapping])),
+                             key=attrgetter('pk'))
+            queryset = cls.objects.existing().filter(pk__in=[o.pk for o in objects])
+            result[topology.pk] = cached_queryset(queryset, objects)
+        return result
+
+Path.add_property('interventions', lambda self: Intervention.path_interventions(self),
+                  prefetch=PathHelper.related_prefetcher(Intervention.objects.existing(),
+                                                         lookup='topology__aggregations__path'))
+Topology.add_property('interventions', lambda self: Intervention.topology_interventions(self),
+                      prefetch=Intervention.prefetch_topology_interventions)
 
 
 class InterventionStatus(StructureRelated):
@@ -372,6 +372,7 @@ ALTIMETRIC_PROFILE_FONTSIZE = 25
 ALTIMETRIC_PROFILE_FONT = 'ubuntu'
 ALTIMETRIC_AREA_MAX_RESOLUTION = 150  # Maximum number of points (by width/height)
 ALTIMETRIC_AREA_MARGIN = 0.15
+ALTIMETRIC_PROFILE_CACHE_WARM = False  # Render profiles of objects when saved (slows down saves)
 
 
 # Let this be defined at instance-level
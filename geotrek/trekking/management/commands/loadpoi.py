@@ -1,8 +1,11 @@
 import os.path
+import time
+from optparse import make_option
 
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.gis.geos import GEOSGeometry
 from django.conf import settings
+from django.db import transaction
 
 from geotrek.core.helpers import TopologyHelper
 from geotrek.trekking.models import POI, POIType
@@ -13,6 +16,14 @@ class Command(BaseCommand):
     can_import_settings = True
     field_name = 'name'
     field_poitype = 'type'
+    option_list = BaseCommand.option_list + (
+        make_option('--bulk', action='store_true', dest='bulk', default=False,
+                    help='Import features by batches, with a few queries per batch'),
+        make_option('--batch-size', type='int', dest='batch_size', default=1000,
+                    help='Number of features per batch in bulk mode (default: 1000)'),
+        make_option('--offset', type='int', dest='offset', default=0,
+                    help='Index of the first feature to import (to resume a failed import)'),
+    )
 
     def handle(self, *args, **options):
 
@@ -37,17 +48,25 @@ class Command(BaseCommand):
         count = layer.GetFeatureCount()
         self.stdout.write('%s objects found' % count)
 
-        for i in range(count):
+        offset = options.get('offset') or 0
+        if options.get('bulk'):
+            self.load_bulk(layer, count, offset, options.get('batch_size') or 1000)
+            return
+
+        for i in range(offset, count):
             feature = layer.GetFeature(i)
-            featureGeom = feature.GetGeometryRef()
-            geometry = GEOSGeometry(featureGeom.ExportToWkt())
-            name = feature.GetFieldAsString(self.field_name)
-            if name:
-                name = name.decode('utf-8')
-            poitype = feature.GetFieldAsString(self.field_poitype)
-            if poitype:
-                poitype = poitype.decode('utf-8')
-            self.create_poi(geometry, name, poitype)
+            self.create_poi(*self.read_feature(feature))
+
+    def read_feature(self, feature):
+        featureGeom = feature.GetGeometryRef()
+        geometry = GEOSGeometry(featureGeom.ExportToWkt())
+        name = feature.GetFieldAsString(self.field_name)
+        if name:
+            name = name.decode('utf-8')
+        poitype = feature.GetFieldAsString(self.field_poitype)
+        if poitype:
+            poitype = poitype.decode('utf-8')
+        return geometry, name, poitype
 
     def create_poi(self, geometry,  name, poitype):
         poitype, created = POIType.objects.get_or_create(label=poitype)
@@ -59,3 +78,44 @@ class Command(BaseCommand):
         # Move deserialization aggregations to the POI
         poi.mutate(topology)
         return poi
+
+    def load_bulk(self, layer, count, offset, batch_size):
+        """
+        Read features by batches, and import each batch in its own transaction.
+        If a batch fails, previous ones are kept, and the import can be resumed
+        with ``--offset``.
+        """
+        self.poitypes = {}
+        start = time.time()
+        layer.SetNextByIndex(offset)
+        imported = 0
+        for i in range(offset, count, batch_size):
+            features = []
+            for j in range(min(batch_size, count - i)):
+                feature = layer.GetNextFeature()
+                if feature is None:
+                    break
+                features.append(self.read_feature(feature))
+            try:
+                self.create_pois(features)
+            except Exception as e:
+                raise CommandError('Import failed at features %s-%s (%s). Resume with --offset=%s'
+                                   % (i, i + len(features) - 1, e, i))
+            imported += len(features)
+            elapsed = time.time() - start
+            self.stdout.write('%s/%s objects imported (%.1f objects/s)'
+                              % (i + len(features), count, imported / max(elapsed, 0.001)))
+
+    def create_pois(self, features):
+        """
+        Bulk version of ``create_poi()``, for a list of ``(geometry, name, poitype)``.
+        """
+        with transaction.atomic():
+            pois = []
+            points = []
+            for geometry, name, poitype in features:
+                if poitype not in self.poitypes:
+                    self.poitypes[poitype], created = POIType.objects.get_or_create(label=poitype)
+                pois.append(POI(name=name, type=self.poitypes[poitype]))
+                points.append(GEOSGeometry(geometry.wkt, srid=settings.API_SRID))
+            return TopologyHelper.bulk_create_points(pois, points)
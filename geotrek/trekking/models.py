@@ -20,6 +20,7 @@ from mapentity.models import MapEntityMixin
 from mapentity.serializers import plain_text, smart_plain_text
 
 from geotrek.core.models import Path, Topology
+from geotrek.core.helpers import PathHelper, TopologyHelper
 from geotrek.common.utils import classproperty
 from geotrek.maintenance.models import Intervention, Project
 
@@ -483,8 +484,10 @@ class Trek(PicturesMixin, MapEntityMixin, Topology):
             qs = cls.objects.filter(geom__intersects=area)
         return qs
 
-Path.add_property('treks', Trek.path_treks)
-Topology.add_property('treks', Trek.topology_treks)
+Path.add_property('treks', Trek.path_treks,
+                  prefetch=PathHelper.related_prefetcher(Trek.objects.existing()))
+Topology.add_property('treks', Trek.topology_treks,
+                      prefetch=TopologyHelper.overlapping_prefetcher(Trek))
 Intervention.add_property('treks', lambda self: self.topology.treks if self.topology else [])
 Project.add_property('treks', lambda self: self.edges_by_attr('treks'))
 
@@ -864,8 +867,10 @@ class POI(PicturesMixin, MapEntityMixin, Topology):
             qs = cls.objects.filter(geom__intersects=area)
         return qs
 
-Path.add_property('pois', POI.path_pois)
-Topology.add_property('pois', POI.topology_pois)
+Path.add_property('pois', POI.path_pois,
+                  prefetch=PathHelper.related_prefetcher(POI.objects.all()))
+Topology.add_property('pois', POI.topology_pois,
+                      prefetch=TopologyHelper.overlapping_prefetcher(POI))
 Intervention.add_property('pois', lambda self: self.topology.pois if self.topology else [])
 Project.add_property('pois', lambda self: self.edges_by_attr('pois'))
 
@@ -75,4 +75,25 @@ class LoadPOITest(TestCase):
     def test_pois_are_attached_to_paths(self):
         geom = GEOSGeometry('POINT(1 1)')
         poi = self.cmd.create_poi(geom, 'bridge', 'infra')
-        self.assertEquals([self.path], list(poi.paths.all()))
\ No newline at end of file
+        self.assertEquals([self.path], list(poi.paths.all()))
+
+    def test_pois_are_created_in_bulk(self):
+        output = StringIO()
+        self.cmd.execute(self.filename, bulk=True, batch_size=1, stdout=output)
+        pois = POI.objects.order_by('pk')
+        self.assertEquals([p.name for p in pois], ['pont', 'pancarte 1'])
+        self.assertEquals([p.type.label for p in pois], [u'équipement', 'signaletique'])
+        for poi in pois:
+            self.assertEquals([self.path], list(poi.paths.all()))
+            self.assertFalse(poi.deleted)
+            self.assertEquals(poi.kind, 'POI')
+        self.assertIn('2/2 objects imported', output.getvalue())
+
+    def test_bulk_import_can_be_resumed(self):
+        self.cmd.execute(self.filename, bulk=True, offset=1, stdout=StringIO())
+        self.assertEquals([p.name for p in POI.objects.all()], ['pancarte 1'])
+
+    def test_bulk_import_gives_offset_to_resume(self):
+        with patch.object(Command, 'create_pois', side_effect=ValueError('boom')):
+            self.assertRaisesRegexp(CommandError, '--offset=0', self.cmd.execute,
+                                    self.filename, bulk=True, stdout=StringIO())
@@ -196,6 +196,17 @@ class TrekCustomViewTests(TrekkingManagerTest):
         poifeature = poislayer['features'][0]
         self.assertTrue('thumbnail' in poifeature['properties'])
 
+    def test_format_list_denormalizes_overlapping(self):
+        trek = TrekWithPOIsFactory.create()
+        view = trekking_views.TrekFormatList()
+        view.request = RequestFactory().get('/')
+        view.kwargs = {}
+        treks = list(view.get_queryset())
+        self.assertEqual(len(treks), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(list(treks[0].pois), list(trek.pois))
+            self.assertEqual(treks[0].cities, [])
+
     def test_kml(self):
         trek = TrekWithPOIsFactory.create()
         url = reverse('trekking:trek_kml_detail', kwargs={'pk': trek.pk})
@@ -282,6 +293,33 @@ class TrekCustomViewTests(TrekkingManagerTest):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'application/json')
 
+    def test_profile_json_not_modified(self):
+        trek = TrekFactory.create()
+        url = reverse('trekking:trek_profile', kwargs={'pk': trek.pk})
+        response = self.client.get(url)
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_profile_json_not_modified_without_rendering(self):
+        trek = TrekFactory.create()
+        url = reverse('trekking:trek_profile', kwargs={'pk': trek.pk})
+        etag = self.client.get(url)['ETag']
+        with mock.patch.object(Trek, 'get_cached_elevation') as cached:
+            for if_none_match in ('"other", %s' % etag, 'W/%s' % etag, '*'):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=if_none_match)
+                self.assertEqual(response.status_code, 304)
+            self.assertFalse(cached.called)
+
+    def test_profile_svg_not_modified_varies_on_language(self):
+        trek = TrekFactory.create()
+        url = reverse('trekking:trek_profile_svg', kwargs={'pk': trek.pk})
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('Accept-Language', response['Vary'])
+
     def test_elevation_area_json(self):
         trek = TrekFactory.create()
         url = reverse('trekking:trek_elevation_area', kwargs={'pk': trek.pk})
@@ -17,7 +17,7 @@ from mapentity.serializers import plain_text
 from mapentity.helpers import alphabet_enumeration
 from paperclip.models import Attachment
 
-from geotrek.core.views import CreateFromTopologyMixin
+from geotrek.core.views import CreateFromTopologyMixin, PrefetchTopologyRelationsMixin
 from geotrek.core.models import AltimetryMixin
 from geotrek.common.views import FormsetMixin
 from geotrek.zoning.models import District, City, RestrictedArea
@@ -110,8 +110,9 @@ class TrekJsonDetail(LastModifiedMixin, JSONResponseMixin, BaseDetailView):
         return ctx
 
 
-class TrekFormatList(MapEntityFormat, TrekList):
+class TrekFormatList(PrefetchTopologyRelationsMixin, MapEntityFormat, TrekList):
     columns = set(TrekList.columns + TrekJsonDetail.columns + ['related', 'pois']) - set(['relationships', 'thumbnail', 'map_image_url', 'slug'])
+    prefetch_topology_relations = ('cities', 'districts', 'pois')
 
 
 class TrekGPXDetail(LastModifiedMixin, BaseDetailView):
@@ -0,0 +1,62 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+from geotrek.core.helpers import TopologyHelper
+
+
+_deferred = threading.local()
+
+
+class ZoningHelper(object):
+    @classmethod
+    @contextmanager
+    def import_session(cls):
+        """
+        Within this block, edges of cities, districts and restricted areas are
+        not computed by triggers when they are created or modified. They are
+        recorded (in a session temporary table, see ``couches_sig_import_deferred()``
+        in SQL), and their edges are computed at once when leaving the block, with
+        one query per land layer (see ``ft_couches_sig_importees()``).
+
+        Paths can still be modified within the block: their edges are synchronized
+        by triggers, and edges of recorded land objects are computed again when
+        leaving it. Blocks can be nested, only the outermost one computes edges.
+        """
+        if cls.import_deferred():
+            yield
+            return
+        with transaction.atomic():
+            with TopologyHelper.deferred_geometry():
+                cursor = connection.cursor()
+                cursor.execute("CREATE TEMPORARY TABLE tmp_couches_sig_importees"
+                               " (couche varchar, objet varchar, PRIMARY KEY (couche, objet))")
+                _deferred.imported = True
+                try:
+                    yield
+                finally:
+                    _deferred.imported = False
+                cursor.execute("SELECT ft_couches_sig_importees()")
+                cursor.execute("DROP TABLE tmp_couches_sig_importees")
+
+    @classmethod
+    def import_deferred(cls):
+        return getattr(_deferred, 'imported', False)
+
+    @classmethod
+    def delete_all(cls, edge_model, field_name):
+        """
+        Delete all objects of a land layer, and their edges (of ``edge_model``,
+        related to objects with ``field_name``), with a few statements.
+        Meant to be used within ``import_session()``, to replace a layer atomically.
+        """
+        field = edge_model._meta.get_field(field_name)
+        cursor = connection.cursor()
+        cursor.execute("""
+            WITH edges AS (DELETE FROM %s RETURNING evenement),
+                 aggregations AS (DELETE FROM e_r_evenement_troncon
+                                  WHERE evenement IN (SELECT evenement FROM edges))
+            DELETE FROM e_t_evenement WHERE id IN (SELECT evenement FROM edges)
+            """ % connection.ops.quote_name(edge_model._meta.db_table))
+        cursor.execute("DELETE FROM %s" % connection.ops.quote_name(field.rel.to._meta.db_table))
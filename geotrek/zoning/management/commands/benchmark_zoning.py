@@ -0,0 +1,96 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.conf import settings
+from django.contrib.gis.geos import LineString, MultiPolygon, Polygon
+
+from geotrek.common.utils.benchmark import ROLLBACK_HELP, origin, rolled_back, timed
+from geotrek.core.factories import PathFactory
+from geotrek.zoning.models import City
+
+
+TABLES = ('e_t_evenement', 'e_r_evenement_troncon', 'f_t_commune')
+
+
+class Command(BaseCommand):
+    help = 'Measure rows written in land layers edges when a vertex of a path crossing\n'
+    help += 'a grid of cities is moved, compared to re-creating all its edges.\n'
+    help += ROLLBACK_HELP
+    can_import_settings = True
+
+    option_list = BaseCommand.option_list + (
+        make_option('--size',
+                    type='int',
+                    default=10,
+                    help='Number of cities in each direction (default: 10).'),
+        make_option('--vertices',
+                    type='int',
+                    default=100,
+                    help='Number of vertices of the path (default: 100).'),
+        make_option('--edits',
+                    type='int',
+                    default=10,
+                    help='Number of edits measured (default: 10).'),
+    )
+
+    def writes(self):
+        """ Rows inserted, updated and deleted per table in current transaction. """
+        cursor = connection.cursor()
+        cursor.execute("SELECT relname, n_tup_ins + n_tup_upd + n_tup_del"
+                       " FROM pg_stat_xact_user_tables WHERE relname IN %s", [TABLES])
+        return dict(cursor.fetchall())
+
+    def measure(self, edit, count):
+        def edit_all():
+            for i in range(count):
+                edit(i)
+
+        before = self.writes()
+        duration, _ = timed(edit_all)
+        after = self.writes()
+        return duration, [(after.get(t, 0) - before.get(t, 0)) / float(count) for t in TABLES]
+
+    def handle(self, *args, **options):
+        size = options['size']
+        vertices = options['vertices']
+        edits = options['edits']
+
+        with rolled_back():
+            # Grid of cities, from a corner of spatial extent
+            x, y = origin()
+            step = 100
+            for i in range(size):
+                for j in range(size):
+                    City.objects.create(code='B%05d' % (i * size + j), name='Benchmark %s-%s' % (i, j),
+                                        geom=MultiPolygon(Polygon.from_bbox((x + i * step, y + j * step,
+                                                                             x + (i + 1) * step, y + (j + 1) * step)),
+                                                          srid=settings.SRID))
+            # Zigzag path, crossing all rows of cities between consecutive vertices
+            width = size * step
+            coords = [(x + 1 + k * (width - 2.0) / (vertices - 1), y + 1 + (k % 2) * (width - 2))
+                      for k in range(vertices)]
+            path = PathFactory.create(geom=LineString(*coords, srid=settings.SRID))
+            edges = path.aggregations.count()
+
+            def move_vertex(i):
+                # Move a middle vertex by a meter back and forth
+                moved = list(coords)
+                k = vertices // 2
+                moved[k] = (coords[k][0] + 1 - i % 2, coords[k][1])
+                path.geom = LineString(*moved, srid=settings.SRID)
+                path.save()
+
+            def recreate_edges(i):
+                cursor = connection.cursor()
+                cursor.execute("SELECT ft_troncons_couches_sig(%s)", [[path.pk]])
+
+            sync_duration, sync_writes = self.measure(move_vertex, edits)
+            full_duration, full_writes = self.measure(recreate_edges, edits)
+
+        self.stdout.write('Path of %s vertices with %s city edges\n' % (vertices, edges))
+        self.stdout.write('Rows written per edit (%s):\n' % ', '.join(TABLES))
+        self.stdout.write('Vertex moved: %s (%.3f s)\n' % (', '.join('%.0f' % w for w in sync_writes),
+                                                         sync_duration / edits))
+        self.stdout.write('All edges re-created: %s (%.3f s)\n' % (', '.join('%.0f' % w for w in full_writes),
+                                                                 full_duration / edits))
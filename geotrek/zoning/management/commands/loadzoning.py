@@ -0,0 +1,90 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import CommandError
+from django.db import models
+from django.contrib.gis.geos import MultiPolygon, Polygon
+
+from geotrek.common.utils.layers import LoadLayerCommand
+from geotrek.common.utils.postgresql import copy_objects
+from geotrek.zoning.helpers import ZoningHelper
+from geotrek.zoning.models import City, CityEdge, District, DistrictEdge, RestrictedArea, RestrictedAreaEdge
+
+
+# Land layers, with their edges model and field
+LAYERS = {
+    'city': (City, CityEdge, 'city'),
+    'district': (District, DistrictEdge, 'district'),
+    'restrictedarea': (RestrictedArea, RestrictedAreaEdge, 'restricted_area'),
+}
+
+
+class Command(LoadLayerCommand):
+    args = '<%s> <polygon_layer>' % '|'.join(sorted(LAYERS))
+    help = 'Load a layer with polygon geometries as cities, districts or restricted areas.\n'
+    help += 'Objects are copied by batches, and their edges with paths are computed all at once\n'
+    help += '(see ZoningHelper.import_session). The whole import is done in one transaction.\n'
+    help += 'Related objects (e.g. area_type) are obtained by name, and created if missing.\n'
+
+    option_list = LoadLayerCommand.option_list + (
+        make_option('--batch-size', type='int', dest='batch_size', default=1000,
+                    help='Number of features copied per batch (default: 1000)'),
+        make_option('--replace', action='store_true', dest='replace', default=False,
+                    help='Replace all existing objects of the layer (atomically)'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 2:
+            raise CommandError('Layer name and filename are required. See help')
+        layer_name, filename = args
+        if layer_name not in LAYERS:
+            raise CommandError('Unknown layer %s (expected one of %s)' % (layer_name, ', '.join(sorted(LAYERS))))
+        self.model, self.edge_model, self.edge_field = LAYERS[layer_name]
+        self.related = {}
+
+        layer, count = self.open_layer(filename, options)
+        self.load(layer, count, options.get('batch_size') or 1000, options.get('replace'))
+
+    def related_object(self, field, name):
+        """ Related object (e.g. restricted area type) by name, created if missing. """
+        key = (field.name, name)
+        if key not in self.related:
+            self.related[key], created = field.rel.to.objects.get_or_create(name=name)
+        return self.related[key]
+
+    def read_feature(self, feature):
+        geometry = self.read_geometry(feature)
+        if isinstance(geometry, Polygon):
+            geometry = MultiPolygon(geometry, srid=geometry.srid)
+        if not isinstance(geometry, MultiPolygon):
+            raise ValueError('Feature %s is not a polygon' % feature.GetFID())
+        if not geometry.valid:
+            raise ValueError('Feature %s is not a valid polygon' % feature.GetFID())
+        values = self.read_values(feature)
+        for model_field, value in values.items():
+            field = self.model._meta.get_field(model_field)
+            if isinstance(field, models.ForeignKey) and value is not None:
+                values[model_field] = self.related_object(field, value)
+        return self.model(geom=geometry, **values)
+
+    def load(self, layer, count, batch_size, replace):
+        start = time.time()
+        with ZoningHelper.import_session():
+            if replace:
+                ZoningHelper.delete_all(self.edge_model, self.edge_field)
+            copied = 0
+            for i in range(0, count, batch_size):
+                try:
+                    objects = self.read_batch(layer, min(batch_size, count - i))
+                    copy_objects(objects)
+                except Exception as e:
+                    raise CommandError('Import failed at features %s-%s (%s)'
+                                       % (i, i + batch_size - 1, e))
+                copied += len(objects)
+                elapsed = time.time() - start
+                self.stdout.write('%s/%s objects copied (%.1f objects/s)'
+                                  % (copied, count, copied / max(elapsed, 0.001)))
+            copy_duration = time.time() - start
+        self.stdout.write('Edges with paths computed (%.1f s)' % (time.time() - start - copy_duration))
+        self.stdout.write('%s %s imported (%.1f s)' % (copied, self.model._meta.verbose_name_plural,
+                                                      time.time() - start))
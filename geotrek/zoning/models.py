@@ -8,10 +8,14 @@ from operator import attrgetter
 
 from django.contrib.gis.db import models
 from django.conf import settings
+from django.db import connection
+from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 
 from geotrek.common.utils import uniquify
 from geotrek.core.models import Topology, Path
+from geotrek.core.helpers import PathHelper, TopologyHelper
+from geotrek.core.signals import paths_imported, check_imported_paths
 from geotrek.maintenance.models import Intervention, Project
 
 
@@ -81,10 +85,16 @@ class RestrictedAreaEdge(Topology):
         return qs.select_related('restricted_area')\
                  .select_related('restricted_area__area_type')
 
-Path.add_property('area_edges', RestrictedAreaEdge.path_area_edges)
-Path.add_property('areas', lambda self: uniquify(map(attrgetter('restricted_area'), self.area_edges)))
-Topology.add_property('area_edges', RestrictedAreaEdge.topology_area_edges)
-Topology.add_property('areas', lambda self: uniquify(map(attrgetter('restricted_area'), self.area_edges)))
+Path.add_property('area_edges', RestrictedAreaEdge.path_area_edges,
+                  prefetch=PathHelper.related_prefetcher(RestrictedAreaEdge.objects.select_related('restricted_area',
+                                                                                                   'restricted_area__area_type')))
+Path.add_property('areas', lambda self: uniquify(map(attrgetter('restricted_area'), self.area_edges)),
+                  prefetch='area_edges')
+Topology.add_property('area_edges', RestrictedAreaEdge.topology_area_edges,
+                      prefetch=TopologyHelper.overlapping_prefetcher(RestrictedAreaEdge, 'restricted_area',
+                                                                     'restricted_area__area_type'))
+Topology.add_property('areas', lambda self: uniquify(map(attrgetter('restricted_area'), self.area_edges)),
+                      prefetch='area_edges')
 Intervention.add_property('area_edges', lambda self: self.topology.area_edges if self.topology else [])
 Intervention.add_property('areas', lambda self: self.topology.areas if self.topology else [])
 Project.add_property('area_edges', lambda self: self.edges_by_attr('area_edges'))
@@ -138,10 +148,14 @@ class CityEdge(Topology):
             qs = cls.objects.filter(geom__intersects=topology.geom)
         return qs.select_related('city')
 
-Path.add_property('city_edges', CityEdge.path_city_edges)
-Path.add_property('cities', lambda self: uniquify(map(attrgetter('city'), self.city_edges)))
-Topology.add_property('city_edges', CityEdge.topology_city_edges)
-Topology.add_property('cities', lambda self: uniquify(map(attrgetter('city'), self.city_edges)))
+Path.add_property('city_edges', CityEdge.path_city_edges,
+                  prefetch=PathHelper.related_prefetcher(CityEdge.objects.select_related('city')))
+Path.add_property('cities', lambda self: uniquify(map(attrgetter('city'), self.city_edges)),
+                  prefetch='city_edges')
+Topology.add_property('city_edges', CityEdge.topology_city_edges,
+                      prefetch=TopologyHelper.overlapping_prefetcher(CityEdge, 'city'))
+Topology.add_property('cities', lambda self: uniquify(map(attrgetter('city'), self.city_edges)),
+                      prefetch='city_edges')
 Intervention.add_property('city_edges', lambda self: self.topology.city_edges if self.topology else [])
 Intervention.add_property('cities', lambda self: self.topology.cities if self.topology else [])
 Project.add_property('city_edges', lambda self: self.edges_by_attr('city_edges'))
@@ -193,11 +207,50 @@ class DistrictEdge(Topology):
             qs = cls.objects.filter(geom__intersects=topology.geom)
         return qs.select_related('district')
 
-Path.add_property('district_edges', DistrictEdge.path_district_edges)
-Path.add_property('districts', lambda self: uniquify(map(attrgetter('district'), self.district_edges)))
-Topology.add_property('district_edges', DistrictEdge.topology_district_edges)
-Topology.add_property('districts', lambda self: uniquify(map(attrgetter('district'), self.district_edges)))
+Path.add_property('district_edges', DistrictEdge.path_district_edges,
+                  prefetch=PathHelper.related_prefetcher(DistrictEdge.objects.select_related('district')))
+Path.add_property('districts', lambda self: uniquify(map(attrgetter('district'), self.district_edges)),
+                  prefetch='district_edges')
+Topology.add_property('district_edges', DistrictEdge.topology_district_edges,
+                      prefetch=TopologyHelper.overlapping_prefetcher(DistrictEdge, 'district'))
+Topology.add_property('districts', lambda self: uniquify(map(attrgetter('district'), self.district_edges)),
+                      prefetch='district_edges')
 Intervention.add_property('district_edges', lambda self: self.topology.district_edges if self.topology else [])
 Intervention.add_property('districts', lambda self: self.topology.districts if self.topology else [])
 Project.add_property('district_edges', lambda self: self.edges_by_attr('district_edges'))
 Project.add_property('districts', lambda self: uniquify(map(attrgetter('district'), self.district_edges)))
+
+
+@receiver(paths_imported, dispatch_uid="zoning_paths_imported")
+def intersect_imported_paths(sender, pks, **kwargs):
+    """ Create land layers edges of imported paths at once, in place of
+    ``lien_auto_troncon_couches_sig_iu()`` trigger.
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT ft_troncons_couches_sig(%s)", [list(pks)])
+
+
+@receiver(check_imported_paths, dispatch_uid="zoning_check_imported_paths")
+def check_imported_paths_edges(sender, pks, **kwargs):
+    """ Imported paths whose number of land layers edges differs from their
+    number of intersections with land layers.
+    """
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT t.id FROM l_t_troncon t
+        WHERE t.id = ANY(%s)
+          AND (SELECT COUNT(*) FROM e_r_evenement_troncon et
+               WHERE et.troncon = t.id
+                 AND (EXISTS (SELECT 1 FROM f_t_commune WHERE evenement = et.evenement) OR
+                      EXISTS (SELECT 1 FROM f_t_secteur WHERE evenement = et.evenement) OR
+                      EXISTS (SELECT 1 FROM f_t_zonage WHERE evenement = et.evenement)))
+           != (SELECT COUNT(*) FROM (
+                   SELECT ST_Dump(ST_Multi(ST_Intersection(geom, t.geom))) FROM l_commune
+                   WHERE ST_Intersects(geom, t.geom)
+                   UNION ALL
+                   SELECT ST_Dump(ST_Multi(ST_Intersection(geom, t.geom))) FROM l_secteur
+                   WHERE ST_Intersects(geom, t.geom)
+                   UNION ALL
+                   SELECT ST_Dump(ST_Multi(ST_Intersection(geom, t.geom))) FROM l_zonage_reglementaire
+                   WHERE ST_Intersects(geom, t.geom)) AS parts)""", [list(pks)])
+    return [pk for pk, in cursor.fetchall()]
@@ -28,6 +28,24 @@ ALTER TABLE l_secteur ADD CONSTRAINT l_secteur_geom_isvalid CHECK (ST_IsValid(ge
 ALTER TABLE l_zonage_reglementaire DROP CONSTRAINT IF EXISTS l_zonage_reglementaire_geom_isvalid;
 ALTER TABLE l_zonage_reglementaire ADD CONSTRAINT l_zonage_reglementaire_geom_isvalid CHECK (ST_IsValid(geom));
 
+-------------------------------------------------------------------------------
+-- Defer edges computations during bulk imports of Commune/Zonage/Secteur
+-------------------------------------------------------------------------------
+
+CREATE OR REPLACE FUNCTION couches_sig_import_deferred() RETURNS boolean AS $$
+BEGIN
+    -- Edges of land objects are computed later, all at once, while the session
+    -- temporary table exists (see ZoningHelper.import_session) : created or
+    -- modified land objects are recorded in it.
+    -- Delete triggers are not deferred : edges are removed by set-based statements
+    -- (edges, aggregations and evenements at once), after which they find nothing left.
+    RETURN EXISTS (SELECT 1 FROM pg_class
+                   WHERE relname = 'tmp_couches_sig_importees' AND relpersistence = 't'
+                     AND pg_table_is_visible(oid));
+END;
+$$ LANGUAGE plpgsql;
+
+
 -------------------------------------------------------------------------------
 -- Delete Commune/Zonage/Secteur when evenements are deleted
 -------------------------------------------------------------------------------
@@ -98,46 +116,70 @@ FOR EACH ROW EXECUTE PROCEDURE nettoyage_auto_couches_sig_d();
 
 DROP TRIGGER IF EXISTS l_t_troncon_couches_sig_iu_tgr ON l_t_troncon;
 
-CREATE OR REPLACE FUNCTION lien_auto_troncon_couches_sig_iu() RETURNS trigger AS $$
+CREATE OR REPLACE FUNCTION ft_troncon_couches_sig_sync(tid integer, tgeom geometry, layer_name varchar, id_name varchar,
+                                                       table_name varchar, fk_name varchar, kind_name varchar) RETURNS integer AS $$
 DECLARE
     rec record;
-    tab varchar;
     eid integer;
+    changed integer;
 BEGIN
-    -- Remove obsolete evenement
-    IF TG_OP = 'UPDATE' THEN
-        -- Related evenement/zonage/secteur/commune will be cleared by another trigger
-        DELETE FROM e_r_evenement_troncon et USING f_t_zonage z WHERE et.troncon = OLD.id AND et.evenement = z.evenement;
-        DELETE FROM e_r_evenement_troncon et USING f_t_secteur s WHERE et.troncon = OLD.id AND et.evenement = s.evenement;
-        DELETE FROM e_r_evenement_troncon et USING f_t_commune c WHERE et.troncon = OLD.id AND et.evenement = c.evenement;
-    END IF;
-
-    -- Add new evenement
-    -- Note: Column names differ between commune, secteur and zonage, we can not use an elegant loop.
-
-    -- Commune
-    FOR rec IN EXECUTE 'SELECT id, ST_Line_Locate_Point($1, COALESCE(ST_StartPoint(geom), geom)) as pk_a, ST_Line_Locate_Point($1, COALESCE(ST_EndPoint(geom), geom)) as pk_b FROM (SELECT insee AS id, (ST_Dump(ST_Multi(ST_Intersection(geom, $1)))).geom AS geom FROM l_commune WHERE ST_Intersects(geom, $1)) AS sub' USING NEW.geom
+    -- Intersections of the path with a land layer are compared with its existing
+    -- edges: they are paired by land object, in order of position along the path.
+    -- Only edges which changed are written.
+
+    -- Edges also on other paths (copied there when splitting) are replaced.
+    -- Related evenement/zonage/secteur/commune will be cleared by another trigger
+    EXECUTE 'DELETE FROM e_r_evenement_troncon WHERE evenement IN ('
+            ' SELECT et.evenement FROM e_r_evenement_troncon et, '|| quote_ident(table_name) ||' z'
+            ' WHERE et.troncon = $1 AND et.evenement = z.evenement'
+            '   AND EXISTS (SELECT 1 FROM e_r_evenement_troncon o'
+            '               WHERE o.evenement = et.evenement AND o.troncon != $1))' USING tid;
+    GET DIAGNOSTICS changed = ROW_COUNT;
+
+    FOR rec IN EXECUTE 'WITH new AS (SELECT id, least(pk_a, pk_b) AS pk_debut, greatest(pk_a, pk_b) AS pk_fin,'
+                       '                    row_number() OVER (PARTITION BY id ORDER BY least(pk_a, pk_b), greatest(pk_a, pk_b)) AS n'
+                       '             FROM (SELECT id, ST_Line_Locate_Point($2, COALESCE(ST_StartPoint(geom), geom)) AS pk_a,'
+                       '                          ST_Line_Locate_Point($2, COALESCE(ST_EndPoint(geom), geom)) AS pk_b'
+                       '                   FROM (SELECT '|| quote_ident(id_name) ||' AS id, (ST_Dump(ST_Multi(ST_Intersection(geom, $2)))).geom AS geom'
+                       '                         FROM '|| quote_ident(layer_name) ||' WHERE ST_Intersects(geom, $2)) AS parts) AS located),'
+                       '     old AS (SELECT z.'|| quote_ident(fk_name) ||' AS id, et.id AS aid, et.pk_debut, et.pk_fin,'
+                       '                    row_number() OVER (PARTITION BY z.'|| quote_ident(fk_name) ||' ORDER BY et.pk_debut, et.pk_fin, et.id) AS n'
+                       '             FROM e_r_evenement_troncon et, '|| quote_ident(table_name) ||' z'
+                       '             WHERE et.troncon = $1 AND et.evenement = z.evenement)'
+                       ' SELECT COALESCE(new.id, old.id) AS id, new.pk_debut, new.pk_fin,'
+                       '        old.aid, old.pk_debut AS old_debut, old.pk_fin AS old_fin'
+                       ' FROM new FULL OUTER JOIN old ON (new.id = old.id AND new.n = old.n)' USING tid, tgeom
     LOOP
-        INSERT INTO e_t_evenement (date_insert, date_update, kind, decallage, longueur, geom, supprime) VALUES (now(), now(), 'CITYEDGE', 0, 0, NEW.geom, FALSE) RETURNING id INTO eid;
-        INSERT INTO e_r_evenement_troncon (troncon, evenement, pk_debut, pk_fin) VALUES (NEW.id, eid, least(rec.pk_a, rec.pk_b), greatest(rec.pk_a, rec.pk_b));
-        INSERT INTO f_t_commune (evenement, commune) VALUES (eid, rec.id);
+        IF rec.aid IS NULL THEN
+            -- Add new evenement
+            INSERT INTO e_t_evenement (date_insert, date_update, kind, decallage, longueur, geom, supprime) VALUES (now(), now(), kind_name, 0, 0, tgeom, FALSE) RETURNING id INTO eid;
+            INSERT INTO e_r_evenement_troncon (troncon, evenement, pk_debut, pk_fin) VALUES (tid, eid, rec.pk_debut, rec.pk_fin);
+            EXECUTE 'INSERT INTO '|| quote_ident(table_name) ||' (evenement, '|| quote_ident(fk_name) ||') VALUES ($1, $2)' USING eid, rec.id;
+        ELSIF rec.pk_debut IS NULL THEN
+            -- Remove obsolete evenement
+            -- Related evenement/zonage/secteur/commune will be cleared by another trigger
+            DELETE FROM e_r_evenement_troncon WHERE id = rec.aid;
+        ELSIF rec.pk_debut != rec.old_debut OR rec.pk_fin != rec.old_fin THEN
+            UPDATE e_r_evenement_troncon SET pk_debut = rec.pk_debut, pk_fin = rec.pk_fin WHERE id = rec.aid;
+        ELSE
+            CONTINUE;
+        END IF;
+        changed := changed + 1;
     END LOOP;
+    RETURN changed;
+END;
+$$ LANGUAGE plpgsql;
 
-    -- Secteur
-    FOR rec IN EXECUTE 'SELECT id, ST_Line_Locate_Point($1,COALESCE(ST_StartPoint(geom), geom)) as pk_a, ST_Line_Locate_Point($1, COALESCE(ST_EndPoint(geom), geom)) as pk_b FROM (SELECT id, (ST_Dump(ST_Multi(ST_Intersection(geom, $1)))).geom AS geom FROM l_secteur WHERE ST_Intersects(geom, $1)) AS sub' USING NEW.geom
-    LOOP
-        INSERT INTO e_t_evenement (date_insert, date_update, kind, decallage, longueur, geom, supprime) VALUES (now(), now(), 'DISTRICTEDGE', 0, 0, NEW.geom, FALSE) RETURNING id INTO eid;
-        INSERT INTO e_r_evenement_troncon (troncon, evenement, pk_debut, pk_fin) VALUES (NEW.id, eid, least(rec.pk_a, rec.pk_b), greatest(rec.pk_a, rec.pk_b));
-        INSERT INTO f_t_secteur (evenement, secteur) VALUES (eid, rec.id);
-    END LOOP;
+CREATE OR REPLACE FUNCTION lien_auto_troncon_couches_sig_iu() RETURNS trigger AS $$
+BEGIN
+    IF troncon_import_deferred(NEW.id) THEN
+        RETURN NULL;
+    END IF;
 
-    -- Zonage
-    FOR rec IN EXECUTE 'SELECT id, ST_Line_Locate_Point($1, COALESCE(ST_StartPoint(geom), geom)) as pk_a, ST_Line_Locate_Point($1, COALESCE(ST_EndPoint(geom), geom)) as pk_b FROM (SELECT id, (ST_Dump(ST_Multi(ST_Intersection(geom, $1)))).geom AS geom FROM l_zonage_reglementaire WHERE ST_Intersects(geom, $1)) AS sub' USING NEW.geom
-    LOOP
-        INSERT INTO e_t_evenement (date_insert, date_update, kind, decallage, longueur, geom, supprime) VALUES (now(), now(), 'RESTRICTEDAREAEDGE', 0, 0, NEW.geom, FALSE) RETURNING id INTO eid;
-        INSERT INTO e_r_evenement_troncon (troncon, evenement, pk_debut, pk_fin) VALUES (NEW.id, eid, least(rec.pk_a, rec.pk_b), greatest(rec.pk_a, rec.pk_b));
-        INSERT INTO f_t_zonage (evenement, zone) VALUES (eid, rec.id);
-    END LOOP;
+    -- Sync edges with each land layer (unchanged ones are kept as is)
+    PERFORM ft_troncon_couches_sig_sync(NEW.id, NEW.geom, 'l_commune', 'insee', 'f_t_commune', 'commune', 'CITYEDGE');
+    PERFORM ft_troncon_couches_sig_sync(NEW.id, NEW.geom, 'l_secteur', 'id', 'f_t_secteur', 'secteur', 'DISTRICTEDGE');
+    PERFORM ft_troncon_couches_sig_sync(NEW.id, NEW.geom, 'l_zonage_reglementaire', 'id', 'f_t_zonage', 'zone', 'RESTRICTEDAREAEDGE');
 
     RETURN NULL;
 END;
@@ -149,6 +191,66 @@ FOR EACH ROW EXECUTE PROCEDURE lien_auto_troncon_couches_sig_iu();
 
 
 
+-------------------------------------------------------------------------------
+-- Sync a set of Troncons at once (bulk imports)
+-------------------------------------------------------------------------------
+
+DROP FUNCTION IF EXISTS ft_troncons_couches_sig_ajout(integer[], varchar, varchar, varchar, varchar, varchar);
+
+CREATE OR REPLACE FUNCTION ft_couches_sig_ajout(filter text, ids anyarray, layer_name varchar, id_name varchar,
+                                                table_name varchar, fk_name varchar, kind_name varchar) RETURNS integer AS $$
+DECLARE
+    created integer;
+BEGIN
+    -- Edges of paths (t) and land objects (l) matching filter, with ids as $1.
+    -- Evenement ids are drawn beforehand, to insert evenements, aggregations
+    -- and association rows in a single statement.
+    EXECUTE 'WITH edges AS (SELECT t.id AS troncon, t.geom AS tgeom, l.'|| quote_ident(id_name) ||' AS id,'
+            '                      (ST_Dump(ST_Multi(ST_Intersection(l.geom, t.geom)))).geom AS egeom'
+            '                 FROM l_t_troncon t, '|| quote_ident(layer_name) ||' l'
+            '                WHERE '|| filter ||' AND ST_Intersects(l.geom, t.geom)),'
+            '     located AS (SELECT nextval(pg_get_serial_sequence(''e_t_evenement'', ''id'')) AS eid,'
+            '                        troncon, tgeom, id,'
+            '                        ST_Line_Locate_Point(tgeom, COALESCE(ST_StartPoint(egeom), egeom)) AS pk_a,'
+            '                        ST_Line_Locate_Point(tgeom, COALESCE(ST_EndPoint(egeom), egeom)) AS pk_b'
+            '                   FROM edges),'
+            '     evenements AS (INSERT INTO e_t_evenement (id, date_insert, date_update, kind, decallage, longueur, geom, supprime)'
+            '                    SELECT eid, now(), now(), '|| quote_literal(kind_name) ||', 0, 0, tgeom, FALSE FROM located),'
+            '     aggregations AS (INSERT INTO e_r_evenement_troncon (troncon, evenement, pk_debut, pk_fin)'
+            '                      SELECT troncon, eid, least(pk_a, pk_b), greatest(pk_a, pk_b) FROM located)'
+            ' INSERT INTO '|| quote_ident(table_name) ||' (evenement, '|| quote_ident(fk_name) ||') SELECT eid, id FROM located'
+            USING ids;
+    GET DIAGNOSTICS created = ROW_COUNT;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION ft_troncons_couches_sig(troncons integer[]) RETURNS integer AS $$
+DECLARE
+    created integer;
+BEGIN
+    -- Same result as lien_auto_troncon_couches_sig_iu() for a set of paths,
+    -- with a few statements per land layer instead of a few per path and land object.
+
+    -- Remove obsolete evenement (even if also on other paths, e.g. copied by split)
+    -- Related evenement/zonage/secteur/commune will be cleared by another trigger
+    DELETE FROM e_r_evenement_troncon WHERE evenement IN (
+        SELECT et.evenement FROM e_r_evenement_troncon et, f_t_zonage z WHERE et.troncon = ANY(troncons) AND et.evenement = z.evenement
+        UNION
+        SELECT et.evenement FROM e_r_evenement_troncon et, f_t_secteur s WHERE et.troncon = ANY(troncons) AND et.evenement = s.evenement
+        UNION
+        SELECT et.evenement FROM e_r_evenement_troncon et, f_t_commune c WHERE et.troncon = ANY(troncons) AND et.evenement = c.evenement);
+
+    -- Add new evenement
+    created := ft_couches_sig_ajout('t.id = ANY($1)', troncons, 'l_commune', 'insee', 'f_t_commune', 'commune', 'CITYEDGE');
+    created := created + ft_couches_sig_ajout('t.id = ANY($1)', troncons, 'l_secteur', 'id', 'f_t_secteur', 'secteur', 'DISTRICTEDGE');
+    created := created + ft_couches_sig_ajout('t.id = ANY($1)', troncons, 'l_zonage_reglementaire', 'id', 'f_t_zonage', 'zone', 'RESTRICTEDAREAEDGE');
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+
+
 -------------------------------------------------------------------------------
 -- Sync when Commune/Zonage/Secteur modified
 -------------------------------------------------------------------------------
@@ -175,6 +277,13 @@ BEGIN
             SELECT NEW.id AS id INTO obj;
     END;
 
+    IF couches_sig_import_deferred() THEN
+        INSERT INTO tmp_couches_sig_importees (couche, objet)
+            SELECT table_name, obj.id WHERE NOT EXISTS (SELECT 1 FROM tmp_couches_sig_importees
+                                                        WHERE couche = table_name AND objet = obj.id::varchar);
+        RETURN NULL;
+    END IF;
+
     -- Remove obsolete evenement
     IF TG_OP = 'UPDATE' THEN
         EXECUTE 'DELETE FROM '|| quote_ident(table_name) ||' WHERE '|| quote_ident(fk_name) ||' = $1' USING obj.id;
@@ -192,6 +301,39 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+CREATE OR REPLACE FUNCTION ft_couches_sig_importees() RETURNS integer AS $$
+DECLARE
+    layer record;
+    objets varchar[];
+    created integer;
+BEGIN
+    -- Same result as lien_auto_couches_sig_troncon_iu() for the land objects
+    -- recorded during an import session, with a few statements per land layer.
+    created := 0;
+    FOR layer IN SELECT * FROM (VALUES ('l_commune', 'insee', 'f_t_commune', 'commune', 'CITYEDGE'),
+                                       ('l_secteur', 'id', 'f_t_secteur', 'secteur', 'DISTRICTEDGE'),
+                                       ('l_zonage_reglementaire', 'id', 'f_t_zonage', 'zone', 'RESTRICTEDAREAEDGE'))
+                               AS l (layer_name, id_name, table_name, fk_name, kind_name)
+    LOOP
+        SELECT array_agg(objet) INTO objets FROM tmp_couches_sig_importees WHERE couche = layer.table_name;
+        CONTINUE WHEN objets IS NULL;
+
+        -- Remove obsolete evenement (of modified objects)
+        EXECUTE 'WITH edges AS (DELETE FROM '|| quote_ident(layer.table_name) ||
+                '               WHERE '|| quote_ident(layer.fk_name) ||'::varchar = ANY($1) RETURNING evenement),'
+                '     aggregations AS (DELETE FROM e_r_evenement_troncon WHERE evenement IN (SELECT evenement FROM edges))'
+                ' DELETE FROM e_t_evenement WHERE id IN (SELECT evenement FROM edges)' USING objets;
+
+        -- Add new evenement
+        created := created + ft_couches_sig_ajout('l.'|| quote_ident(layer.id_name) ||'::varchar = ANY($1)', objets,
+                                                  layer.layer_name, layer.id_name, layer.table_name,
+                                                  layer.fk_name, layer.kind_name);
+    END LOOP;
+    DELETE FROM tmp_couches_sig_importees;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
 CREATE TRIGGER commune_troncons_iu_tgr
 AFTER INSERT OR UPDATE OF geom ON l_commune
 FOR EACH ROW EXECUTE PROCEDURE lien_auto_couches_sig_troncon_iu('f_t_commune', 'insee', 'commune', 'CITYEDGE');
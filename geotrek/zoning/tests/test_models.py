@@ -4,9 +4,12 @@ from django.contrib.gis.geos import LineString, Polygon, MultiPolygon
 
 from geotrek.core.models import Topology
 from geotrek.core.factories import PathFactory
+from geotrek.core.helpers import PathHelper
 from geotrek.land.tests.test_views import EdgeHelperTest
-from geotrek.zoning.models import City
-from geotrek.zoning.factories import (DistrictEdgeFactory, CityEdgeFactory,
+from geotrek.common.utils.postgresql import copy_objects
+from geotrek.zoning.helpers import ZoningHelper
+from geotrek.zoning.models import City, CityEdge, RestrictedArea
+from geotrek.zoning.factories import (DistrictEdgeFactory, CityEdgeFactory, RestrictedAreaTypeFactory,
                                     RestrictedAreaFactory, RestrictedAreaEdgeFactory)
 
 
@@ -135,20 +138,15 @@ class LandLayersUpdateTest(TestCase):
         p.save()
         self.assertEquals(p.aggregations.count(), 2)
         self.assertEquals(p.topology_set.count(), 2)
-        # Topology are re-created at DB-level after any update
-        self.assertRaises(Topology.DoesNotExist,
-                          Topology.objects.get, pk=t_c.pk)
-        self.assertRaises(Topology.DoesNotExist,
-                          Topology.objects.get, pk=t_ra1a.pk)
+        # Topology are kept at DB-level if still intersecting, and removed otherwise
+        self.assertEquals(c.cityedge_set.get().topo_object, t_c)
+        self.assertEquals(ra1.restrictedareaedge_set.get().topo_object, t_ra1a)
         self.assertRaises(Topology.DoesNotExist,
                           Topology.objects.get, pk=t_ra1b.pk)
         self.assertRaises(Topology.DoesNotExist,
                           Topology.objects.get, pk=t_ra2.pk)
         self.assertEquals(ra1.restrictedareaedge_set.count(), 1)
-        # a new association exists for C
-        t_c = c.cityedge_set.get().topo_object
-        self.assertEquals(Topology.objects.filter(pk=t_c.pk).count(), 1)
-        # a new association exists for RA1
+        # association of RA1 is updated
         t_ra1 = ra1.restrictedareaedge_set.get().topo_object
         self.assertEquals(Topology.objects.filter(pk=t_ra1.pk).count(), 1)
         pa1 = ra1.restrictedareaedge_set.get().aggregations.get()
@@ -166,3 +164,136 @@ class LandLayersUpdateTest(TestCase):
         self.assertEquals(Topology.objects.filter(pk=t_ra1.pk).count(), 0)
         self.assertEquals(ra2.restrictedareaedge_set.count(), 0)
         self.assertEquals(Topology.objects.filter(pk=t_ra2.pk).count(), 0)
+
+
+class IncrementalSyncTest(TestCase):
+
+    def setUp(self):
+        self.city = City.objects.create(code='005177', name='Trifouillis-les-oies',
+                                        geom=MultiPolygon(Polygon(((0,0), (2,0), (2,4), (0,4), (0,0)),
+                                                                  srid=settings.SRID)))
+        self.path = PathFactory.create(geom=LineString((1,1), (3,1), (6,1)))
+        self.edge = self.city.cityedge_set.get()
+
+    def test_unchanged_edges_are_kept(self):
+        aggregation = self.edge.aggregations.get()
+        self.path.geom = LineString((1,1), (3,1), (6,1))
+        self.path.save()
+        self.assertEqual(self.city.cityedge_set.get(), self.edge)
+        self.assertEqual(self.edge.aggregations.get().pk, aggregation.pk)
+
+    def test_moved_edges_are_updated(self):
+        self.path.geom = LineString((1,1), (3,1), (5,1))
+        self.path.save()
+        self.assertEqual(self.city.cityedge_set.get(), self.edge)
+        aggregation = self.edge.aggregations.get()
+        self.assertAlmostEqual(aggregation.start_position, 0.0)
+        self.assertAlmostEqual(aggregation.end_position, 0.25)
+
+    def test_new_and_obsolete_edges(self):
+        self.path.geom = LineString((3,1), (6,1), (6,3), (1,3))
+        self.path.save()
+        self.assertEqual(self.city.cityedge_set.get(), self.edge)
+        self.path.geom = LineString((1,1), (1,3), (3,3), (3,1), (1.5,1))
+        self.path.save()
+        edges = self.city.cityedge_set.all()
+        self.assertEqual(len(edges), 2)
+        self.assertIn(self.edge, edges)
+        self.path.geom = LineString((3,1), (6,1))
+        self.path.save()
+        self.assertEqual(self.city.cityedge_set.count(), 0)
+
+
+class ImportSessionTest(TestCase):
+
+    def test_land_layers_edges_of_imported_paths(self):
+        City.objects.create(code='005177', name='Trifouillis-les-oies',
+                            geom=MultiPolygon(Polygon(((0,0), (2,0), (2,4), (0,4), (0,0)),
+                                                      srid=settings.SRID)))
+        City.objects.create(code='005179', name='Trifouillis-les-poules',
+                            geom=MultiPolygon(Polygon(((2,0), (5,0), (5,4), (2,4), (2,0)),
+                                                      srid=settings.SRID)))
+        p1 = PathFactory.create(geom=LineString((1,1), (4,1)))
+        expected = sorted((e.city.code, e.geom.coords) for e in p1.city_edges)
+        p1.delete()
+
+        with PathHelper.import_session() as imported:
+            p2 = PathFactory.create(geom=LineString((1,1), (4,1)))
+            self.assertEqual(p2.aggregations.count(), 0)
+        self.assertEqual(p2.aggregations.count(), 2)
+        self.assertEqual(sorted((e.city.code, e.geom.coords) for e in p2.city_edges), expected)
+        self.assertEqual(PathHelper.check_imported(imported), [])
+
+    def test_edges_of_split_paths_are_updated(self):
+        City.objects.create(code='005177', name='Trifouillis-les-oies',
+                            geom=MultiPolygon(Polygon(((0,0), (2,0), (2,4), (0,4), (0,0)),
+                                                      srid=settings.SRID)))
+        p1 = PathFactory.create(geom=LineString((0,1), (4,1)))
+        with PathHelper.import_session() as imported:
+            PathFactory.create(geom=LineString((1.5,-1), (1.5,3)))
+        p1.reload()
+        self.assertEqual(p1.aggregations.count(), 1)
+        self.assertEqual(len(imported), 4)
+        self.assertEqual(PathHelper.check_imported(imported), [])
+
+
+class LandLayerImportSessionTest(TestCase):
+
+    def setUp(self):
+        self.p1 = PathFactory.create(geom=LineString((1,1), (4,1)))
+        self.p2 = PathFactory.create(geom=LineString((1,3), (4,3)))
+        self.polygons = [MultiPolygon(Polygon(((0,0), (2,0), (2,4), (0,4), (0,0)), srid=settings.SRID)),
+                         MultiPolygon(Polygon(((2,0), (5,0), (5,2), (2,2), (2,0)), srid=settings.SRID))]
+
+    def edges(self):
+        return sorted((e.city.code, e.geom.coords) for e in CityEdge.objects.all())
+
+    def test_edges_of_imported_cities(self):
+        for i, geom in enumerate(self.polygons):
+            City.objects.create(code='00517%s' % i, name='City %s' % i, geom=geom)
+        expected = self.edges()
+        self.assertEqual(len(expected), 3)
+        City.objects.all().delete()
+        self.assertEqual(CityEdge.objects.count(), 0)
+
+        with ZoningHelper.import_session():
+            copy_objects([City(code='00517%s' % i, name='City %s' % i, geom=geom)
+                          for i, geom in enumerate(self.polygons)])
+            self.assertEqual(CityEdge.objects.count(), 0)
+        self.assertEqual(self.edges(), expected)
+        self.assertEqual(self.p1.aggregations.count(), 2)
+
+    def test_edges_of_modified_areas(self):
+        area_type = RestrictedAreaTypeFactory.create()
+        area = RestrictedArea.objects.create(name='Area', area_type=area_type, geom=self.polygons[0])
+        with ZoningHelper.import_session():
+            area.geom = self.polygons[1]
+            area.save()
+        edge = area.restrictedareaedge_set.get()
+        self.assertEqual(edge.aggregations.get().path, self.p1)
+
+    def test_replace(self):
+        for i, geom in enumerate(self.polygons):
+            City.objects.create(code='00517%s' % i, name='City %s' % i, geom=geom)
+        edges = list(CityEdge.objects.values_list('pk', flat=True))
+        with ZoningHelper.import_session():
+            ZoningHelper.delete_all(CityEdge, 'city')
+            City.objects.create(code='005179', name='City', geom=self.polygons[1])
+        self.assertEqual(City.objects.count(), 1)
+        self.assertEqual(Topology.objects.filter(pk__in=edges).count(), 0)
+        self.assertEqual([e.city.code for e in CityEdge.objects.all()], ['005179'])
+        self.assertEqual(self.p2.aggregations.count(), 0)
+
+    def test_paths_modified_within_session(self):
+        City.objects.create(code='005170', name='City', geom=self.polygons[0])
+        evenements = Topology.objects.count()
+        with ZoningHelper.import_session():
+            with ZoningHelper.import_session():
+                City.objects.create(code='005171', name='Other city', geom=self.polygons[1])
+            self.p1.geom = LineString((1,1), (3,1))
+            self.p1.save()
+            self.p2.delete()
+        # p1 crosses both cities, p2 edge was removed: no orphan evenement left
+        self.assertEqual(sorted(e.city.code for e in CityEdge.objects.all()), ['005170', '005171'])
+        self.assertEqual(Topology.objects.count(), evenements)
+        self.assertEqual(Topology.objects.filter(aggregations__isnull=True).count(), 0)